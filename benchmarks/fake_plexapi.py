@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+import plex.plex_client as plex_client_module
+
+
+class FakeMyPlexAccount:
+    """
+    Stand-in for plexapi's MyPlexAccount, whose plex.tv endpoints cannot be redirected.
+
+    It implements the methods PlexClient uses with requests to the Discover stub, through the client's session,
+    so these calls are rate limited, delayed and counted like the real ones.
+    """
+
+    def __init__(self, username=None, password=None, token=None, session=None, **kwargs):
+        self.username = username
+        self.token = token
+        self.session = session
+
+    def _get(self, path, **params):
+        response = self.session.get(f"{plex_client_module.PLEX_DISCOVER_URL}{path}", params=params)
+        response.raise_for_status()
+        return response.json().get("MediaContainer", {})
+
+    def _media(self, metadata):
+        return SimpleNamespace(**metadata)
+
+    def watchlist(self, **kwargs):
+        return [self._media(metadata) for metadata in self._get("/library/sections/watchlist/all").get("Metadata", [])]
+
+    def userState(self, item):
+        user_state = (self._get(f"{item.key}/userState").get("UserState") or [{}])[0]
+        return SimpleNamespace(watchlistedAt=user_state.get("watchlistedAt"))
+
+    def searchDiscover(self, query, limit=30, libtype=None, **kwargs):
+        results = self._get("/library/search", query=query, libtype=libtype or "").get("Metadata", [])
+        return [self._media(metadata) for metadata in results[:limit]]
+
+    def addToWatchlist(self, items):
+        self.session.put(f"{plex_client_module.PLEX_DISCOVER_URL}/actions/addToWatchlist", params={"ratingKey": items.ratingKey})
+
+    def removeFromWatchlist(self, items):
+        self.session.put(f"{plex_client_module.PLEX_DISCOVER_URL}/actions/removeFromWatchlist", params={"ratingKey": items.ratingKey})
+
+
+def install():
+    """Makes PlexClient build FakeMyPlexAccount instead of MyPlexAccount."""
+    import plexapi.myplex
+    plexapi.myplex.MyPlexAccount = FakeMyPlexAccount
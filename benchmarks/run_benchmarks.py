@@ -0,0 +1,287 @@
+"""
+Offline benchmarks of the sync against local stand-ins of Plex and SensCritique.
+
+Usage (from the repository root):
+    python -m benchmarks.run_benchmarks --sizes 100,1000,10000 --latency 0.01 --error-rate 0.01
+
+Every scenario runs on fresh clients, caches and sync state, and reports its wall time, the number of
+requests each stub received and the peak Python memory.
+"""
+import os
+import io
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout
+
+# Make the project importable when the file is run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import SyntheticLibrary
+from benchmarks.stub_servers import start_stub_servers
+
+
+def configure_environment(stubs, workdir, args):
+    """Points every client at the stubs. Must run before the clients' modules are imported."""
+    os.environ.update({
+        "SC_API_URL": f"{stubs['senscritique'].url}/",
+        "PLEX_COMMUNITY_URL": stubs["plex-community"].url,
+        "PLEX_DISCOVER_URL": stubs["plex-discover"].url,
+        "PLEX_METADATA_URL": stubs["plex-metadata"].url,
+        "PLEX_SERVER_ADDRESS": stubs["plex-server"].url,
+        "PLEX_TOKEN": "benchmark-token",
+        "PLEX_USERNAME": "benchmark",
+        "SC_EMAIL": "benchmark@example.com",
+        "SC_PASSWORD": "benchmark",
+        "SC_USER_ID": "1",
+        "SC_USERNAME": "benchmark",
+        "MEDIA_CACHE_PATH": os.path.join(workdir, "media_cache.db"),
+        "SYNC_STATE_PATH": os.path.join(workdir, "sync_state.db"),
+        "SC_COLLECTION_SNAPSHOT_PATH": os.path.join(workdir, "sc_collection.json"),
+        "RATE_LIMIT_INITIAL": str(args.rate_limit),
+        "RATE_LIMIT_MAX": str(max(args.rate_limit, float(os.getenv("RATE_LIMIT_MAX", "20")))),
+        "MUTATION_RETRY_BASE_DELAY": "0.01"
+    })
+
+
+class BenchmarkRun:
+    """Fresh clients, cache and sync state for one scenario, wired into `main` like a real run."""
+
+    def __init__(self, workdir, name):
+        import main
+        from plex.plex_client import PlexClient
+        from senscritique.senscritique_client import SensCritiqueClient
+        from sync.sync_state import SyncStateStore
+        from sync.mutation_queue import MutationQueue
+        from utils import media_cache as media_cache_module
+
+        directory = os.path.join(workdir, name)
+        os.makedirs(directory, exist_ok=True)
+
+        self.media_cache = media_cache_module.MediaCache(path=os.path.join(directory, "media_cache.db"))
+        media_cache_module._media_cache = self.media_cache
+
+        self.sc_client = SensCritiqueClient(media_cache=self.media_cache)
+        self.sc_client.collection.path = os.path.join(directory, "sc_collection.json")
+        self.plex_client = PlexClient(media_cache=self.media_cache)
+        self.sync_state = SyncStateStore(path=os.path.join(directory, "sync_state.db"), json_path=None)
+        self.mutation_queue = MutationQueue(self.sc_client, self.plex_client, self.sync_state)
+
+        main.sc_client = self.sc_client
+        main.plex_client = self.plex_client
+        main.sync_state = self.sync_state
+        main.mutation_queue = self.mutation_queue
+        self.main = main
+
+    async def close(self):
+        await self.sc_client.client.aclose()
+        if self.plex_client.executor:
+            self.plex_client.executor.shutdown(wait=False)
+
+
+async def bounded_gather(coroutines, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(run(coroutine) for coroutine in coroutines))
+
+
+# Each scenario gets a BenchmarkRun and the library; `setup` runs before the measurement starts
+SCENARIOS = {
+    "sync_ratings": {
+        "run": lambda run, library: run.main.sync_ratings(full_rescan=True)
+    },
+    "sync_ratings_incremental": {
+        "setup": lambda run, library: run.main.sync_ratings(full_rescan=True),
+        "run": lambda run, library: run.main.sync_ratings()
+    },
+    "sync_ratings_dry_run": {
+        "run": lambda run, library: run.main.sync_ratings(full_rescan=True, dry_run=True)
+    },
+    "sync_watchlists": {
+        "run": lambda run, library: run.main.sync_watchlists()
+    },
+    "sync_watchlists_dry_run": {
+        "run": lambda run, library: run.main.sync_watchlists(dry_run=True)
+    },
+    "sync_watch_history": {
+        "run": lambda run, library: run.main.sync_watch_history(full_rescan=True)
+    },
+    "sync_watch_history_incremental": {
+        "setup": lambda run, library: run.main.sync_watch_history(full_rescan=True),
+        "run": lambda run, library: run.main.sync_watch_history()
+    },
+    "sc.get_user_rated_media": {
+        "run": lambda run, library: run.sc_client.get_user_rated_media()
+    },
+    "sc.fetch_user_wishes": {
+        "run": lambda run, library: run.sc_client.fetch_user_wishes(limit=library.size)
+    },
+    "sc.fetch_media": {
+        "run": lambda run, library: bounded_gather(
+            [run.sc_client.fetch_media(item["title"], item["year"], item["universe"]) for item in library.items[:1000]],
+            run.main.SYNC_CONCURRENCY
+        )
+    },
+    "sc.fetch_from_user_collections": {
+        "run": lambda run, library: bounded_gather(
+            [run.sc_client.fetch_from_user_collections(item["sc_id"]) for item in library.collection()[:1000]], 8
+        )
+    },
+    "plex.get_user_rated_content": {
+        "run": lambda run, library: asyncio.to_thread(run.plex_client.get_user_rated_content)
+    },
+    "plex.fetch_plex_watchlist": {
+        "run": lambda run, library: asyncio.to_thread(run.plex_client.fetch_plex_watchlist, True)
+    },
+    "plex.get_french_titles": {
+        "run": lambda run, library: asyncio.to_thread(run.plex_client.get_french_titles, [item["plex_id"] for item in library.items])
+    },
+    "plex.get_user_rated_content_in_local_plex_server": {
+        "run": lambda run, library: asyncio.to_thread(run.plex_client.get_user_rated_content_in_local_plex_server)
+    },
+    "plex.iter_user_rated_content_in_local_plex_server": {
+        "run": lambda run, library: asyncio.to_thread(
+            lambda: sum(1 for _ in run.plex_client.iter_user_rated_content_in_local_plex_server())
+        )
+    },
+    "plex.search_media_in_plex": {
+        "run": lambda run, library: asyncio.to_thread(
+            lambda: [run.plex_client.search_media_in_plex(item["title"], item["year"], item["plex_type"]) for item in library.items[:200]]
+        )
+    },
+    "plex.search_media_in_server": {
+        "run": lambda run, library: asyncio.to_thread(
+            lambda: [run.plex_client.search_media_in_server(item["title"], item["year"], item["plex_type"]) for item in library.items[:50]]
+        )
+    }
+}
+
+
+async def run_scenario(name, scenario, library, stubs, workdir, measure_memory, verbose):
+    from utils.metrics import get_metrics
+
+    output = sys.stdout if verbose else io.StringIO()
+    wall_time, peak_memory, error = 0.0, None, None
+    metrics_since = get_metrics().snapshot()
+    with redirect_stdout(output):
+        run = None
+        try:
+            # A failing setup (injected errors...) fails this scenario only, the next ones still run
+            run = BenchmarkRun(workdir, f"{library.size}-{name}")
+            if "setup" in scenario:
+                await scenario["setup"](run, library)
+        except Exception as e:
+            error = f"setup: {e!r}"
+
+        try:
+            if error is None:
+                for stub in stubs.values():
+                    stub.reset_counters()
+                metrics_since = get_metrics().snapshot()
+                if measure_memory:
+                    tracemalloc.start()
+
+                started_at = time.perf_counter()
+                try:
+                    await scenario["run"](run, library)
+                except Exception as e:
+                    error = repr(e)
+                wall_time = time.perf_counter() - started_at
+
+                if measure_memory:
+                    peak_memory = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+        finally:
+            if run is not None:
+                await run.close()
+
+    return {
+        "size": library.size,
+        "scenario": name,
+        "wall_time": round(wall_time, 3),
+        "requests": sum(stub.request_count() for stub in stubs.values()),
+        "requests_by_service": {stub.name: dict(stub.requests) for stub in stubs.values() if stub.requests},
+        "injected_errors": sum(stub.errors for stub in stubs.values()),
+        "bytes_received": sum(stub.bytes_sent for stub in stubs.values()),
+        "peak_memory_mb": round(peak_memory / 1024 / 1024, 2) if peak_memory is not None else None,
+        "error": error,
+        "client_metrics": get_metrics().report(metrics_since)
+    }
+
+
+def print_results(results):
+    print(f"{'size':>7}  {'scenario':<32} {'wall (s)':>9} {'requests':>9} {'errors':>7} {'peak MB':>8}")
+    for result in results:
+        peak_memory = f"{result['peak_memory_mb']:.2f}" if result["peak_memory_mb"] is not None else "-"
+        print(f"{result['size']:>7}  {result['scenario']:<32} {result['wall_time']:>9.3f} {result['requests']:>9} "
+              f"{result['injected_errors']:>7} {peak_memory:>8}" + (f"  FAILED: {result['error']}" if result["error"] else ""))
+
+
+async def run_benchmarks(args):
+    library = SyntheticLibrary(0)
+    stubs = start_stub_servers(library, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                               error_status=args.error_status)
+    # Absolute, as the run moves into it
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="plexsync-benchmarks-")
+    os.makedirs(workdir, exist_ok=True)
+    configure_environment(stubs, workdir, args)
+
+    # The clients read their configuration when imported, so only now, and from the work directory
+    os.chdir(workdir)
+    from benchmarks import fake_plexapi
+    fake_plexapi.install()
+
+    scenarios = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    results = []
+    try:
+        for size in [int(size) for size in args.sizes.split(",")]:
+            library = SyntheticLibrary(size, seed=args.seed)
+            for stub in stubs.values():
+                stub.library = library
+
+            for name in scenarios:
+                result = await run_scenario(name, SCENARIOS[name], library, stubs, workdir, not args.no_memory, args.verbose)
+                results.append(result)
+                if args.verbose:
+                    print_results([result])
+    finally:
+        for stub in stubs.values():
+            stub.stop()
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark PlexSync against local stand-ins of Plex and SensCritique.")
+    parser.add_argument("--sizes", default="100,1000,10000", help="Comma-separated library sizes (up to 100000).")
+    parser.add_argument("--scenarios", help=f"Comma-separated scenarios among: {', '.join(SCENARIOS)}. All by default.")
+    parser.add_argument("--latency", type=float, default=0.005, help="Seconds every stub waits before answering.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency, in seconds.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with --error-status.")
+    parser.add_argument("--error-status", type=int, default=500,
+                        help="Status code of the injected errors (429/503 exercise the adaptive rate limiter).")
+    parser.add_argument("--rate-limit", type=float, default=1000, help="Requests per second first allowed per host.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic libraries.")
+    parser.add_argument("--workdir", help="Directory of the caches and sync states (a temporary one by default).")
+    parser.add_argument("--json", help="Also write the results to this JSON file.")
+    parser.add_argument("--no-memory", action="store_true", help="Skip peak memory tracking (tracemalloc slows the run down).")
+    parser.add_argument("--verbose", action="store_true", help="Show the clients' output and each result as it comes.")
+    args = parser.parse_args()
+
+    if args.json:
+        args.json = os.path.abspath(args.json)
+
+    results = asyncio.run(run_benchmarks(args))
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
@@ -0,0 +1,449 @@
+import re
+import json
+import time
+import random
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from xml.sax.saxutils import quoteattr
+
+
+class StubServer:
+    """
+    Local HTTP server standing in for one online service during benchmarks.
+
+    Every request waits `latency` seconds (plus up to `jitter`) before being answered, and a share
+    `error_rate` of them is answered with `error_status` instead. Requests are counted per endpoint.
+    Subclasses implement `handle(method, path, query, body)` and return (status, content type, body).
+    """
+
+    name = "stub"
+
+    def __init__(self, library, host="127.0.0.1", latency=0.0, jitter=0.0, error_rate=0.0, error_status=500,
+                 retry_after="0"):
+        self.library = library
+        self.host = host
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.random = random.Random(0)
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.errors = 0
+        self.bytes_sent = 0
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, like the real services (without Nagle, which would add ~40ms to every answer)
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                stub._serve(self, "GET")
+
+            def do_POST(self):
+                stub._serve(self, "POST")
+
+            def do_PUT(self):
+                stub._serve(self, "PUT")
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name=f"{self.name}-stub", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests.clear()
+            self.errors = 0
+            self.bytes_sent = 0
+
+    def request_count(self):
+        with self.lock:
+            return sum(self.requests.values())
+
+    def handle(self, method, path, query, body):
+        raise NotImplementedError
+
+    def _serve(self, handler, method):
+        url = urlparse(handler.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        # Plex accepts the paging parameters as headers too
+        for name in ("X-Plex-Container-Start", "X-Plex-Container-Size"):
+            if handler.headers.get(name) is not None:
+                query.setdefault(name, handler.headers[name])
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+
+        with self.lock:
+            self.requests[f"{method} {self._endpoint(url.path)}"] += 1
+            fail = self.error_rate and self.random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+        headers = {}
+        if fail:
+            status, content_type, payload = self.error_status, "text/plain", b"Injected error"
+            if self.retry_after is not None:
+                headers["Retry-After"] = self.retry_after
+        else:
+            try:
+                status, content_type, payload = self.handle(method, url.path, query, body)
+            except Exception as e:
+                status, content_type, payload = 500, "text/plain", f"Stub error: {e!r}"
+
+            if not isinstance(payload, bytes):
+                payload = payload.encode("utf-8")
+
+        with self.lock:
+            self.bytes_sent += len(payload)
+
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(payload)))
+        for key, value in headers.items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    def _endpoint(self, path):
+        # Group the requests of a same endpoint, whatever the ids in the path
+        return re.sub(r"/[0-9a-f]{6,}(,[0-9a-f]+)*|/\d+", "/{id}", path)
+
+
+def json_response(data, status=200):
+    return status, "application/json", json.dumps(data)
+
+
+def xml_response(element, status=200):
+    return status, "text/xml", element
+
+
+def xml_element(tag, attributes, children=""):
+    attributes = " ".join(f"{key}={quoteattr(str(value))}" for key, value in attributes.items() if value is not None)
+    return f"<{tag} {attributes}>{children}</{tag}>"
+
+
+class ApolloStub(StubServer):
+    """SensCritique Apollo GraphQL endpoint: single and batched (array) operations."""
+
+    name = "senscritique"
+
+    def handle(self, method, path, query, body):
+        operations = json.loads(body or b"{}")
+        if isinstance(operations, list):
+            return json_response([self._execute(operation) for operation in operations])
+        return json_response(self._execute(operations))
+
+    def _execute(self, operation):
+        document = operation.get("query") or ""
+        variables = operation.get("variables") or {}
+
+        if "signInWithEmailAndPassword" in document:
+            return {"data": {"signInWithEmailAndPassword": {"userCookie": {
+                "cookieRef": "benchmark-cookie", "dateExpiration": "2099-01-01T00:00:00.000Z", "id": 1, "userId": 1
+            }}}}
+
+        if "query UserWishes" in document:
+            wishes = self.library.wishes()[:variables.get("limit") or None]
+            return {"data": {"user": {"id": 1, "medias": {"avatar": None}, "wishes": [self._wish(item) for item in wishes]}}}
+
+        if "query FeedWishDates" in document:
+            return {"data": {
+                f"p{id}": [{"feeds": [{"dateCreation": "2024-01-01T00:00:00.000Z", "isWishList": True, "product": {"id": int(id)}}]}]
+                for id in re.findall(r"\bp(\d+):", document)
+            }}
+
+        if "query SearchAutocomplete" in document:
+            universe = {"movie": 1, "tvShow": 4}.get(variables.get("universe"))
+            items = self.library.search(variables.get("keywords", ""), universe)[:variables.get("limit") or None]
+            return {"data": {"searchAutocomplete": {"total": len(items), "items": [{"product": self._product(item)} for item in items]}}}
+
+        if "query UserCollection" in document:
+            products = self._page(self.library.collection(), variables)
+            return {"data": {"user": {"collection": {"products": [self._collection_product(item) for item in products]}}}}
+
+        if "query UserDiary" in document:
+            products = self._page(self.library.collection(), variables)
+            return {"data": {"user": {"collection": {"products": [self._diary_product(item) for item in products]}}}}
+
+        if "query FetchTvShowWithEpisodes" in document:
+            item = self.library.by_sc_id.get(variables.get("id"))
+            return {"data": {"product": {"id": variables.get("id"), "title": item["title"] if item else None, "seasons": []}}}
+
+        if "productRate(" in document:
+            item = self.library.by_sc_id.get(variables.get("productId"), {})
+            return {"data": {"productRate": {"id": variables.get("productId"), "title": item.get("title"), "currentUserInfos": {
+                "dateDone": None, "rating": variables.get("rating"), "userId": 1, "isDone": True, "isListed": False,
+                "isRecommended": False, "isReviewed": False, "isWished": False
+            }}}}
+
+        if "productDone(" in document:
+            return {"data": {"productDone": {"id": variables.get("productId"), "currentUserInfos": {
+                "dateDone": "2025-01-01T00:00:00.000Z", "isDone": True
+            }}}}
+
+        for mutation in ("productWish", "productUnwish"):
+            if f"{mutation}(" in document:
+                return {"data": {mutation: True}}
+
+        return {"errors": [{"message": "Operation not emulated by the benchmark stub"}]}
+
+    def _page(self, items, variables):
+        offset = variables.get("offset") or 0
+        limit = variables.get("limit") or len(items)
+        return items[offset:offset + limit]
+
+    def _wish(self, item):
+        return {
+            "id": item["sc_id"], "title": item["title"], "year_of_production": item["year"],
+            "original_title": item["title"], "genres": [], "release_date": f"{item['year']}-01-01",
+            "universe": item["universe"], "medias": {"picture": None}
+        }
+
+    def _product(self, item):
+        return {
+            "id": item["sc_id"], "title": item["title"], "originalTitle": item["title"], "universe": item["universe"],
+            "dateRelease": f"{item['year']}-01-01", "dateReleaseOriginal": None, "medias": {"picture": None}, "url": None
+        }
+
+    def _collection_product(self, item):
+        return {
+            "id": item["sc_id"], "originalTitle": item["title"], "title": item["title"], "universe": item["universe"],
+            "category": None, "yearOfProduction": item["year"], "seasons": [],
+            "currentUserInfos": {"rating": item["sc_rating"], "dateDone": item["rated_at"]}
+        }
+
+    def _diary_product(self, item):
+        return {
+            "id": item["sc_id"], "universe": item["universe"], "dateCreation": item["rated_at"],
+            "dateLastUpdate": item["rated_at"], "category": None, "title": item["title"],
+            "originalTitle": item["title"], "alternativeTitles": [], "yearOfProduction": item["year"], "url": None,
+            "otherUserInfos": {"dateDone": item["rated_at"], "rating": item["sc_rating"]}
+        }
+
+
+class PlexCommunityStub(StubServer):
+    """community.plex.tv GraphQL API: user lookup and the cursor-paginated GetReviewsHub."""
+
+    name = "plex-community"
+
+    def handle(self, method, path, query, body):
+        operation = json.loads(body or b"{}")
+        variables = operation.get("variables") or {}
+
+        if operation.get("operationName") == "GetUserDetails":
+            return json_response({"data": {"userByUsername": {
+                "id": "benchmark-user", "avatar": None, "username": variables.get("username"), "displayName": "Benchmark"
+            }}})
+
+        if operation.get("operationName") == "GetReviewsHub":
+            items = self.library.plex_ratings()
+            offset = int(variables.get("after") or 0)
+            page = items[offset:offset + variables.get("first", 50)]
+            end = offset + len(page)
+            return json_response({"data": {"user": {"reviews": {
+                "nodes": [self._node(item) for item in page],
+                "pageInfo": {"hasNextPage": end < len(items), "endCursor": str(end)}
+            }}}})
+
+        return json_response({"errors": [{"message": "Operation not emulated by the benchmark stub"}]})
+
+    def _node(self, item):
+        return {"id": f"rating-{item['index']}", "date": item["rated_at"], "rating": item["plex_rating"], "metadataItem": {
+            "id": item["plex_id"], "title": item["title"], "type": item["plex_type"].upper(), "year": item["year"],
+            "index": None, "key": f"/library/metadata/{item['plex_id']}", "parent": None, "grandparent": None
+        }}
+
+
+class PlexDiscoverStub(StubServer):
+    """
+    discover.provider.plex.tv: metadata (French titles, batched ids), ratings, and the watchlist and search
+    endpoints used by the fake MyPlexAccount.
+    """
+
+    name = "plex-discover"
+
+    def handle(self, method, path, query, body):
+        if method == "PUT" and path.startswith("/actions/"):
+            return json_response({})
+
+        if path == "/library/sections/watchlist/all":
+            return json_response({"MediaContainer": {"Metadata": [self._metadata(item) for item in self.library.watchlist()]}})
+
+        if path == "/library/search":
+            items = self.library.search(query.get("query", ""))
+            if query.get("libtype"):
+                items = [item for item in items if item["plex_type"] == query["libtype"]]
+            return json_response({"MediaContainer": {"Metadata": [self._metadata(item) for item in items]}})
+
+        match = re.fullmatch(r"/library/metadata/([^/]+)/userState", path)
+        if match:
+            return json_response({"MediaContainer": {"UserState": [{"watchlistedAt": 1704067200}]}})
+
+        match = re.fullmatch(r"/library/metadata/([^/]+)", path)
+        if match:
+            items = [self.library.by_plex_id[id] for id in match.group(1).split(",") if id in self.library.by_plex_id]
+            return json_response({"MediaContainer": {"Metadata": [self._metadata(item, french=True) for item in items]}})
+
+        return json_response({"error": "Not emulated"}, status=404)
+
+    def _metadata(self, item, french=False):
+        return {
+            "ratingKey": item["plex_id"], "key": f"/library/metadata/{item['plex_id']}",
+            "guid": f"plex://{item['plex_type']}/{item['plex_id']}", "type": item["plex_type"],
+            "title": item["french_title"] if french else item["title"], "year": item["year"]
+        }
+
+
+class PlexMetadataStub(StubServer):
+    """metadata.provider.plex.tv: XML metadata of a Discover item."""
+
+    name = "plex-metadata"
+
+    def handle(self, method, path, query, body):
+        match = re.fullmatch(r"/library/metadata/([^/]+)", path)
+        item = self.library.by_plex_id.get(match.group(1)) if match else None
+        if not item:
+            return xml_response("<MediaContainer size=\"0\"></MediaContainer>", status=404)
+
+        tag = "Directory" if item["plex_type"] == "show" else "Video"
+        element = xml_element(tag, {"ratingKey": item["plex_id"], "title": item["title"], "year": item["year"],
+                                    "type": item["plex_type"]}, "<Guid id=\"imdb://tt0000000\" />")
+        return xml_response(f"<MediaContainer size=\"1\">{element}</MediaContainer>")
+
+
+class PlexServerStub(StubServer):
+    """Plex Media Server: identity, library sections, paginated section listings and watch history (XML, like the real one)."""
+
+    name = "plex-server"
+
+    SECTIONS = {"1": "movie", "2": "show"}
+    TYPES = {"1": "movie", "2": "show", "3": "season", "4": "episode"}
+
+    def handle(self, method, path, query, body):
+        if path == "/":
+            return xml_response(xml_element("MediaContainer", {
+                "friendlyName": "Benchmark", "machineIdentifier": "benchmark", "version": "1.40.0.0", "size": 0
+            }))
+
+        if path in ("/library", "/library/"):
+            return xml_response(xml_element("MediaContainer", {"size": 0, "title1": "Plex Library"}))
+
+        if path == "/library/sections":
+            sections = "".join(
+                xml_element("Directory", {"key": key, "type": section_type, "title": "Movies" if section_type == "movie" else "TV Shows",
+                                          "agent": "tv.plex.agents.none", "scanner": "Plex Scanner", "language": "en-US",
+                                          "uuid": f"section-{key}", "updatedAt": self.library.sections_updated_at.get(key, 0)})
+                for key, section_type in self.SECTIONS.items()
+            )
+            return xml_response(xml_element("MediaContainer", {"size": len(self.SECTIONS)}, sections))
+
+        match = re.fullmatch(r"/library/sections/(\d+)/all", path)
+        if match:
+            section_type = self.SECTIONS.get(match.group(1))
+            item_type = self.TYPES.get(query.get("type"), section_type)
+            if item_type in ("season", "episode") and section_type == "show":
+                items = [item for item in self.library.episodes() if item["plex_type"] == item_type]
+            elif item_type == section_type:
+                items = [item for item in self.library.items if item["plex_type"] == section_type]
+            else:
+                items = []
+
+            title = (query.get("title") or "").lower()
+            if title:
+                items = [item for item in items if title in item["title"].lower()]
+            if any(key.startswith("userRating") for key in query):
+                items = [item for item in items if item["plex_rating"]]
+            if query.get("updatedAt>>"):
+                items = [item for item in items if item.get("updated_at", 0) > int(query["updatedAt>>"])]
+
+            start = int(query.get("X-Plex-Container-Start", 0))
+            size = int(query.get("X-Plex-Container-Size", len(items)))
+            page = items[start:start + size]
+            return xml_response(xml_element(
+                "MediaContainer", {"size": len(page), "totalSize": len(items), "offset": start},
+                "".join(self._element(item, match.group(1), query.get("includeGuids") == "1") for item in page)
+            ))
+
+        if path == "/status/sessions/history/all":
+            views = self.library.history()
+            if query.get("viewedAt>"):
+                views = [view for view in views if view["viewed_at"] > int(query["viewedAt>"])]
+
+            start = int(query.get("X-Plex-Container-Start", 0))
+            size = int(query.get("X-Plex-Container-Size", len(views)))
+            page = views[start:start + size]
+            return xml_response(xml_element(
+                "MediaContainer", {"size": len(page), "totalSize": len(views), "offset": start},
+                "".join(xml_element("Video", {
+                    "historyKey": f"/status/sessions/history/{view['history_id']}", "ratingKey": view["item"]["rating_key"],
+                    "key": f"/library/metadata/{view['item']['rating_key']}", "type": "movie", "title": view["item"]["title"],
+                    "originallyAvailableAt": f"{view['item']['year']}-01-01", "viewedAt": view["viewed_at"], "accountID": 1,
+                    "librarySectionID": "1"
+                }) for view in page)
+            ))
+
+        match = re.fullmatch(r"/library/metadata/([\d,]+)", path)
+        if match:
+            items = [self.library.by_rating_key[key] for key in match.group(1).split(",") if key in self.library.by_rating_key]
+            if items:
+                return xml_response(xml_element("MediaContainer", {"size": len(items)}, "".join(
+                    self._element(item, "1" if item["plex_type"] == "movie" else "2") for item in items
+                )))
+
+        return xml_response("<MediaContainer size=\"0\"></MediaContainer>", status=404)
+
+    def _element(self, item, section_id, include_guids=False):
+        if item["plex_type"] == "season":
+            return xml_element("Directory", {
+                "ratingKey": item["rating_key"], "type": "season", "title": item["title"], "index": item["index"],
+                "parentTitle": item["show"]["title"], "parentYear": item["show"]["year"], "userRating": item["plex_rating"],
+                "librarySectionID": section_id
+            })
+        if item["plex_type"] == "episode":
+            return xml_element("Video", {
+                "ratingKey": item["rating_key"], "type": "episode", "title": item["title"], "index": item["index"],
+                "parentIndex": item["season"], "grandparentTitle": item["show"]["title"], "year": item["show"]["year"],
+                "userRating": item["plex_rating"], "librarySectionID": section_id
+            }, '<Media id="1" duration="1500000"><Part id="1" key="/library/parts/1/file.mkv"/></Media>')
+        return xml_element("Directory" if item["plex_type"] == "show" else "Video", {
+            "ratingKey": item["rating_key"], "key": f"/library/metadata/{item['rating_key']}",
+            "guid": f"plex://{item['plex_type']}/{item['plex_id']}", "type": item["plex_type"], "title": item["title"],
+            "year": item["year"], "userRating": item["plex_rating"], "librarySectionID": section_id
+        }, f'<Guid id="tmdb://{item["sc_id"]}"/>' if include_guids else "")
+
+
+def start_stub_servers(library, **options):
+    """
+    Starts one stub server per emulated service and returns them by name.
+
+    Each stub listens on its own loopback address, so the rate limiter sees one host per service like in production.
+    """
+    stubs = [ApolloStub, PlexCommunityStub, PlexDiscoverStub, PlexMetadataStub, PlexServerStub]
+    return {stub.name: stub(library, host=f"127.0.0.{i}", **options).start() for i, stub in enumerate(stubs, start=1)}
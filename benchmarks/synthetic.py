@@ -0,0 +1,118 @@
+import random
+from datetime import datetime, timedelta, timezone
+from utils.media_cache import normalize_title
+
+
+class SyntheticLibrary:
+    """
+    Deterministic fake library shared by every stub server of a benchmark run.
+
+    Each of the `size` items exists on both services: a SensCritique product (collection, ratings, wishes)
+    and a Plex Discover metadata item (ratings, watchlist, French title), plus a ratingKey on the fake
+    Plex Media Server. Ratings mostly agree between both sides so that a sync has a realistic share of work:
+    about 10% differ and 10% only exist on Plex.
+    """
+
+    def __init__(self, size, seed=0):
+        self.size = size
+        generator = random.Random(seed)
+        now = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+        self.items = []
+        for i in range(size):
+            is_show = i % 4 == 3
+            plex_rating = generator.randint(1, 10)
+            roll = generator.random()
+            if roll < 0.8:
+                sc_rating = plex_rating
+            elif roll < 0.9:
+                sc_rating = plex_rating % 10 + 1
+            else:
+                sc_rating = None
+
+            self.items.append({
+                "index": i,
+                "sc_id": 100000 + i,
+                "plex_id": f"{i:024x}",
+                "rating_key": str(i + 1),
+                "title": f"{'Show' if is_show else 'Movie'} {i:06d}",
+                "french_title": f"{'Show' if is_show else 'Movie'} {i:06d}",
+                "year": 1950 + i % 70,
+                "universe": 4 if is_show else 1,
+                "plex_type": "show" if is_show else "movie",
+                "plex_rating": plex_rating,
+                "sc_rating": sc_rating,
+                "rated_at": (now - timedelta(minutes=i)).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                # One item out of ten is on the Plex watchlist, half of them are also wished on SensCritique
+                "watchlisted": i % 10 == 0,
+                "wished": i % 20 == 0
+            })
+
+        self.by_sc_id = {item["sc_id"]: item for item in self.items}
+        self.by_plex_id = {item["plex_id"]: item for item in self.items}
+        self.by_rating_key = {item["rating_key"]: item for item in self.items}
+        self.by_title = {}
+        self.views = None
+        self.show_children = None
+        # Last change of each Plex server section, as its "updatedAt"
+        self.sections_updated_at = {"1": 0, "2": 0}
+        for item in self.items:
+            self.by_title.setdefault(normalize_title(item["title"]), []).append(item)
+
+    def search(self, keywords, universe=None):
+        """Items whose normalized title is `keywords`, optionally of one universe id."""
+        return [
+            item for item in self.by_title.get(normalize_title(keywords), [])
+            if universe is None or item["universe"] == universe
+        ]
+
+    def collection(self):
+        """Items rated on SensCritique, most recently rated first (the LAST_ACTION_DESC order)."""
+        return [item for item in self.items if item["sc_rating"] is not None]
+
+    def plex_ratings(self):
+        """Items rated on Plex, most recently rated first (the GetReviewsHub order)."""
+        return self.items
+
+    def history(self):
+        """Views of the Plex server history, newest first: every other movie was watched three times."""
+        if self.views is None:
+            now = int(datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp())
+            views = [
+                {"item": item, "viewed_at": now - (item["index"] * 3 + watch) * 3600}
+                for item in self.items if item["plex_type"] == "movie" and item["index"] % 2 == 0
+                for watch in range(3)
+            ]
+            views.sort(key=lambda view: view["viewed_at"], reverse=True)
+            for history_id, view in enumerate(views, 1):
+                view["history_id"] = history_id
+            self.views = views
+        return self.views
+
+    def episodes(self, seasons_per_show=2, episodes_per_season=6):
+        """Seasons and episodes of the shows, every third one rated (generated on first use)."""
+        if self.show_children is None:
+            show_children = []
+            for item in self.items:
+                if item["plex_type"] != "show":
+                    continue
+                for season in range(1, seasons_per_show + 1):
+                    season_key = str(10_000_000 + item["index"] * 100 + season * 10)
+                    show_children.append({
+                        "rating_key": season_key, "plex_type": "season", "show": item, "index": season,
+                        "title": f"Season {season}", "plex_rating": (item["index"] + season) % 10 + 1 if season % 3 == 0 else None
+                    })
+                    for episode in range(1, episodes_per_season + 1):
+                        show_children.append({
+                            "rating_key": str(int(season_key) + episode), "plex_type": "episode", "show": item,
+                            "season": season, "index": episode, "title": f"Episode {episode}",
+                            "plex_rating": (item["index"] + episode) % 10 + 1 if episode % 3 == 0 else None
+                        })
+            self.show_children = show_children
+        return self.show_children
+
+    def watchlist(self):
+        return [item for item in self.items if item["watchlisted"]]
+
+    def wishes(self):
+        return [item for item in self.items if item["wished"]]
@@ -1,29 +1,86 @@
 import os
 import asyncio
+import argparse
 from dotenv import load_dotenv
-from senscritique.senscritique_client import SensCritiqueClient
-from plex.plex_client import PlexClient
-import json
+from utils.dates import parse_iso_datetime
+from utils.media_cache import get_media_cache
+from utils.metrics import get_metrics, METRICS_PORT
+from sync import SYNC_CONCURRENCY
+from sync.sync_state import SyncStateStore
+from sync.mutation_queue import MutationQueue
+from sync.planner import SyncPlan, plan_watchlists, plan_ratings, plan_watch_history, rating_key
+from sync.daemon import SyncDaemon, SyncJob, SYNC_WATCHLISTS_INTERVAL, SYNC_RATINGS_INTERVAL, SYNC_WATCH_HISTORY_INTERVAL, stop_on_signals
+from sync.watch_history import get_watched_items, resolve_sc_ids
+from sync.webhook import PlexWebhookReceiver, WebhookEvent
 
 # Load environment variables
 load_dotenv()
 
 
 
-# Initialize the SensCritiqueClient
-sc_client = SensCritiqueClient()
-
-# Initialize Plex Client
-plex_client = PlexClient()
-
-async def add_all_plex_watchlist_to_sc():
-    """Sync all items in Plex Watchlist to SensCritique's wishlist."""
+PLEX_USERNAME = os.getenv("PLEX_USERNAME")
+
+# Clients and state are created on first use, so a run only connects to the services it needs
+sc_client = None
+plex_client = None
+sync_state = None
+mutation_queue = None
+
+def get_sc_client():
+    """Returns the SensCritique client, signing in on first use."""
+    global sc_client
+    if sc_client is None:
+        from senscritique.senscritique_client import SensCritiqueClient
+        sc_client = SensCritiqueClient()
+    return sc_client
+
+def get_plex_client():
+    """Returns the Plex client (its account and local server connect when first used)."""
+    global plex_client
+    if plex_client is None:
+        from plex.plex_client import PlexClient
+        plex_client = PlexClient()
+    return plex_client
+
+def get_sync_state():
+    """Returns the sync state, opened (and sync_data.json migrated) on first use."""
+    global sync_state
+    if sync_state is None:
+        sync_state = SyncStateStore()
+    return sync_state
+
+def get_mutation_queue():
+    """Returns the queue of the writes to both services, sent (and retried) together during a sync phase."""
+    global mutation_queue
+    if mutation_queue is None:
+        mutation_queue = MutationQueue(get_sc_client, get_plex_client, get_sync_state())
+    return mutation_queue
+
+async def add_all_plex_watchlist_to_sc(concurrency=SYNC_CONCURRENCY):
+    """
+    Sync all items in Plex Watchlist to SensCritique's wishlist.
+
+    Items are resolved and added concurrently, with at most `concurrency` items in flight.
+    Results are reported in watchlist order, and a failing item does not stop the batch.
+
+    Args:
+        concurrency (int): Maximum number of items processed at the same time (1 processes them one by one).
+
+    Returns:
+        list: One (plex_media, media_id, error) tuple per watchlist item, in watchlist order.
+    """
     
     print("Fetching Plex Watchlist...")
-    plex_watchlist = plex_client.fetch_plex_watchlist()
+    plex_watchlist = get_plex_client().fetch_plex_watchlist()
+
+    if not plex_watchlist:
+        print("No items found in Plex Watchlist.")
+        return []
 
-    if plex_watchlist:
-        for plex_media in plex_watchlist:
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def add_plex_media_to_sc(plex_media):
+        async with semaphore:
             title = plex_media.title
             year = plex_media.year
             content_type = plex_media.type  # This will be either 'movie' or 'tvshow'
@@ -31,22 +88,41 @@ async def add_all_plex_watchlist_to_sc():
             print(f"\nSearching for {title} ({year}) on SensCritique...")
 
             # Fetch the media ID from SensCritique
-            media_id = await sc_client.fetch_media_id(title, year, sc_client.get_sc_media_type_id_from_plex_text_type(content_type))
+            media_id = await get_sc_client().fetch_media_id(title, year, get_sc_client().get_sc_media_type_id_from_plex_text_type(content_type))
 
             if media_id:
                 print(f"Adding {title} ({year}) to SensCritique wishlist...")
-                await sc_client.add_media_to_wishlist(media_id)
-            else:
-                print(f"Could not find {title} ({year}) on SensCritique.")
-    else:
-        print("No items found in Plex Watchlist.")
+                # Raised rather than returned, so that gather() reports the failure of this item
+                await get_sc_client().add_media_to_wishlist(media_id, raise_errors=True)
+
+            return media_id
+
+    # gather() keeps the order of the watchlist, return_exceptions isolates per-item failures
+    outcomes = await asyncio.gather(
+        *(add_plex_media_to_sc(plex_media) for plex_media in plex_watchlist),
+        return_exceptions=True
+    )
+
+    results = []
+    for plex_media, outcome in zip(plex_watchlist, outcomes):
+        if isinstance(outcome, Exception):
+            print(f"Error adding {plex_media.title} ({plex_media.year}) to SensCritique wishlist: {outcome}")
+            results.append((plex_media, None, outcome))
+        elif outcome:
+            print(f"- {plex_media.title} ({plex_media.year}) -> SensCritique [{outcome}]")
+            results.append((plex_media, outcome, None))
+        else:
+            print(f"Could not find {plex_media.title} ({plex_media.year}) on SensCritique.")
+            results.append((plex_media, None, None))
+
+    return results
 
 async def add_all_scs_wishlist_to_plex():
     """Sync all movies/series in SensCritique's wishlist into Plex's watchlist."""
     
     # Fetch the user's wishlist from SensCritique and store it in a variable
     print("Fetching user wishlist from SensCritique...")
-    sc_wishlist = await sc_client.fetch_user_wishes(limit=30)  # Fetch the first 30 items
+    sc_wishlist = await get_sc_client().fetch_user_wishes(limit=30)  # Fetch the first 30 items
     
     if not sc_wishlist:
         print("No wishlist found in SensCritique.")
@@ -63,11 +139,11 @@ async def add_all_scs_wishlist_to_plex():
         print(f"Searching for '{title}' ({year}) in Plex...")
 
         # Search for the movie/series in Plex
-        plex_media = plex_client.search_media_in_discover(title, year, content_type=universe)
+        plex_media = get_plex_client().search_media_in_discover(title, year, content_type=universe)
 
         if plex_media:
             print(f"Adding '{title}' ({year}) to Plex watchlist...")
-            plex_client.add_to_plex_watchlist(plex_media)
+            get_plex_client().add_to_plex_watchlist(plex_media)
         else:
             print(f"'{title}' ({year}) not found in Plex.")
     
@@ -76,15 +152,15 @@ async def add_all_scs_wishlist_to_plex():
 async def remove_plex_watchlist_removed_items_in_sc():
     """Sync items removed from Plex Watchlist to SensCritique Wishlist."""
     print("Fetching Plex Watchlist...")
-    plex_watchlist = plex_client.fetch_plex_watchlist()
+    plex_watchlist = get_plex_client().fetch_plex_watchlist()
 
     # Fetch current SensCritique wishlist
     print("Fetching SensCritique Wishlist...")
-    sc_wishlist = await sc_client.fetch_user_wishes(limit=30)  # Adjust the limit as needed
+    sc_wishlist = await get_sc_client().fetch_user_wishes(limit=30)  # Adjust the limit as needed
     
     # Create a list of titles from both lists to compare
     plex_titles = [(plex_media.title, plex_media.year, plex_media.type) for plex_media in plex_watchlist]
-    sc_titles = [(media['title'], media['release_date'].year, media['universe']) for media in sc_wishlist]
+    sc_titles = {(media['title'], media['release_date'].year, media['universe']) for media in sc_wishlist}
 
     # Find items that are in Plex but not in SC wishlist
     items_to_remove_from_sc = [plex_media for plex_media in plex_titles if (plex_media[0], plex_media[1], plex_media[2]) not in sc_titles]
@@ -93,24 +169,24 @@ async def remove_plex_watchlist_removed_items_in_sc():
         print(f"Found {len(items_to_remove_from_sc)} items to remove from SensCritique Wishlist.")
         for plex_media in items_to_remove_from_sc:
             # Search the media on SensCritique by title, year, and type (universe)
-            media_id = await sc_client.fetch_media_id(plex_media[0], plex_media[1], sc_client.get_sc_media_type_id_from_plex_text_type(plex_media[2]))
+            media_id = await get_sc_client().fetch_media_id(plex_media[0], plex_media[1], get_sc_client().get_sc_media_type_id_from_plex_text_type(plex_media[2]))
             if media_id:
                 print(f"Removing {plex_media[0]} ({plex_media[1]}) from SensCritique Wishlist...")
-                await sc_client.remove_media_from_wishlist(media_id)
+                await get_sc_client().remove_media_from_wishlist(media_id)
     else:
         print("No items to remove from SensCritique Wishlist.")
 
 async def remove_sc_wishlist_removed_items_in_plex():
     """Sync items removed from SensCritique Wishlist to Plex Watchlist."""
     print("Fetching SensCritique Wishlist...")
-    sc_wishlist = await sc_client.fetch_user_wishes(limit=30)  # Adjust the limit as needed
+    sc_wishlist = await get_sc_client().fetch_user_wishes(limit=30)  # Adjust the limit as needed
 
     # Fetch current Plex watchlist
     print("Fetching Plex Watchlist...")
-    plex_watchlist = plex_client.fetch_plex_watchlist()
+    plex_watchlist = get_plex_client().fetch_plex_watchlist()
 
     # Create a list of titles from both lists to compare
-    plex_titles = [(plex_media.title, plex_media.year, plex_media.type) for plex_media in plex_watchlist]
+    plex_titles = {(plex_media.title, plex_media.year, plex_media.type) for plex_media in plex_watchlist}
     sc_titles = [(media['title'], media['release_date'].year, media['universe']) for media in sc_wishlist]
 
     # Find items that are in SC wishlist but not in Plex's watchlist
@@ -120,28 +196,28 @@ async def remove_sc_wishlist_removed_items_in_plex():
         print(f"Found {len(items_to_remove_from_plex)} items to remove from Plex Watchlist.")
         for sc_media in items_to_remove_from_plex:
             # Search the media on Plex by title, year, and type (universe)
-            plex_media = plex_client.search_media_in_discover(sc_media[0], sc_media[1], content_type=sc_media[2])
+            plex_media = get_plex_client().search_media_in_discover(sc_media[0], sc_media[1], content_type=sc_media[2])
             if plex_media:
                 print(f"Removing {sc_media[0]} ({sc_media[1]}) from Plex Watchlist...")
-                plex_client.remove_from_plex_watchlist(plex_media)
+                get_plex_client().remove_from_plex_watchlist(plex_media)
     else:
         print("No items to remove from Plex Watchlist.")
 
 async def add_media_to_all_services_watchlist(title, year, type):
     try:
         print(f"\nSearching for media from {year} on SensCritique...")
-        media_id = await sc_client.fetch_media_id(title, year, universe=type)
+        media_id = await get_sc_client().fetch_media_id(title, year, universe=type)
         if media_id:
-            await sc_client.add_media_to_wishlist(media_id)
+            await get_sc_client().add_media_to_wishlist(media_id)
 
         # Fetch updated wishlist after adding media
-        await sc_client.fetch_user_wishes()
+        await get_sc_client().fetch_user_wishes()
 
         print(f"\nSearching for media from {year} on Plex...")
-        plex_media = plex_client.search_media_in_discover(title, year, content_type=type)
+        plex_media = get_plex_client().search_media_in_discover(title, year, content_type=type)
 
         if plex_media:
-            plex_client.add_to_plex_watchlist(plex_media)
+            get_plex_client().add_to_plex_watchlist(plex_media)
         else:
             print(f"Media '{title}' ({year}) not found in Plex.")
     except Exception as e:
@@ -151,203 +227,494 @@ async def print_both_watchlists():
     try:
         # Fetch and print the current wishlist from SensCritique
         print("Fetching current SensCritique Wishlist...")
-        await sc_client.fetch_user_wishes()
+        await get_sc_client().fetch_user_wishes()
 
         # Fetch and print the current watchlist from Plex
         print("Fetching current Plex Watchlist...")
-        plex_client.fetch_plex_watchlist()
+        get_plex_client().fetch_plex_watchlist(enrich=True)
     except Exception as e:
         print(f"Error printing watchlists: {e}")
 
-def load_sync_data(file_path="sync_data.json"):
-    try:
-        with open(file_path, "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []  # Return an empty list if the file doesn't exist
-
-def update_sync_data(sync_data, plex_id, sc_id, title, year, media_type, status, file_path="sync_data.json"):
-    item = {
-        "plex_id": plex_id,
-        "sc_id": sc_id,
-        "title": title,
-        "year": year,
-        "type": media_type,
-        "status": status
-    }
-    sync_data.append(item)
-    
-    # Write updated sync data back to the file
-    with open(file_path, "w") as f:
-        json.dump(sync_data, f, indent=4)
-
-def find_sync_entry(sync_data, plex_id=None, sc_id=None):
-    for entry in sync_data:
-        if entry["plex_id"] == plex_id or entry["sc_id"] == sc_id:
-            return entry
-    return None
-
-
 async def print_plex_user_rated_content():
-    rated_media = plex_client.get_user_rated_content()
+    rated_media = get_plex_client().get_user_rated_content()
     print(f"All media rated in Plex ({len(rated_media)} items):")
     for media in rated_media:
         print(f"[{media['type']}] {media['title']} ({media['year']}): {media['rating']} [{media['id']}] - Rate Date: {media['ratedDate']}")
         
 async def print_sens_critique_user_rated_content():
-    rated_media = await sc_client.get_user_rated_media()
+    rated_media = await get_sc_client().get_user_rated_media()
     print(f"All media rated in SensCritique ({len(rated_media)} items):")
     for media in rated_media:
         print(f"[{media['type']}] {media['title']} ({media['year']}): {media['rating']} [{media['id']}] - Rate Date: {media['ratedDate']}")
 
-async def sync_watchlists():
-    """Sync both Plex and SensCritique Watchlists."""
+async def sync_watchlists(dry_run=False):
+    """
+    Sync both Plex and SensCritique Watchlists.
+
+    The whole plan is computed first from both lists and the sync state, then executed.
+    With `dry_run`, the plan is only printed.
+
+    Raises:
+        RuntimeError: If either list could not be fetched (nothing is planned then).
+    """
     print("Syncing Plex and SensCritique Watchlists...")
 
     # Fetch current watchlists
-    plex_watchlist = plex_client.fetch_plex_watchlist()
-    sc_wishlist = await sc_client.fetch_user_wishes()
-
-    # Load sync data from the persistent file
-    sync_data = load_sync_data()
-
-    plex_titles = set()
-    sc_titles = set()
-
-    # Step 1: Add missing items (from Plex to SC and from SC to Plex)
-    # Iterate over Plex Watchlist
-    for plex_media in plex_watchlist:
-        title = plex_media.title
-        year = plex_media.year
-        media_type = plex_media.type
-        plex_id = plex_media.guid
-
-        # Check if it's already in sync data
-        sync_entry = find_sync_entry(sync_data, plex_id=plex_id)
-        if not sync_entry:
-            print(f"Adding '{title}' ({year}) to SensCritique wishlist...")
-            media_id = await sc_client.fetch_media_id(title, year, universe=media_type)
-            if media_id:
-                await sc_client.add_media_to_wishlist(media_id)
-                update_sync_data(sync_data, plex_id, media_id, title, year, media_type, "synced")
-
-    # Iterate over SensCritique Wishlist and add missing items to Plex
-    for sc_media in sc_wishlist:
-        title = sc_media["title"]
-        year = sc_media["release_date"].year
-        media_type = sc_media["universe"]
-
-        # Check if it's already in sync data
-        sync_entry = find_sync_entry(sync_data, plex_id=None, sc_id=sc_media["id"])
-        if not sync_entry:
-            print(f"Adding '{title}' ({year}) to Plex watchlist...")
-            plex_media = plex_client.search_media_in_discover(title, year, content_type=media_type)
-            if plex_media:
-                plex_client.add_to_plex_watchlist(plex_media)
-                # Update the sync data after adding it to Plex
-                update_sync_data(sync_data, plex_media.guid, sc_media["id"], title, year, media_type, "synced")
+    plex_watchlist = get_plex_client().fetch_plex_watchlist()
+    sc_wishlist = await get_sc_client().fetch_user_wishes()
 
-    # After adding, refresh the lists
-    plex_watchlist = plex_client.fetch_plex_watchlist()
-    sc_wishlist = await sc_client.fetch_user_wishes()
-    
-    # Step 2: Remove items no longer in the other list
-    for entry in sync_data:
-        title = entry["title"]
-        year = entry["year"]
-        media_type = entry["type"]
-        status = entry["status"]
-
-        # Check if the item is still in Plex or SC
-        if status == "synced":
-            # If it's missing from Plex, remove it from SensCritique (because it was removed from Plex)
-            if not plex_watchlist or not any(p.title == title and p.year == year and p.type == media_type for p in plex_watchlist):
-                print(f"Removing '{title}' ({year}) from SensCritique wishlist... (Plex removed it)")
-                media_id = await sc_client.fetch_media_id(title, year, universe=media_type)
+    # Planning against a list that failed to load would remove every synced item from the other side
+    if plex_watchlist is None or sc_wishlist is None:
+        raise RuntimeError("Watchlist synchronization aborted: the Plex watchlist or the SensCritique wishlist could not be fetched.")
+
+    plan = plan_watchlists(plex_watchlist, sc_wishlist, get_sync_state().entries(status="synced"))
+
+    if dry_run:
+        print(plan.to_json())
+        return plan
+
+    await execute_watchlists_plan(plan)
+
+    print("Watchlist synchronization complete.")
+    return plan
+
+async def execute_watchlists_plan(plan):
+    """
+    Execute a watchlist plan, recording the sync state of the whole plan in a single commit.
+
+    Entries waiting for a SensCritique wishlist write are recorded as "pending" (added) or "removing"
+    (removed); the mutation queue confirms them once the write went through.
+    """
+    with get_sync_state().transaction():
+        for action in plan:
+            title = action["title"]
+            year = action["year"]
+            media_type = action["type"]
+
+            if action["action"] == SyncPlan.LINK:
+                entry = get_sync_state().find(plex_id=action["plex_id"])
+                if entry and entry["sc_id"] == action["sc_id"]:
+                    get_sync_state().set_status(entry["id"], "synced")
+                else:
+                    get_sync_state().add(action["plex_id"], action["sc_id"], title, year, media_type, "synced")
+
+            elif action["action"] == SyncPlan.ADD_TO_SC:
+                entry = get_sync_state().find(plex_id=action["plex_id"])
+                if entry and entry["status"] == "pending":
+                    # Its write failed during a previous run, the dead letters retry it
+                    continue
+
+                print(f"Adding '{title}' ({year}) to SensCritique wishlist...")
+                media_id = await get_sc_client().fetch_media_id(title, year, universe=media_type)
                 if media_id:
-                    await sc_client.remove_media_from_wishlist(media_id)
-                # Update the sync status
-                entry["status"] = "removed_from_sc"
+                    get_mutation_queue().wish_on_sc(media_id)
+                    get_sync_state().add(action["plex_id"], media_id, title, year, media_type, "pending")
 
-            # If it's missing from SensCritique, remove it from Plex (because it was removed from SensCritique)
-            elif not sc_wishlist or not any((s["title"] == title or s["original_title"] == title) and s["release_date"].year == year and s["universe"] == media_type for s in sc_wishlist):
-                print(f"Removing '{title}' ({year}) from Plex watchlist... (SensCritique removed it)")
-                plex_media = plex_client.search_media_in_plex(title, year, content_type=media_type)
+            elif action["action"] == SyncPlan.ADD_TO_PLEX:
+                print(f"Adding '{title}' ({year}) to Plex watchlist...")
+                plex_media = get_plex_client().search_media_in_discover(title, year, content_type=media_type)
                 if plex_media:
-                    plex_client.remove_from_plex_watchlist(plex_media)
-                # Update the sync status
-                entry["status"] = "removed_from_plex"
-            
-                        # If it's missing from both, remove from the sync data
-            if entry["status"] in ["removed_from_plex", "removed_from_sc"]:
-                print(f"Removing '{title}' ({year}) from sync data... (both removed)")
-                sync_data.remove(entry)
-
-    # Save the updated sync data
-    with open("sync_data.json", "w") as f:
-        json.dump(sync_data, f, indent=4)
+                    get_plex_client().add_to_plex_watchlist(plex_media)
+                    # Update the sync data after adding it to Plex
+                    get_sync_state().add(plex_media.guid, action["sc_id"], title, year, media_type, "synced")
 
-    print("Watchlist synchronization complete.")
+            elif action["action"] == SyncPlan.REMOVE_FROM_SC:
+                # Missing from Plex, so removed from SensCritique (because it was removed from Plex)
+                print(f"Removing '{title}' ({year}) from SensCritique wishlist... (Plex removed it)")
+                get_mutation_queue().unwish_on_sc(action["sc_id"])
+                get_sync_state().set_status(action["entry_id"], "removing")
 
-async def sync_ratings(sensCritiqueToPlex=False):
+            elif action["action"] == SyncPlan.REMOVE_FROM_PLEX:
+                # Missing from SensCritique, so removed from Plex (because it was removed from SensCritique)
+                print(f"Removing '{title}' ({year}) from Plex watchlist... (SensCritique removed it)")
+                plex_media = get_plex_client().search_media_in_plex(title, year, content_type=media_type)
+                if plex_media and get_plex_client().remove_from_plex_watchlist(plex_media):
+                    get_sync_state().remove(action["entry_id"])
+                else:
+                    # The entry stays synced, so the next run plans the removal again instead of re-adding it to SensCritique
+                    print(f"Could not remove '{title}' ({year}) from Plex watchlist, it will be retried on the next run.")
+
+    await get_mutation_queue().flush()
+
+def get_latest_rated_date(rated_items, current_watermark=None):
+    """Returns the most recent 'ratedDate' of the items, or the current watermark if none is newer."""
+    latest = parse_iso_datetime(current_watermark)
+    for item in rated_items:
+        rated_date = parse_iso_datetime(item.get("ratedDate"))
+        if rated_date and (latest is None or rated_date > latest):
+            latest = rated_date
+    return latest.isoformat() if latest else None
+
+async def sync_ratings(sensCritiqueToPlex=False, full_rescan=False, dry_run=False):
+    """
+    Sync ratings from Plex to SensCritique (and from SensCritique to Plex if asked).
+
+    Only the Plex items rated since the last successful run are fetched, unless `full_rescan` is set.
+    The SensCritique collection is always read entirely, as it exposes no rating date to stop at. With `dry_run`, the planned rating updates are only printed.
+    """
     
     print("Ratings synchronization started.")
-    
-    # Step 1: Retrieve rated items from Plex and SensCritique
-    plex_rated_items = plex_client.get_user_rated_content()
-    sens_critique_rated_items = await sc_client.get_user_rated_media()
-    
-    # Step 2: Convert SensCritique items to a set for faster comparison
-    sc_rated_set = {
-        (item["title"].lower(), item["year"]): item["rating"]
-        for item in sens_critique_rated_items
-    }
 
-    # Step 3: Sync Plex ratings to SensCritique
-    for item in plex_rated_items:
-        key = (item["title"].lower(), item["year"])
-        if key not in sc_rated_set or sc_rated_set[key] != item["rating"]:
-            
-            print(f"Rating '{item['title']}' ({item['year']}) in SensCritique with {item['rating']} stars.")
-            await sc_client.search_and_rate_media(
-                item["title"],
-                item.get("tvShowYear") or item.get("year"),
-                item["type"].lower(),
-                item["rating"],
-                item.get("reviewText"),
-                item.get("reviewHasSpoilers")
-            )
-        else:
-            print(f"Item {item['title']} ({item['year']}) already rated in SensCritique")
+    # Per-account high-water mark of the last successful run
+    plex_watermark_name = f"plex_ratings:{PLEX_USERNAME}"
+    plex_since = None if full_rescan else get_sync_state().get_watermark(plex_watermark_name)
 
-    # Step 4: Convert Plex items to a set for faster comparison
-    plex_rated_set = {
-        (item["title"].lower(), item["year"]): item["rating"]
-        for item in plex_rated_items
-    }
-
-    if(not sensCritiqueToPlex):
-        return
+    if plex_since:
+        print(f"Incremental sync: Plex ratings since {plex_since}.")
     
-    # Step 5: Sync SensCritique ratings to Plex
-    for item in sens_critique_rated_items:
-        key = (item["title"].lower(), item["year"])
-        if key not in plex_rated_set or plex_rated_set[key] != item["rating"]:
-            print(f"Rating '{item['title']}' ({item['year']}) in Plex with {item['rating']} stars.")
-            plex_client.search_and_rate_media(
-                item["title"], item["year"], item["type"], item["rating"], item["reviewText"], item["reviewHasSpoilers"]
-            )
-        else:
-            print(f"Item {item['title']} ({item['year']}) already rated in Plex")
+    # Step 1: Retrieve rated items from Plex
+    plex_rated_items = get_plex_client().get_user_rated_content(since=plex_since)
+    
+    # Step 2: Stream SensCritique items into a set for faster comparison
+    # (the items themselves are only kept when they have to be synced to Plex)
+    sc_rated_index = {}
+    sens_critique_rated_items = [] if sensCritiqueToPlex else None
+    async for item in get_sc_client().iter_user_rated_media():
+        sc_rated_index[rating_key(item)] = item["rating"]
+        if sensCritiqueToPlex:
+            sens_critique_rated_items.append(item)
+
+    # Step 3: Plan the rating updates on both sides
+    plan = plan_ratings(plex_rated_items, sc_rated_index, sens_critique_rated_items)
+
+    if dry_run:
+        print(plan.to_json())
+        return plan
+
+    # Steps 4 to 6: Sync the ratings on both sides
+    failed_actions = await execute_ratings_plan(plan)
+
+    # Step 7: Move the high-water mark now that the run succeeded, but not past a rating whose lookup failed:
+    # it (and the newer ones) are read again next time
+    synced_items = plex_rated_items
+    failed_on_sc = [action for action in failed_actions if action["action"] == SyncPlan.RATE_ON_SC]
+    if failed_on_sc:
+        print(f"{len(failed_on_sc)} ratings could not be looked up on SensCritique, they will be read again next run.")
+        failed_at = [parse_iso_datetime(action.get("ratedDate")) for action in failed_on_sc]
+        oldest_failure = None if None in failed_at else min(failed_at)
+        synced_items = [
+            item for item in plex_rated_items
+            if oldest_failure and parse_iso_datetime(item.get("ratedDate")) and parse_iso_datetime(item["ratedDate"]) < oldest_failure
+        ]
+    plex_watermark = get_latest_rated_date(synced_items, plex_since)
+    if plex_watermark:
+        get_sync_state().set_watermark(plex_watermark_name, plex_watermark)
 
 
     print("Ratings synchronization completed.")
+    return plan
+
+async def execute_ratings_plan(plan):
+    """
+    Execute a ratings plan, queueing the ratings of both services and sending them together.
+
+    A failed lookup only skips its own action: the ratings queued for the others are still sent.
+
+    Returns:
+        list: The actions whose lookup failed.
+    """
+    failed_actions = []
+
+    # Step 4: Sync Plex ratings to SensCritique
+    for action in plan.by_action(SyncPlan.RATE_ON_SC):
+        print(f"Rating '{action['title']}' ({action['year']}) in SensCritique with {action['rating']} stars.")
+        try:
+            await get_sc_client().search_and_rate_media(
+                action["title"],
+                action["year"],
+                action["type"],
+                action["rating"],
+                action["reviewText"],
+                action["reviewHasSpoilers"],
+                mutation_queue=get_mutation_queue()
+            )
+        except Exception as e:
+            print(f"Error looking up '{action['title']}' ({action['year']}) on SensCritique: {e}")
+            failed_actions.append(action)
 
-async def main():
+    # Step 5: Sync SensCritique ratings to Plex
+    for action in plan.by_action(SyncPlan.RATE_ON_PLEX):
+        print(f"Rating '{action['title']}' ({action['year']}) in Plex with {action['rating']} stars.")
+        try:
+            get_plex_client().search_and_rate_media(
+                action["title"], action["year"], action["type"], action["rating"], action["reviewText"], action["reviewHasSpoilers"],
+                mutation_queue=get_mutation_queue()
+            )
+        except Exception as e:
+            print(f"Error looking up '{action['title']}' ({action['year']}) on Plex: {e}")
+            failed_actions.append(action)
+
+    # Step 6: Send the queued ratings
+    await get_mutation_queue().flush()
+    return failed_actions
+
+async def sync_watch_history(full_rescan=False, dry_run=False):
+    """
+    Mark as done on SensCritique what was watched on the Plex server.
+
+    Only the views since the last successful run are read, unless `full_rescan` is set. Each watched
+    item is resolved once, however many times it was viewed, then joined with the done dates of the
+    SensCritique collection and of the done marks already sent: only the missing or newer done marks are sent.
+    With `dry_run`, the planned done marks are only printed.
+    """
+    print("Watch history synchronization started.")
+
+    watermark_name = f"plex_history:{PLEX_USERNAME}"
+    since = None if full_rescan else get_sync_state().get_watermark(watermark_name)
+    if since:
+        print(f"Incremental sync: Plex views since {since}.")
+
+    # Step 1: Read the Plex history, one watched item per movie or episode
+    watched_items = get_watched_items(get_plex_client(), get_plex_client().iter_watch_history(since=parse_iso_datetime(since)))
+    print(f"Found {len(watched_items)} watched items in the Plex history.")
+
+    # Step 2: Resolve them on SensCritique and plan the missing done marks
+    plan = plan_watch_history(await resolve_sc_ids(get_sc_client(), watched_items), await get_sc_done_dates())
+
+    if dry_run:
+        print(plan.to_json())
+        return plan
+
+    # Step 3: Send the done marks
+    await execute_watch_history_plan(plan)
+
+    # Step 4: Move the high-water mark now that the run succeeded, but not past an item whose lookup failed:
+    # its views (and the newer ones) are read again next time
+    failed_at = [parse_iso_datetime(item["viewedAt"]) for item in watched_items if item.get("sc_error") and item["viewedAt"]]
+    oldest_failure = min(failed_at, default=None)
+    if failed_at:
+        print(f"{len(failed_at)} watched items could not be looked up on SensCritique, they will be read again next run.")
+
+    watermark = max(
+        (item["viewedAt"] for item in watched_items
+         if item["viewedAt"] and (oldest_failure is None or parse_iso_datetime(item["viewedAt"]) < oldest_failure)),
+        default=None, key=parse_iso_datetime
+    )
+    if watermark:
+        get_sync_state().set_watermark(watermark_name, watermark)
+
+    print("Watch history synchronization completed.")
+    return plan
+
+async def get_sc_done_dates():
+    """
+    Returns the date each SensCritique product was marked done (None if it was not): from the collection
+    snapshot, or from the done marks sent by previous runs (for episodes and seasons, which are not in it).
+    """
+    collection = await get_sc_client().collection.load()
+    done_dates = {
+        product_id: (product.get("otherUserInfos") or {}).get("dateDone")
+        for product_id, product in collection.by_id.items()
+    }
+    for sc_id, done_at in get_sync_state().done_marks().items():
+        known = parse_iso_datetime(done_dates.get(sc_id))
+        if known is None or parse_iso_datetime(done_at) > known:
+            done_dates[sc_id] = done_at
+    return done_dates
+
+async def get_sc_rated_index():
+    """Returns rating_key(item) -> rating of the rated products of the SensCritique collection snapshot."""
+    collection = await get_sc_client().collection.load()
+    sc_rated_index = {}
+    for product in collection.by_id.values():
+        rating = (product.get("otherUserInfos") or {}).get("rating")
+        if rating is None:
+            continue
+        # Rated items are keyed by original title (see iter_user_rated_media), the French title is kept as well
+        for title in {product.get("originalTitle"), product.get("title")} - {None, ""}:
+            sc_rated_index[(title.lower(), product["yearOfProduction"])] = rating
+    return sc_rated_index
+
+async def drop_ratings_already_sent(plan):
+    """
+    Returns the ratings plan without the ratings the sync already sent to SensCritique (see MutationQueue),
+    which covers the episodes and seasons missing from the collection snapshot and the ratings made since it was taken.
+    """
+    kept_plan = SyncPlan(plan.name)
+    for action in plan:
+        if action["action"] == SyncPlan.RATE_ON_SC:
+            try:
+                # Items rated before are matched from the media cache, without searching SensCritique again
+                media_id = await get_sc_client().fetch_media_id(action["title"], action["year"],
+                                                               get_sc_client().get_sc_media_type_id_from_plex_text_type(action["type"]))
+            except Exception as e:
+                print(f"Error looking up '{action['title']}' ({action['year']}) on SensCritique: {e}")
+                media_id = None
+            if media_id is not None and get_sync_state().get_sc_rating(media_id) == action["rating"]:
+                continue
+        kept_plan.add(**action)
+    return kept_plan
+
+async def execute_watch_history_plan(plan):
+    """Execute a watch history plan, queueing the done marks and sending them together."""
+    for action in plan.by_action(SyncPlan.MARK_DONE_ON_SC):
+        print(f"Marking '{action['title']}' ({action['year']}) as done in SensCritique (watched on {action['viewedAt']}).")
+        get_mutation_queue().mark_done_on_sc(action["sc_id"], action["viewedAt"])
+
+    await get_mutation_queue().flush()
+
+async def sync_webhook_events(events, dry_run=False):
+    """
+    Sync the items of a batch of Plex webhook events to SensCritique.
+
+    Rated items (media.rate, and media.scrobble of a rated item) are rated on SensCritique unless the collection
+    snapshot already holds that rating, watched items (media.scrobble) are marked as done, watchlist additions
+    are added to the SensCritique wishlist and removals of synced items removed from it. With `dry_run`, the plans
+    are only printed.
+    """
+    rated_items = []
+    watched_views = []
+    watchlists_plan = SyncPlan("watchlists")
+
+    for event in events:
+        metadata = event["metadata"]
+        guid = metadata.get("guid")
+
+        if event["kind"] in (WebhookEvent.RATE, WebhookEvent.SCROBBLE):
+            item = get_plex_client().get_rated_item_from_webhook(metadata)
+            if item:
+                rated_items.append(item)
+            if event["kind"] == WebhookEvent.SCROBBLE:
+                watched_views.append(metadata)
+
+        elif event["kind"] == WebhookEvent.WATCHLIST_ADD:
+            if not get_sync_state().find(plex_id=guid):
+                watchlists_plan.add(SyncPlan.ADD_TO_SC, title=metadata.get("title"), year=metadata.get("year"),
+                                    type=metadata.get("type"), plex_id=guid)
+
+        elif event["kind"] == WebhookEvent.WATCHLIST_REMOVE:
+            entry = get_sync_state().find(plex_id=guid)
+            if entry and entry["status"] in ("synced", "pending"):
+                watchlists_plan.add(SyncPlan.REMOVE_FROM_SC, title=entry["title"], year=entry["year"],
+                                    type=entry["type"], sc_id=entry["sc_id"], entry_id=entry["id"])
+
+    # Compared with the collection snapshot and the ratings already sent, so that scrobbling an item already
+    # rated does not rate it again
+    ratings_plan = SyncPlan("ratings")
+    if rated_items:
+        ratings_plan = await drop_ratings_already_sent(plan_ratings(rated_items, await get_sc_rated_index()))
+
+    watch_history_plan = SyncPlan("watch_history")
+    if watched_views:
+        watched_items = await resolve_sc_ids(get_sc_client(), get_watched_items(get_plex_client(), watched_views))
+        watch_history_plan = plan_watch_history(watched_items, await get_sc_done_dates())
+
+    plans = (ratings_plan, watchlists_plan, watch_history_plan)
+    if dry_run:
+        for plan in plans:
+            print(plan.to_json())
+        return plans
+
+    if ratings_plan:
+        await execute_ratings_plan(ratings_plan)
+    if watchlists_plan:
+        await execute_watchlists_plan(watchlists_plan)
+    if watch_history_plan:
+        await execute_watch_history_plan(watch_history_plan)
+    return plans
+
+async def retry_dead_letters(dry_run=False):
+    """Send again the writes that failed during previous runs."""
+    if not dry_run and get_mutation_queue().retry_dead_letters():
+        with get_metrics().phase("dead_letters"):
+            await get_mutation_queue().flush()
+
+def build_daemon(dry_run=False, run_lock=None):
+    """
+    Build the daemon syncing periodically, reusing the same clients, connection pools and caches.
+
+    The watchlists, the ratings and the watch history are synced at their own interval (SYNC_WATCHLISTS_INTERVAL,
+    SYNC_RATINGS_INTERVAL and SYNC_WATCH_HISTORY_INTERVAL, 0 disables one). Ratings and watch history runs are
+    incremental, except for a full rescan every SYNC_FULL_RECONCILIATION_INTERVAL seconds.
+    """
+
+    def start_run():
+        # The per-run memoization is dropped, the media cache and the collection snapshot are kept
+        if sc_client is not None:
+            sc_client.start_run()
+
+    async def run_sync_watchlists(full):
+        start_run()
+        await retry_dead_letters(dry_run)
+        await sync_watchlists(dry_run=dry_run)
+
+    async def run_sync_ratings(full):
+        start_run()
+        await retry_dead_letters(dry_run)
+        await sync_ratings(full_rescan=full, dry_run=dry_run)
+
+    async def run_sync_watch_history(full):
+        start_run()
+        await retry_dead_letters(dry_run)
+        await sync_watch_history(full_rescan=full, dry_run=dry_run)
+
+    jobs = [
+        SyncJob(name, run, interval)
+        for name, run, interval in (
+            ("sync_watchlists", run_sync_watchlists, SYNC_WATCHLISTS_INTERVAL),
+            ("sync_ratings", run_sync_ratings, SYNC_RATINGS_INTERVAL),
+            ("sync_watch_history", run_sync_watch_history, SYNC_WATCH_HISTORY_INTERVAL)
+        )
+        if interval > 0
+    ]
+    return SyncDaemon(jobs, get_sync_state(), run_lock)
+
+def build_webhook_receiver(dry_run=False, run_lock=None):
+    """Build the receiver syncing the items of the Plex webhook events (see sync_webhook_events)."""
+
+    async def handle_events(events):
+        with get_metrics().phase("webhook"):
+            await sync_webhook_events(events, dry_run=dry_run)
+
+    return PlexWebhookReceiver(handle_events, run_lock=run_lock)
+
+async def main(full_rescan=False, dry_run=False, daemon=False, webhook=False, watch_history=False):
     
-    # await sync_watchlists()
-    await sync_ratings()
+    try:
+        # Per-phase reports are always written, the /metrics endpoint is opt-in
+        metrics = get_metrics()
+        if METRICS_PORT:
+            metrics.start_server(METRICS_PORT)
+
+        if daemon or webhook:
+            # Scheduled runs and webhook batches take turns, they share the mutation queue and the sync state
+            run_lock = asyncio.Lock()
+            services = []
+            if daemon:
+                services.append(build_daemon(dry_run, run_lock))
+            if webhook:
+                services.append(build_webhook_receiver(dry_run, run_lock))
+
+            stop_on_signals(lambda: [service.stop() for service in services])
+            await asyncio.gather(*(service.run_forever() for service in services))
+            return
+
+        # Writes that failed during previous runs go first
+        await retry_dead_letters(dry_run)
+
+        # with metrics.phase("sync_watchlists"):
+        #     await sync_watchlists(dry_run=dry_run)
+        with metrics.phase("sync_ratings"):
+            await sync_ratings(full_rescan=full_rescan, dry_run=dry_run)
+        if watch_history:
+            with metrics.phase("sync_watch_history"):
+                await sync_watch_history(full_rescan=full_rescan, dry_run=dry_run)
+    finally:
+        print(f"Media cache: {get_media_cache().stats()}")
+        if sc_client is not None:
+            await sc_client.client.aclose()
     
 
 if __name__ == "__main__":
-    asyncio.run(main())  # This will run the async main function
+    parser = argparse.ArgumentParser(description="Sync Plex and SensCritique.")
+    parser.add_argument("--full-rescan", action="store_true", help="Ignore the last run and fetch every rating again.")
+    parser.add_argument("--dry-run", action="store_true", help="Print the planned changes as JSON without writing anything.")
+    parser.add_argument("--daemon", action="store_true", help="Keep running and sync periodically instead of syncing once.")
+    parser.add_argument("--webhook", action="store_true", help="Keep running and sync the items of the Plex webhook events.")
+    parser.add_argument("--watch-history", action="store_true", help="Also mark as done on SensCritique what was watched on Plex.")
+    args = parser.parse_args()
+
+    asyncio.run(main(
+        full_rescan=args.full_rescan, dry_run=args.dry_run, daemon=args.daemon, webhook=args.webhook,
+        watch_history=args.watch_history
+    ))  # This will run the async main function
@@ -0,0 +1,185 @@
+import os
+import time
+import threading
+from dotenv import load_dotenv
+from utils.media_cache import normalize_title
+from utils.metrics import get_metrics
+from plex.plex_client import PLEX_SERVER_PAGE_SIZE, SERVER_TYPES
+
+# Load environment variables
+load_dotenv()
+
+# Seconds during which the index answers without asking the server whether its sections changed
+PLEX_LIBRARY_INDEX_TTL = int(os.getenv("PLEX_LIBRARY_INDEX_TTL", "300"))
+
+# Kinds of library sections indexed, each for the items of its own type
+INDEXED_SECTION_TYPES = ("movie", "show")
+
+
+def _sort_key(indexed):
+    """Orders (section key, listing element) pairs by section, then ratingKey, numerically when they are numbers."""
+    section_key, element = indexed
+    return tuple((0, int(key), "") if str(key).isdigit() else (1, 0, str(key)) for key in (section_key, element.get("ratingKey")))
+
+
+class LibraryIndex:
+    """
+    In-memory index of the movies and shows of the local Plex server, by normalized title and year, and by guid.
+
+    The index is built from one paged listing per section (with their imdb://, tmdb://, tvdb:// and plex:// guids).
+    Once older than `ttl` seconds, the next lookup asks the server for its sections: only those whose `updatedAt`
+    changed are read again, and only their items updated since the last refresh. A section whose item count no
+    longer matches (items were deleted) is listed again entirely.
+    """
+
+    def __init__(self, plex_client, ttl=PLEX_LIBRARY_INDEX_TTL, page_size=PLEX_SERVER_PAGE_SIZE):
+        self.plex_client = plex_client
+        self.ttl = ttl
+        self.page_size = page_size
+        self.lock = threading.RLock()
+        self.refreshed_at = None
+
+        self.sections = {}  # section key -> {"type", "updatedAt", "items": set of ratingKeys}
+        self.items = {}  # ratingKey -> (section key, listing element)
+        self.by_title = {}  # (normalized title, year) -> set of ratingKeys
+        self.by_guid = {}  # guid -> ratingKey
+
+    def __len__(self):
+        return len(self.items)
+
+    def find(self, title, year=None, content_type=None):
+        """
+        Finds the indexed items with this title (or original title).
+
+        Args:
+            title (str): Title of the media, compared once normalized.
+            year (int): Year of the media, None for any year.
+            content_type (str): 'movie' or 'show', None for both.
+
+        Returns:
+            list: (section key, listing element) of the matching items, by section then ratingKey.
+        """
+        self.refresh_if_stale()
+
+        with self.lock:
+            if year is not None:
+                rating_keys = self.by_title.get((normalize_title(title), int(year)), set())
+            else:
+                normalized = normalize_title(title)
+                rating_keys = {key for (indexed_title, _), keys in self.by_title.items() if indexed_title == normalized for key in keys}
+
+            matches = sorted((self.items[key] for key in rating_keys), key=_sort_key)
+            if content_type:
+                matches = [(section_key, element) for section_key, element in matches if element.get("type") == content_type]
+
+        get_metrics().record_cache("plex_library_index", hits=1 if matches else 0, misses=0 if matches else 1)
+        return matches
+
+    def get_by_guid(self, guid):
+        """Returns (section key, listing element) of the item with this guid ('imdb://tt0133093', 'plex://movie/...'), or None."""
+        self.refresh_if_stale()
+
+        with self.lock:
+            rating_key = self.by_guid.get(guid)
+            return self.items.get(rating_key) if rating_key else None
+
+    def refresh_if_stale(self):
+        if self.refreshed_at is None or time.time() - self.refreshed_at > self.ttl:
+            self.refresh()
+
+    def refresh(self):
+        """Builds the index, or updates the sections that changed since the last refresh."""
+        with self.lock:
+            started_at = time.time()
+            server_sections = {
+                element.get("key"): element
+                for element in self.plex_client._iter_server_elements("/library/sections")
+                if element.tag == "Directory" and element.get("type") in INDEXED_SECTION_TYPES
+            }
+
+            # Removed sections
+            for section_key in set(self.sections) - set(server_sections):
+                self._drop_section(section_key)
+
+            for section_key, section in server_sections.items():
+                known = self.sections.get(section_key)
+                if known and known["updatedAt"] == section.get("updatedAt"):
+                    continue
+
+                if known:
+                    # Items updated (or added) since the last refresh, with a margin for clock differences
+                    updated_since = int(self.refreshed_at) - 60
+                    total_size = self._read_section(section_key, section.get("type"), f"&updatedAt>>={updated_since}")
+                    if self._count_section(section_key, section.get("type")) != len(known["items"]):
+                        self._drop_section(section_key)
+                        total_size = self._read_section(section_key, section.get("type"))
+                    print(f"Updated {total_size} items of Plex library section {section_key} in the index.")
+                else:
+                    self._read_section(section_key, section.get("type"))
+
+                self.sections[section_key]["updatedAt"] = section.get("updatedAt")
+
+            self.refreshed_at = started_at
+
+    def _read_section(self, section_key, section_type, filters=""):
+        """Indexes the items of a section listing, one page per request. Returns how many were read."""
+        type_number = SERVER_TYPES[section_type]
+        section = self.sections.setdefault(section_key, {"type": section_type, "updatedAt": None, "items": set()})
+        path = f"/library/sections/{section_key}/all?type={type_number}&includeGuids=1{filters}"
+        page_size = self.page_size
+
+        start = 0
+        while True:
+            headers = {"X-Plex-Container-Start": str(start), "X-Plex-Container-Size": str(page_size)}
+            count = 0
+            for element in self.plex_client._iter_server_elements(path, headers):
+                if element.tag != "MediaContainer":
+                    self._add(section_key, element)
+                    section["items"].add(element.get("ratingKey"))
+                    count += 1
+
+            start += count
+            if count < page_size:
+                return start
+
+    def _count_section(self, section_key, section_type):
+        """Number of items of a section, as reported by the server (an empty page only holds the total)."""
+        path = f"/library/sections/{section_key}/all?type={SERVER_TYPES[section_type]}"
+        headers = {"X-Plex-Container-Start": "0", "X-Plex-Container-Size": "0"}
+        for element in self.plex_client._iter_server_elements(path, headers):
+            return int(element.get("totalSize") or element.get("size") or 0)
+        return 0
+
+    def _add(self, section_key, element):
+        rating_key = element.get("ratingKey")
+        self._remove(rating_key)
+
+        self.items[rating_key] = (section_key, element)
+        year = int(element.get("year")) if element.get("year") else None
+        for title in {normalize_title(element.get("title")), normalize_title(element.get("originalTitle"))} - {""}:
+            self.by_title.setdefault((title, year), set()).add(rating_key)
+        for guid in [element.get("guid")] + [child.get("id") for child in element.iter("Guid")]:
+            if guid:
+                self.by_guid[guid] = rating_key
+
+    def _remove(self, rating_key):
+        indexed = self.items.pop(rating_key, None)
+        if indexed is None:
+            return
+
+        _, element = indexed
+        year = int(element.get("year")) if element.get("year") else None
+        for title in {normalize_title(element.get("title")), normalize_title(element.get("originalTitle"))}:
+            rating_keys = self.by_title.get((title, year))
+            if rating_keys:
+                rating_keys.discard(rating_key)
+                if not rating_keys:
+                    del self.by_title[(title, year)]
+        for guid in [element.get("guid")] + [child.get("id") for child in element.iter("Guid")]:
+            if self.by_guid.get(guid) == rating_key:
+                del self.by_guid[guid]
+
+    def _drop_section(self, section_key):
+        section = self.sections.pop(section_key, None)
+        for rating_key in (section or {}).get("items", ()):
+            self._remove(rating_key)
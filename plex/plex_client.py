@@ -1,27 +1,97 @@
-from plexapi.myplex import MyPlexAccount
-from plexapi.exceptions import BadRequest
-from plexapi.server import PlexServer
 from dotenv import load_dotenv
 import os
+import threading
+from datetime import datetime, timezone
+from urllib.parse import urlencode
 from xml.etree import ElementTree
+from utils.media_cache import MediaCache, get_media_cache
+from utils.dates import is_older_than
+from plex.watchlist_item import WatchlistItem
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from utils.rate_limiter import RateLimitedAdapter
 import requests
 
+# Load environment variables
+load_dotenv()
+
 PLEX_TOKEN = os.getenv("PLEX_TOKEN")
 PLEX_USERNAME = os.getenv("PLEX_USERNAME")
 PLEX_SERVER_ADDRESS = os.getenv("PLEX_SERVER_ADDRESS")
 
-# Load environment variables
-load_dotenv()
+# Plex online services (overridable to point the client at local stand-ins, see benchmarks/)
+PLEX_COMMUNITY_URL = os.getenv("PLEX_COMMUNITY_URL", "https://community.plex.tv")
+PLEX_DISCOVER_URL = os.getenv("PLEX_DISCOVER_URL", "https://discover.provider.plex.tv")
+PLEX_METADATA_URL = os.getenv("PLEX_METADATA_URL", "https://metadata.provider.plex.tv")
+
+# HTTP tuning
+PLEX_HTTP_POOL_SIZE = int(os.getenv("PLEX_HTTP_POOL_SIZE", "10"))
+PLEX_TITLES_BATCH_SIZE = int(os.getenv("PLEX_TITLES_BATCH_SIZE", "20"))
+PLEX_REVIEWS_PAGE_SIZE = int(os.getenv("PLEX_REVIEWS_PAGE_SIZE", "100"))
+PLEX_HISTORY_PAGE_SIZE = int(os.getenv("PLEX_HISTORY_PAGE_SIZE", "200"))
+PLEX_SERVER_PAGE_SIZE = int(os.getenv("PLEX_SERVER_PAGE_SIZE", "500"))
+
+# Local server item types (as numbered by the Plex API), and those listed in each kind of library section
+SERVER_TYPES = {"movie": 1, "show": 2, "season": 3, "episode": 4}
+SERVER_SECTION_TYPES = {"movie": ("movie",), "show": ("show", "season", "episode")}
+
+# Local server account whose watch history is synced (1 is the server owner)
+PLEX_HISTORY_ACCOUNT_ID = os.getenv("PLEX_HISTORY_ACCOUNT_ID", "1")
 
 class PlexClient:
-    def __init__(self):
+    def __init__(self, media_cache=None):
         """Initialize with an authenticated Plex account."""
-        self.account = MyPlexAccount(PLEX_USERNAME, token=PLEX_TOKEN)
-        self.plex = PlexServer(PLEX_SERVER_ADDRESS, PLEX_TOKEN)
+        # Keep-alive connections shared by every HTTP call to Plex (plexapi included), throttled per host
+        self.session = requests.Session()
+        adapter = RateLimitedAdapter(pool_connections=PLEX_HTTP_POOL_SIZE, pool_maxsize=PLEX_HTTP_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # except the local server, which is not a shared online service (the longest mounted prefix wins)
+        if PLEX_SERVER_ADDRESS:
+            self.session.mount(PLEX_SERVER_ADDRESS.rstrip("/") + "/", RateLimitedAdapter(
+                throttle=False, pool_connections=PLEX_HTTP_POOL_SIZE, pool_maxsize=PLEX_HTTP_POOL_SIZE
+            ))
+
+        # plexapi objects, connected on first use (the local server is only needed by server-side methods)
+        self._account = None
+        self._plex = None
+        self._library_index = None
+        self.connect_lock = threading.Lock()
+
         self.useruuid = None
+        self.media_cache = media_cache or get_media_cache()
+
+        # Bounded pool running the blocking enrichment calls (created on first use)
+        self.executor = None
+
+    @property
+    def account(self):
+        """The plex.tv account (watchlist, Discover search), signed in on first use."""
+        with self.connect_lock:
+            if self._account is None:
+                from plexapi.myplex import MyPlexAccount
+                self._account = MyPlexAccount(PLEX_USERNAME, token=PLEX_TOKEN, session=self.session)
+            return self._account
+
+    @property
+    def plex(self):
+        """The local Plex Media Server, connected on first use."""
+        with self.connect_lock:
+            if self._plex is None:
+                from plexapi.server import PlexServer
+                self._plex = PlexServer(PLEX_SERVER_ADDRESS, PLEX_TOKEN, session=self.session)
+            return self._plex
+
+    def get_executor(self):
+        """Returns the thread pool used for concurrent Plex calls."""
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=PLEX_HTTP_POOL_SIZE)
+        return self.executor
   
     def add_to_plex_watchlist(self, plex_media):
         """Add a movie or TV show to the Plex watchlist using its media object."""
+        from plexapi.exceptions import BadRequest, NotFound
+
         try:
             # Add to Plex watchlist
             self.account.addToWatchlist(plex_media)
@@ -34,51 +104,142 @@ class PlexClient:
         except Exception as e:
             print(f"Error adding media with Plex ID {plex_media.guid} to watchlist: {e}")
 
-    def fetch_plex_watchlist(self):
-            """Fetches the current watchlist from Plex."""
+    def fetch_plex_watchlist(self, enrich=False):
+            """
+            Fetches the current watchlist from Plex.
+
+            The returned items only cost the watchlist request itself. Their `added_at` and `frenchTitle`
+            are fetched lazily when read; `enrich=True` fetches them for every item right away, in parallel.
+
+            Returns:
+                list: The watchlist items, or None if the watchlist could not be fetched.
+            """
             try:
                 # Retrieve the user's watchlist
-                watchlist = self.account.watchlist()
+                watchlist = [WatchlistItem(item, self) for item in self.account.watchlist()]
                 print("Plex Watchlist:")
+
+                if enrich:
+                    for item in watchlist:
+                        item.prefetch()
                 
                 # Display each item in the watchlist
                 for item in watchlist:
-                    # Fetch user state (this will include the date when the item was added to the watchlist)
-                    user_state = self.account.userState(item)
-                    
-                    
-                    item.frenchTitle = self.get_french_title(item.key, idIsKey=True)
-                    
-                    item.added_at = user_state.watchlistedAt if user_state.watchlistedAt else "Unknown"
-                    
-                    print(f"- {item.title} ({item.year}) Added to Watchlist at {item.added_at}")
+                    if enrich:
+                        print(f"- {item.title} ({item.year}) Added to Watchlist at {item.added_at}")
+                    else:
+                        print(f"- {item.title} ({item.year})")
                     
                 return watchlist
             
             except Exception as e:
                 print(f"Error fetching Plex watchlist: {e}")
+                return None
 
     def remove_from_plex_watchlist(self, plex_media):
-        """Remove a movie or TV show from the Plex watchlist using its media object."""
+        """
+        Remove a movie or TV show from the Plex watchlist using its media object.
+
+        Returns:
+            bool: True if the media is no longer on the watchlist, False if the removal failed.
+        """
+        from plexapi.exceptions import BadRequest, NotFound
+
         try:
             # Remove from Plex watchlist using the media's ratingKey
             self.account.removeFromWatchlist(plex_media)
             print(f"Successfully removed {plex_media.title} ({plex_media.year}) from the Plex watchlist.")
+            return True
 
         except BadRequest as e:
+            # plexapi refuses to remove what is not on the watchlist, which is what was asked
+            if "not on the watchlist" in str(e):
+                return True
             print(f"Bad request: {e}")
         except NotFound as e:
             print(f"Not found: {e}")
         except Exception as e:
             print(f"Error removing media with Plex ID {plex_media.guid} from watchlist: {e}")
+        return False
             
-    def get_user_rated_content(self, frenchTitles=True):
-        """Retrieve all films, series, seasons, and episodes with ratings from Plex Discover."""
-        rated_media = []
-        end_cursor = None  # To manage pagination
+    def get_user_rated_content(self, frenchTitles=True, since=None, page_size=PLEX_REVIEWS_PAGE_SIZE):
+        """
+        Retrieve all films, series, seasons, and episodes with ratings from Plex Discover.
+
+        Collects `iter_user_rated_content` into a list, see it for the arguments.
+
+        Returns:
+            list: The rated items.
+        """
+        return list(self.iter_user_rated_content(frenchTitles, since, page_size))
+
+    def iter_user_rated_content(self, frenchTitles=True, since=None, page_size=PLEX_REVIEWS_PAGE_SIZE):
+        """
+        Stream the films, series, seasons, and episodes with ratings from Plex Discover.
+
+        Pages are pipelined: page N+1 is requested on the thread pool as soon as the cursor of page N is known,
+        while the nodes of page N are processed (French titles, formatting) and yielded.
+
+        Args:
+            frenchTitles (bool): Whether to replace titles by their French version.
+            since (str|datetime): Only return items rated at or after this date. Reviews come newest first,
+                so paging stops at the first page reaching older items. None fetches everything.
+            page_size (int): Number of reviews per request.
+
+        Yields:
+            dict: A rated item.
+        """
+        user_uuid = self.get_user_id_by_username(PLEX_USERNAME)
+        executor = self.get_executor()
+
+        next_page = executor.submit(self._fetch_reviews_page, user_uuid, page_size, None)
+        try:
+            while next_page:
+                page = next_page.result()
+                next_page = None
 
+                if page is None:
+                    break
+
+                nodes, end_cursor, has_next_page = page
+
+                # Start downloading the next page before processing this one
+                if has_next_page:
+                    next_page = executor.submit(self._fetch_reviews_page, user_uuid, page_size, end_cursor)
+
+                rated_nodes = []
+                reached_since = False
+                for node in nodes:
+                    # Already synced during a previous run
+                    if since and is_older_than(node.get("date"), since):
+                        reached_since = True
+                        continue
+
+                    if node.get("metadataItem") and (node.get("rating") or node.get("reviewRating")):
+                        rated_nodes.append(node)
+
+                # Resolve the French titles of the whole page at once
+                french_titles = {}
+                if frenchTitles:
+                    french_titles = self.get_french_titles([node["metadataItem"].get("id") for node in rated_nodes])
+
+                for node in rated_nodes:
+                    yield self._get_rated_item_from_review(node, french_titles)
+
+                if reached_since:
+                    break
+        finally:
+            if next_page:
+                next_page.cancel()
+
+    def _fetch_reviews_page(self, user_uuid, page_size, after):
+        """
+        Fetch one page of the user's GetReviewsHub.
+
+        Returns:
+            tuple: (nodes, endCursor, hasNextPage), or None if the request failed.
+        """
         headers = {
-            "Host": "community.plex.tv",
             "Content-Type": "application/json",
             "Accept": "application/json",
             "X-Plex-Language": "fr",
@@ -211,91 +372,185 @@ class PlexClient:
         }
         """
 
-        user_uuid = self.get_user_id_by_username(PLEX_USERNAME)
+        payload = {
+            "query": graphql_query,
+            "variables": {
+                "uuid": user_uuid,
+                "first": page_size,
+                "after": after
+            },
+            "operationName": "GetReviewsHub"
+        }
 
-        while True:
-            payload = {
-                "query": graphql_query,
-                "variables": {
-                    "uuid": user_uuid,
-                    "first": 100,
-                    "after": end_cursor
-                },
-                "operationName": "GetReviewsHub"
-            }
+        response = self.session.post(f"{PLEX_COMMUNITY_URL}/api", headers=headers, json=payload)
 
-            response = requests.post("https://community.plex.tv/api", headers=headers, json=payload)
+        if response.status_code == 200:
+            data = response.json()
+            reviews = ((data.get("data") or {}).get("user") or {}).get("reviews") or {}
+            page_info = reviews.get("pageInfo") or {}
+            return reviews.get("nodes") or [], page_info.get("endCursor"), page_info.get("hasNextPage")
+
+        print(f"Failed to fetch rated content. Status: {response.status_code}, Response: {response.text}")
+        return None
+
+    def _get_rated_item_from_review(self, node, french_titles):
+        """Convert a GetReviewsHub node into a rated item."""
+        metadata = node.get("metadataItem", {})
+        rating = node.get("rating") or node.get("reviewRating")
+        reviewText = (node.get("message") or "").strip()
+        reviewHasSpoilers = node.get("hasSpoilers", False)
+        ratedDate = node.get("date")
+
+        id = metadata.get("id")
+        item_type = metadata.get("type")
+
+        french_title = french_titles.get(id)
+        title = french_title if french_title else metadata.get("title")
+
+        year = metadata.get("year")
+        item = {
+            "id": id,
+            "title": title,
+            "type": item_type,
+            "year": year,
+            "rating": rating,
+            "ratedDate": ratedDate
+        }
 
-            if response.status_code == 200:
-                data = response.json()
-                nodes = data.get("data", {}).get("user", {}).get("reviews", {}).get("nodes", [])
-                page_info = data.get("data", {}).get("user", {}).get("reviews", {}).get("pageInfo", {})
-                end_cursor = page_info.get("endCursor")
-                has_next_page = page_info.get("hasNextPage")
+        if reviewText:
+            item["reviewText"] = reviewText
+            item["reviewHasSpoilers"] = reviewHasSpoilers
 
-                for node in nodes:
-                    metadata = node.get("metadataItem", {})
-                    rating = node.get("rating") or node.get("reviewRating")
-                    reviewText = node.get("message", "").strip()
-                    reviewHasSpoilers = node.get("hasSpoilers", False)
-                    ratedDate = node.get("date")
-
-                    if metadata and rating:
-                        id = metadata.get("id")
-                        item_type = metadata.get("type")
-
-                        french_title = self.get_french_title(id) if frenchTitles else None
-                        title = french_title if french_title else metadata.get("title")
-
-                        year = metadata.get("year")
-                        item = {
-                            "id": id,
-                            "title": title,
-                            "type": item_type,
-                            "year": year,
-                            "rating": rating,
-                            "ratedDate": ratedDate
-                        }
-
-                        if reviewText:
-                            item["reviewText"] = reviewText
-                            item["reviewHasSpoilers"] = reviewHasSpoilers
-
-                        if item_type == "EPISODE":
-                            parent = metadata.get("parent", {})
-                            grandparent = metadata.get("grandparent", {})
-                            season = parent.get("index")
-                            episode = metadata.get("index")
-                            item["tvShowYear"] = grandparent.get("year")
-                            item["title"] = f"{grandparent.get('title', 'Unknown Show')} - S{str(season).zfill(2)}E{str(episode).zfill(2)} - {title}"
-                        elif item_type == "SEASON":
-                            parent = metadata.get("parent", {})
-                            item["title"] = f"{parent.get('title', 'Unknown Show')} - Season {metadata.get('index')}"
-
-                        rated_media.append(item)
-
-                if not has_next_page:
-                    break
-            else:
-                print(f"Failed to fetch rated content. Status: {response.status_code}, Response: {response.text}")
-                break
+        if item_type == "EPISODE":
+            parent = metadata.get("parent", {})
+            grandparent = metadata.get("grandparent", {})
+            season = parent.get("index")
+            episode = metadata.get("index")
+            item["tvShowYear"] = grandparent.get("year")
+            item["title"] = f"{grandparent.get('title', 'Unknown Show')} - S{str(season).zfill(2)}E{str(episode).zfill(2)} - {title}"
+        elif item_type == "SEASON":
+            parent = metadata.get("parent", {})
+            item["title"] = f"{parent.get('title', 'Unknown Show')} - Season {metadata.get('index')}"
+
+        return item
+
+    def get_rated_item_from_webhook(self, metadata, frenchTitles=True):
+        """
+        Convert the metadata of a Plex webhook event into a rated item, like those of `iter_user_rated_content`.
+
+        Args:
+            metadata (dict): The "Metadata" object of the webhook payload (from the local server).
+            frenchTitles (bool): Whether to replace the title by its French version.
+
+        Returns:
+            dict: The rated item, or None if the item has no rating.
+        """
+        if not metadata.get("userRating"):
+            return None
+
+        # Items matched by the Plex agent have a 'plex://<type>/<Discover id>' guid
+        guid = metadata.get("guid") or ""
+        id = guid.rsplit("/", 1)[-1] if guid.startswith("plex://") else None
+
+        # The parent of an episode is its season, the parent of a season is its show
+        item_type = (metadata.get("type") or "").upper()
+        parent = {"index": metadata.get("parentIndex"), "title": metadata.get("parentTitle")}
+        grandparent = {"title": metadata.get("grandparentTitle"), "year": metadata.get("grandparentYear")}
+
+        rated_at = metadata.get("lastRatedAt")
+        node = {
+            "metadataItem": {
+                "id": id,
+                "title": metadata.get("title"),
+                "type": item_type,
+                "year": metadata.get("year"),
+                "index": metadata.get("index"),
+                "parent": parent,
+                "grandparent": grandparent
+            },
+            "rating": round(metadata["userRating"]),
+            "date": datetime.fromtimestamp(rated_at, timezone.utc).isoformat() if rated_at else None
+        }
+
+        french_titles = self.get_french_titles([id]) if frenchTitles and id else {}
+        return self._get_rated_item_from_review(node, french_titles)
+
+    def iter_watch_history(self, since=None, account_id=PLEX_HISTORY_ACCOUNT_ID, page_size=PLEX_HISTORY_PAGE_SIZE):
+        """
+        Stream the views of the local Plex server history, newest first.
+
+        The history is read `page_size` views per request (X-Plex-Container-Start/Size), page N+1 being
+        requested on the thread pool while page N is yielded. Views are read from the raw XML, plexapi objects
+        would reload every view missing an attribute.
+
+        Args:
+            since (datetime): Only return the views after this date. None reads the whole history.
+            account_id (str): Only return the views of this server account (1 is the server owner), None for all.
+            page_size (int): Number of views per request.
+
+        Yields:
+            dict: A view, with the attributes of the history entry ("ratingKey", "type", "title", "viewedAt"...).
+        """
+        args = {"sort": "viewedAt:desc"}
+        if account_id:
+            args["accountID"] = account_id
+        if since:
+            args["viewedAt>"] = int(since.timestamp())
+        key = f"/status/sessions/history/all?{urlencode(args)}"
+
+        def fetch_page(start):
+            headers = {"X-Plex-Container-Start": str(start), "X-Plex-Container-Size": str(page_size)}
+            container = self.plex.query(key, headers=headers)
+            return [dict(element.attrib) for element in container] if container is not None else []
+
+        executor = self.get_executor()
+        start = 0
+        next_page = executor.submit(fetch_page, start)
+        try:
+            while next_page:
+                views = next_page.result()
+                next_page = None
+
+                start += len(views)
+                if len(views) == page_size:
+                    next_page = executor.submit(fetch_page, start)
+
+                yield from views
+        finally:
+            if next_page:
+                next_page.cancel()
+
+    def fetch_server_metadata(self, rating_keys, batch_size=PLEX_HISTORY_PAGE_SIZE):
+        """
+        Fetch the metadata of many items of the local Plex server, `batch_size` items per request.
+
+        Returns:
+            dict: ratingKey -> attributes of the item, for the items that still exist.
+        """
+        rating_keys = list(dict.fromkeys(str(rating_key) for rating_key in rating_keys if rating_key))
+        batches = [rating_keys[i:i + batch_size] for i in range(0, len(rating_keys), batch_size)]
+
+        def fetch_batch(batch):
+            container = self.plex.query(f"/library/metadata/{','.join(batch)}")
+            return [dict(element.attrib) for element in container] if container is not None else []
 
-        return rated_media
+        metadata = {}
+        for items in self.get_executor().map(fetch_batch, batches):
+            metadata.update((item.get("ratingKey"), item) for item in items)
+        return metadata
 
     def get_french_title(self, id, idIsKey=False):
-        headers = {
-                "Accept": "application/json",
-                "Host": "discover.provider.plex.tv",
-                "X-Plex-Language": "fr",
-                "X-Plex-Token": PLEX_TOKEN
-            }
-        
+        if not idIsKey:
+            cached_titles = self.media_cache.get_localized_titles([id], "fr")
+            if id in cached_titles:
+                return cached_titles[id]
+
         if idIsKey:
-            url = f"https://discover.provider.plex.tv{id}"
+            url = f"{PLEX_DISCOVER_URL}{id}"
         else:
-            url = f"https://discover.provider.plex.tv/library/metadata/{id}"
+            url = f"{PLEX_DISCOVER_URL}/library/metadata/{id}"
         
-        response = requests.get(url, headers=headers)
+        response = self.session.get(url, headers=self._get_discover_headers())
         
         if response.status_code == 200:
             data = response.json()
@@ -303,11 +558,78 @@ class PlexClient:
             
             if metadata:
                 french_title = metadata[0].get("title", {})
+
+                if not idIsKey:
+                    self.media_cache.set_localized_titles({id: french_title}, "fr")
                 
                 return french_title
-                
-                
-        
+
+    def get_french_titles(self, ids, batch_size=PLEX_TITLES_BATCH_SIZE):
+        """
+        Retrieve the French titles of many Plex Discover metadata items.
+
+        Titles are read from the localized-title cache first. Missing ones are fetched `batch_size` ids per
+        request (comma-separated ids), batches running concurrently on the pooled session. A batch the
+        provider refuses falls back to one request per id.
+
+        Args:
+            ids (list): Plex Discover metadata ids.
+            batch_size (int): Number of ids per request.
+
+        Returns:
+            dict: metadata id -> French title, for the ids that could be resolved.
+        """
+        ids = list(dict.fromkeys(id for id in ids if id))
+        french_titles = self.media_cache.get_localized_titles(ids, "fr")
+
+        missing_ids = [id for id in ids if id not in french_titles]
+        if not missing_ids:
+            return french_titles
+
+        batches = [missing_ids[i:i + batch_size] for i in range(0, len(missing_ids), batch_size)]
+        with ThreadPoolExecutor(max_workers=min(PLEX_HTTP_POOL_SIZE, len(batches))) as executor:
+            for batch_titles in executor.map(self._fetch_french_titles_batch, batches):
+                french_titles.update(batch_titles)
+
+        self.media_cache.set_localized_titles({id: french_titles[id] for id in missing_ids if id in french_titles}, "fr")
+        return french_titles
+
+    def _fetch_french_titles_batch(self, ids):
+        """
+        Fetch the French titles of a batch of ids in one request.
+
+        Ids missing from the batch response (or all of them, if the batch fails) fall back to one request per id.
+        """
+        url = f"{PLEX_DISCOVER_URL}/library/metadata/{','.join(ids)}"
+
+        titles = {}
+        try:
+            response = self.session.get(url, headers=self._get_discover_headers())
+            if response.status_code == 200:
+                metadata = response.json().get("MediaContainer", {}).get("Metadata", [])
+                titles = {item.get("ratingKey"): item.get("title") for item in metadata if item.get("title") and item.get("ratingKey") in ids}
+                if len(ids) == 1:
+                    return titles
+        except Exception as e:
+            print(f"Error fetching French titles in batch: {e}")
+
+        for id in ids:
+            if id in titles:
+                continue
+            try:
+                french_title = self.get_french_title(id)
+                if french_title:
+                    titles[id] = french_title
+            except Exception as e:
+                print(f"Error fetching French title of {id}: {e}")
+        return titles
+
+    def _get_discover_headers(self):
+        return {
+            "Accept": "application/json",
+            "X-Plex-Language": "fr",
+            "X-Plex-Token": PLEX_TOKEN
+        }
     
     def rate_media_with_ratingKey(self, media, rating):
         
@@ -346,6 +668,11 @@ class PlexClient:
         Returns:
             dict: A dictionary representing the detailed media metadata with the ratingKey, or None if not found.
         """
+        # Items matched during a previous run are served from the on-disk cache
+        cached_media = self.media_cache.get(MediaCache.PLEX, title, year, content_type)
+        if cached_media:
+            return cached_media
+
         try:
             # Perform global search using searchDiscover
             results = self.account.searchDiscover(title, libtype=content_type)
@@ -358,9 +685,9 @@ class PlexClient:
             for result in results:
                 if (year and result.year == year) or not year:
                     # Fetch detailed metadata to get the ratingKey
-                    url = f"https://metadata.provider.plex.tv{result.key}"
+                    url = f"{PLEX_METADATA_URL}{result.key}"
                     params = {"X-Plex-Token": PLEX_TOKEN}
-                    response = requests.get(url, params=params)
+                    response = self.session.get(url, params=params)
 
                     if response.status_code == 200:
                         tree = ElementTree.fromstring(response.text)
@@ -376,11 +703,14 @@ class PlexClient:
                             
                         
                         if ratingKey:
-                            return {
+                            media = {
                                 "title": result.title,
                                 "year": result.year,
-                                "ratingKey": ratingKey
+                                "ratingKey": ratingKey,
+                                "guid": result.guid
                             }
+                            self.media_cache.set(MediaCache.PLEX, title, year, content_type, media)
+                            return media
                     else:
                         print(f"Failed to fetch global metadata. Status code: {response.status_code}")
                         
@@ -391,27 +721,28 @@ class PlexClient:
             print(f"Error searching for {title} ({year}) in Plex Discover: {e}")
             return None
         
-    def search_media_in_server(self, title, year, content_type):
+    def search_media_in_server(self, title, year, content_type=None):
         """
         Search for media in Plex based on title, year, and content type.
 
+        Lookups are answered by the in-memory library index (see `LibraryIndex`), built once from the
+        section listings and refreshed incrementally, instead of one search request per library section.
+
         Args:
             title (str): The title of the media to search for.
             year (int): The year of the media.
-            content_type (str): The type of content ('movie' or 'show').
+            content_type (str): The type of content ('movie' or 'show'), None for both.
 
         Returns:
             plexapi.video.Video or None: The matching media object, or None if not found.
         """
         try:
-            libraries = self.plex.library.sections()
-            for library in libraries:
-                if library.type in ['movie', 'show']:
-                    results = library.search(title=title)
+            from plexapi.video import Movie, Show
 
-                    for media in results:
-                        if media.title.lower() == title.lower() and media.year == year:
-                            return media
+            content_type = content_type if content_type in ("movie", "show") else None
+            for section_key, element in self.library_index.find(title, year, content_type):
+                media_class = Movie if element.get("type") == "movie" else Show
+                return media_class(self.plex, element, initpath=f"/library/sections/{section_key}/all")
 
             return None
 
@@ -419,6 +750,15 @@ class PlexClient:
             print(f"Error searching for media: {e}")
             return None
 
+    @property
+    def library_index(self):
+        """In-memory index of the local server movies and shows, built on first use."""
+        with self.connect_lock:
+            if self._library_index is None:
+                from plex.library_index import LibraryIndex
+                self._library_index = LibraryIndex(self)
+            return self._library_index
+
     def rate_media(self, ratingKey, rating):
         """
         Rate a globally searched media item using its metadata ID.
@@ -432,11 +772,10 @@ class PlexClient:
         """
         try:
             # API endpoint for rating
-            url = "https://discover.provider.plex.tv/actions/rate"
+            url = f"{PLEX_DISCOVER_URL}/actions/rate"
 
             # Headers for the request
             headers = {
-                "Host": "discover.provider.plex.tv",
                 "Accept": "application/json",
                 "X-Plex-Token": PLEX_TOKEN
             }
@@ -449,7 +788,7 @@ class PlexClient:
             }
 
             # Send PUT request
-            response = requests.put(url, headers=headers, params=params)
+            response = self.session.put(url, headers=headers, params=params)
 
             # Check response status
             if response.status_code == 200:
@@ -463,7 +802,7 @@ class PlexClient:
             print(f"Error rating global media: {e}")
             return False
 
-    def search_and_rate_media(self, title, year, content_type, rating, reviewText=None, reviewHasSpoilers=None):
+    def search_and_rate_media(self, title, year, content_type, rating, reviewText=None, reviewHasSpoilers=None, mutation_queue=None):
         """
         Search for media locally and globally, then rate it.
 
@@ -472,6 +811,7 @@ class PlexClient:
             year (int): The year of the media.
             content_type (str): The type of content ('movie' or 'show').
             rating (int): The rating value (1 to 10).
+            mutation_queue (MutationQueue): If given, the rating is queued (and retried) instead of sent right away.
 
         Returns:
             None
@@ -482,8 +822,10 @@ class PlexClient:
             print(f"Found media: {result['title']} ({result['year']})")
 
             metadata_id = result['ratingKey']
-            # Example: Rate the first result
-            self.rate_media(metadata_id, rating)
+            if mutation_queue is not None:
+                mutation_queue.rate_on_plex(metadata_id, rating)
+            else:
+                self.rate_media(metadata_id, rating)
 
         else:
             print(f"No results found for {title} ({year}) [{content_type}]")
@@ -503,7 +845,6 @@ class PlexClient:
             return self.useruuid
         
         headers = {
-            "Host": "community.plex.tv",
             "Content-Type": "application/json",
             "Accept": "application/json",
             "X-Plex-Token": PLEX_TOKEN
@@ -529,7 +870,7 @@ class PlexClient:
         }
 
         # Send the request
-        response = requests.post("https://community.plex.tv/api", headers=headers, json=payload)
+        response = self.session.post(f"{PLEX_COMMUNITY_URL}/api", headers=headers, json=payload)
 
         if response.status_code == 200:
             data = response.json()
@@ -545,86 +886,154 @@ class PlexClient:
             print(f"Failed to fetch user ID from Plex. Status: {response.status_code}, Response: {response.text}")
             return None
 
-    def get_user_rated_content_in_local_plex_server(self):
-            """Retrieve all films, series, and episodes with ratings from Plex."""
-            rated_media = []
-
-            # Step 1: Search for rated movies
-            movies = self.plex.library.section('Movies').search(userRating__exists=True)  # Search for movies with a rating
-            for movie in movies:
-                rated_media.append({
-                    'id': movie.ratingKey,
-                    'title': movie.title,
-                    'year': movie.year,
-                    'type': 'movie',
-                    'rating': movie.userRating
-                })
-                
-            # Step 2: Search for rated TV Shows
-            tv_shows = self.plex.library.section('TV Shows').search(userRating__exists=True) 
-            for tv_show in tv_shows:
-                if tv_show.userRating is not None:  # If the TV show itself has a rating
-                    rated_media.append({
-                        'id': tv_show.ratingKey,
-                        'title': tv_show.title,
-                        'year': tv_show.year,
-                        'type': 'tvshow',
-                        'rating': tv_show.userRating
-                    })
-
-            # Step 2.5: Fetch rated seasons using HTTP request
-            url = f"{PLEX_SERVER_ADDRESS}/library/sections/1/all?type=3&userRating>=1&X-Plex-Token={PLEX_TOKEN}"  # Type 2 for seasons
-            response = requests.get(url)
+    def get_user_rated_content_in_local_plex_server(self, page_size=PLEX_SERVER_PAGE_SIZE):
+        """
+        Retrieve all films, series, seasons, and episodes with ratings from the local Plex server.
 
-            if response.status_code == 200:
-                # Parse the XML response for rated seasons
-                tree = ElementTree.fromstring(response.content)
-                
-                # Find all season elements (Season videos)
-                seasons = tree.findall(".//Directory")
-                
-                for season in seasons:
-                    title = season.get("title")
-                    year = season.get("year")
-                    rating = season.get("userRating")
-                    rating_key = season.get("ratingKey")
-                    season_index = season.get("index")
-                    parent_show_title = season.get("parentTitle", "Unknown TV Show")  # Fetch parent show title
-                    
-                    rated_media.append({
-                        'id': rating_key,
-                        'title': f"{parent_show_title} - S{str(season_index).zfill(2)}",
-                        'year': year,
-                        'type': 'season',
-                        'rating': rating
-                    })
-
-            # Step 3: Fetch rated episodes using HTTP request
-            url = f"{PLEX_SERVER_ADDRESS}/library/sections/1/all?type=4&userRating>=1&X-Plex-Token={PLEX_TOKEN}"
-            response = requests.get(url)
-            
-            if response.status_code == 200:
-                # Parse the XML response for rated episodes
-                tree = ElementTree.fromstring(response.content)
-                
-                # Find all episode elements (Video elements)
-                episodes = tree.findall(".//Video")
-                
-                for episode in episodes:
-                    title = episode.get("title")
-                    year = episode.get("year")
-                    rating = episode.get("userRating")
-                    rating_key = episode.get("ratingKey")
-                    season = episode.get("parentIndex")
-                    episode_index = episode.get("index")
-                    parent_show_title = episode.get("grandparentTitle", "Unknown TV Show")  # Fetch parent show title
-                    
-                    rated_media.append({
-                        'id': rating_key,
-                        'title': f"{parent_show_title} - S{str(season).zfill(2)}E{str(episode_index).zfill(2)} - {title}",
-                        'year': year,
-                        'type': 'episode',
-                        'rating': rating
-                    })
-
-            return rated_media
\ No newline at end of file
+        Collects `iter_user_rated_content_in_local_plex_server` into a list, see it for the arguments.
+
+        Returns:
+            list: The rated items (movies, then shows, seasons and episodes), in section order.
+        """
+        return list(self.iter_user_rated_content_in_local_plex_server(page_size))
+
+    def iter_user_rated_content_in_local_plex_server(self, page_size=PLEX_SERVER_PAGE_SIZE):
+        """
+        Stream the films, series, seasons, and episodes with ratings from the local Plex server.
+
+        Every movie and show section is read, whatever its number. Each (section, type) listing is paged
+        `page_size` items per request: the first page of every listing is requested at once, then the
+        remaining pages, at most PLEX_HTTP_POOL_SIZE ahead of the page being yielded, on the thread pool.
+        Responses are parsed while they are downloaded and only the attributes of the rated items are kept,
+        so memory holds a few pages rather than the whole library.
+
+        Args:
+            page_size (int): Number of items per request.
+
+        Yields:
+            dict: The rated items (movies, then shows, seasons and episodes), in section order.
+        """
+        sections = self.get_server_sections()
+        listings = [
+            (section_key, plex_type)
+            for plex_type in SERVER_TYPES
+            for section_key, section_type in sections
+            if plex_type in SERVER_SECTION_TYPES[section_type]
+        ]
+        executor = self.get_executor()
+
+        # The first pages tell how many items each listing holds
+        first_pages = list(executor.map(lambda listing: self._fetch_rated_server_page(*listing, 0, page_size), listings))
+
+        def pages():
+            for index, listing in enumerate(listings):
+                total_size, items = first_pages[index]
+                first_pages[index] = None
+                yield items
+                for start in range(page_size, total_size, page_size):
+                    yield executor.submit(self._fetch_rated_server_page, *listing, start, page_size)
+
+        in_flight = deque()
+        try:
+            for page in pages():
+                in_flight.append(page)
+                while len(in_flight) > PLEX_HTTP_POOL_SIZE:
+                    yield from self._get_page_items(in_flight.popleft())
+            while in_flight:
+                yield from self._get_page_items(in_flight.popleft())
+        finally:
+            # The consumer stopped early
+            for page in in_flight:
+                if isinstance(page, Future):
+                    page.cancel()
+
+    @staticmethod
+    def _get_page_items(page):
+        return page.result()[1] if isinstance(page, Future) else page
+
+    def get_server_sections(self, section_types=tuple(SERVER_SECTION_TYPES)):
+        """
+        Retrieve the library sections of the local Plex server.
+
+        Returns:
+            list: (section key, section type) of the sections of these types ('movie', 'show'...).
+        """
+        return [
+            (element.get("key"), element.get("type"))
+            for element in self._iter_server_elements("/library/sections")
+            if element.tag == "Directory" and element.get("type") in section_types
+        ]
+
+    def _fetch_rated_server_page(self, section_key, plex_type, start, page_size):
+        """
+        Fetch one page of the rated items of a type in a section.
+
+        Returns:
+            tuple: (total number of rated items of the listing, rated items of the page)
+        """
+        path = f"/library/sections/{section_key}/all?type={SERVER_TYPES[plex_type]}&userRating>=1"
+        headers = {"X-Plex-Container-Start": str(start), "X-Plex-Container-Size": str(page_size)}
+
+        total_size = 0
+        items = []
+        for element in self._iter_server_elements(path, headers):
+            if element.tag == "MediaContainer":
+                total_size = int(element.get("totalSize") or element.get("size") or 0)
+            elif element.get("userRating"):
+                items.append(self._get_rated_item_from_server(element.attrib, plex_type))
+        return total_size, items
+
+    def _iter_server_elements(self, path, headers=None):
+        """
+        Stream the elements of a local Plex server response as they are downloaded.
+
+        Yields:
+            Element: The MediaContainer first (its attributes only), then each of its children, complete.
+            The container forgets each child once it was yielded, so only the children kept by the caller stay in memory.
+        """
+        response = self.session.get(
+            f"{PLEX_SERVER_ADDRESS}{path}",
+            headers={"Accept": "application/xml", "X-Plex-Token": PLEX_TOKEN, **(headers or {})},
+            stream=True
+        )
+        try:
+            response.raise_for_status()
+            response.raw.decode_content = True
+
+            depth = 0
+            container = None
+            for event, element in ElementTree.iterparse(response.raw, events=("start", "end")):
+                if event == "start":
+                    depth += 1
+                    if depth == 1:
+                        container = element
+                        yield element
+                    continue
+
+                depth -= 1
+                if depth == 1:
+                    yield element
+                    # Parsed items (and their Media/Part children) are dropped right away
+                    container.remove(element)
+        finally:
+            response.close()
+
+    def _get_rated_item_from_server(self, attributes, plex_type):
+        """Convert the attributes of a rated item of the local Plex server into a rated item."""
+        title = attributes.get("title")
+        year = attributes.get("year") or attributes.get("parentYear")
+
+        if plex_type == "season":
+            title = f"{attributes.get('parentTitle', 'Unknown TV Show')} - S{str(attributes.get('index')).zfill(2)}"
+        elif plex_type == "episode":
+            season = str(attributes.get("parentIndex")).zfill(2)
+            episode = str(attributes.get("index")).zfill(2)
+            title = f"{attributes.get('grandparentTitle', 'Unknown TV Show')} - S{season}E{episode} - {title}"
+
+        return {
+            "id": attributes.get("ratingKey"),
+            "title": title,
+            "year": int(year) if year else None,
+            "type": "tvshow" if plex_type == "show" else plex_type,
+            "rating": float(attributes["userRating"])
+        }
@@ -0,0 +1,55 @@
+import threading
+
+
+class WatchlistItem:
+    """
+    A Plex watchlist item whose extra details are only fetched when read.
+
+    Every attribute of the wrapped plexapi item (title, year, type, guid...) is available directly.
+    `added_at` and `frenchTitle` each need a network call: it runs on the client's thread pool the first
+    time the attribute is read (or when `prefetch()` is called), and the result is kept afterwards.
+    """
+
+    def __init__(self, item, plex_client):
+        self.item = item
+        self.plex_client = plex_client
+        self.futures = {}
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # Only called for attributes not defined on the wrapper itself
+        if name in ("item", "plex_client", "futures", "lock"):
+            raise AttributeError(name)
+        return getattr(self.item, name)
+
+    def __repr__(self):
+        return f"<WatchlistItem {self.item!r}>"
+
+    @property
+    def added_at(self):
+        """Date when the item was added to the watchlist, or "Unknown"."""
+        return self._get_future("added_at", self._fetch_added_at).result()
+
+    @property
+    def frenchTitle(self):
+        """French title of the item, or None."""
+        return self._get_future("frenchTitle", self._fetch_french_title).result()
+
+    def prefetch(self):
+        """Starts fetching every lazy detail in the background."""
+        self._get_future("added_at", self._fetch_added_at)
+        self._get_future("frenchTitle", self._fetch_french_title)
+
+    def _get_future(self, name, fetch):
+        with self.lock:
+            if name not in self.futures:
+                self.futures[name] = self.plex_client.get_executor().submit(fetch)
+            return self.futures[name]
+
+    def _fetch_added_at(self):
+        # Fetch user state (this will include the date when the item was added to the watchlist)
+        user_state = self.plex_client.account.userState(self.item)
+        return user_state.watchlistedAt if user_state.watchlistedAt else "Unknown"
+
+    def _fetch_french_title(self):
+        return self.plex_client.get_french_title(self.item.key, idIsKey=True)
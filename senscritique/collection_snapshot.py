@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import asyncio
+from dotenv import load_dotenv
+from utils.media_cache import normalize_title, normalize_universe
+from utils.metrics import get_metrics
+
+# Load environment variables
+load_dotenv()
+
+SC_COLLECTION_SNAPSHOT_PATH = os.getenv("SC_COLLECTION_SNAPSHOT_PATH", "sc_collection.json")
+SC_COLLECTION_SNAPSHOT_TTL = int(os.getenv("SC_COLLECTION_SNAPSHOT_TTL", str(6 * 3600)))  # 6 hours
+SC_COLLECTION_SNAPSHOT_PAGE_SIZE = int(os.getenv("SC_COLLECTION_SNAPSHOT_PAGE_SIZE", "500"))
+
+
+class CollectionSnapshot:
+    """
+    Local copy of the user's SensCritique collection, indexed by product id, universe and normalized title.
+
+    The collection is downloaded once per run, or read from `path` while the saved copy is younger than `ttl`
+    seconds. Lookups are then dictionary reads and make no network call. `refresh()` downloads it again.
+    """
+
+    def __init__(self, sc_client, username, path=SC_COLLECTION_SNAPSHOT_PATH, ttl=SC_COLLECTION_SNAPSHOT_TTL,
+                 page_size=SC_COLLECTION_SNAPSHOT_PAGE_SIZE):
+        self.sc_client = sc_client
+        self.username = username
+        self.path = path
+        self.ttl = ttl
+        self.page_size = page_size
+        self.fetched_at = None
+        self.loading = None
+
+        self.by_id = {}
+        self.by_universe = {}
+        self.by_title = {}
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __contains__(self, product_id):
+        return str(product_id) in self.by_id
+
+    @property
+    def loaded(self):
+        return self.fetched_at is not None
+
+    async def load(self):
+        """Makes the snapshot available: does nothing if loaded and fresh, reads the saved copy if fresh, downloads it otherwise."""
+        # A long-running process keeps the snapshot across syncs, until it is older than the TTL
+        if self.loaded and time.time() - self.fetched_at <= self.ttl:
+            return self
+
+        # Concurrent callers wait for the same download
+        if self.loading is None:
+            self.loading = asyncio.ensure_future(self._load())
+        try:
+            await self.loading
+        finally:
+            self.loading = None
+        return self
+
+    async def refresh(self):
+        """Downloads the whole collection again and saves it, whatever the age of the current snapshot."""
+        products = []
+        offset = 0
+        next_page = asyncio.ensure_future(self.sc_client.fetch_user_collection_page(self.page_size, offset))
+        while next_page:
+            page = await next_page
+            next_page = None
+            products.extend(page)
+            offset += len(page)
+
+            # Prefetch the following page while this one is indexed
+            if len(page) == self.page_size:
+                next_page = asyncio.ensure_future(self.sc_client.fetch_user_collection_page(self.page_size, offset))
+
+        self._index(products, time.time())
+        self._save(products)
+        print(f"Downloaded a snapshot of {len(self)} SensCritique collection products.")
+        return self
+
+    def get(self, product_id):
+        """Returns the collection product with this id, or None."""
+        product = self.by_id.get(str(product_id))
+        get_metrics().record_cache("sc_collection_lookups", hits=1 if product else 0, misses=0 if product else 1)
+        return product
+
+    def products(self, universe=None):
+        """Returns every product of the collection, optionally only those of one universe ('movie', 1, 'show', 4...)."""
+        if universe is None:
+            return list(self.by_id.values())
+        return list(self.by_universe.get(normalize_universe(universe), []))
+
+    def find(self, title, universe=None, year=None):
+        """
+        Finds the collection products matching a title (original, French or alternative).
+
+        Args:
+            title (str): Title of the media, compared once normalized.
+            universe (str|int): Only keep products of this universe.
+            year (int): Only keep products produced this year.
+
+        Returns:
+            list: The matching products.
+        """
+        universe = normalize_universe(universe)
+        return [
+            product for product in self.by_title.get(normalize_title(title), [])
+            if (universe is None or product["universe"] == universe)
+            and (year is None or product["yearOfProduction"] == year)
+        ]
+
+    async def _load(self):
+        if self._read():
+            get_metrics().record_cache("sc_collection_snapshot", hits=1)
+        else:
+            get_metrics().record_cache("sc_collection_snapshot", misses=1)
+            await self.refresh()
+
+    def _read(self):
+        if not self.path or not os.path.exists(self.path):
+            return False
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable collection snapshot {self.path}: {e}")
+            return False
+
+        if snapshot.get("username") != self.username or time.time() - snapshot.get("fetched_at", 0) > self.ttl:
+            return False
+
+        self._index(snapshot["products"], snapshot["fetched_at"])
+        return True
+
+    def _save(self, products):
+        if not self.path:
+            return
+
+        # Written next to the target then renamed, so an interrupted write never leaves a truncated snapshot
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump({"username": self.username, "fetched_at": self.fetched_at, "products": products}, f, ensure_ascii=False)
+        os.replace(temporary_path, self.path)
+
+    def _index(self, products, fetched_at):
+        by_id, by_universe, by_title = {}, {}, {}
+        for product in products:
+            by_id[str(product["id"])] = product
+            by_universe.setdefault(product["universe"], []).append(product)
+
+            titles = {product.get("title"), product.get("originalTitle"), *(product.get("alternativeTitles") or [])}
+            for title in {normalize_title(title) for title in titles if title}:
+                by_title.setdefault(title, []).append(product)
+
+        self.by_id, self.by_universe, self.by_title = by_id, by_universe, by_title
+        self.fetched_at = fetched_at
@@ -1,9 +1,13 @@
 from .senscritique_gql_client import SensCritiqueGqlClient
+from .collection_snapshot import CollectionSnapshot
 from datetime import datetime
 import os
 import asyncio
 from dotenv import load_dotenv
-from plex.plex_client import PlexClient
+from utils.media_cache import MediaCache, get_media_cache, normalize_title
+from utils.rate_limiter import get_rate_limiter
+from utils.metrics import get_metrics
+from urllib.parse import urlparse
 import json
 import re
 import requests
@@ -17,11 +21,39 @@ SC_PASSWORD = os.getenv("SC_PASSWORD")
 SC_USER_ID = os.getenv("SC_USER_ID")
 SC_USERNAME = os.getenv("SC_USERNAME")
 
+# Number of collection products requested per page
+SC_COLLECTION_PAGE_SIZE = int(os.getenv("SC_COLLECTION_PAGE_SIZE", "100"))
+
+# GraphQL error codes of failures on the server side, which may go away if the write is retried
+TRANSIENT_ERROR_CODES = ("INTERNAL_SERVER_ERROR", "UNAUTHENTICATED", "TOO_MANY_REQUESTS")
+
+
+class SensCritiqueWriteRejected(Exception):
+    """Raised when SensCritique answers a write with GraphQL errors (unknown product, invalid rating...)."""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+    @property
+    def permanent(self):
+        codes = {(error.get("extensions") or {}).get("code") for error in self.errors if isinstance(error, dict)}
+        return not codes & set(TRANSIENT_ERROR_CODES)
+
+
 class SensCritiqueClient:
-    def __init__(self):
+    def __init__(self, media_cache=None):
         """Initialize the client with a valid email and password."""
         self.client = SensCritiqueGqlClient.build(SC_EMAIL, SC_PASSWORD)
         self.userId = SC_USER_ID
+        self.media_cache = media_cache or get_media_cache()
+
+        # Per-run memoization of TV show searches and season/episode trees (tasks, so concurrent callers share them)
+        self.tv_show_searches = {}
+        self.show_trees = {}
+
+        # Collection indexed by id, universe and title, downloaded at most once per run
+        self.collection = CollectionSnapshot(self, SC_USERNAME)
 
     def parse_french_date(self, date_str):
         """Parse either ISO (YYYY-MM-DD) or French-formatted dates like '21 mars 2024'."""
@@ -56,7 +88,12 @@ class SensCritiqueClient:
         return None
 
     async def fetch_user_wishes(self, limit=30):
-        """Fetch the wishlist of the authenticated user."""
+        """
+        Fetch the wishlist of the authenticated user.
+
+        Returns:
+            list: The wishes (empty if the wishlist is), or None if the wishlist could not be read.
+        """
         
         query = """
         query UserWishes($id: Int!, $limit: Int) {
@@ -88,11 +125,16 @@ class SensCritiqueClient:
         print("SensCritique watchlist:")
         
         # Check if the response contains the expected data
-        if "data" in response:
+        if "data" in response and response["data"].get("user"):
             user = response["data"]["user"]
             user_wishes = []  # Initialize an empty list to store the media information
             
             if(user["wishes"]):
+                # Resolve the wishlist dates of every wish in bulk
+                dates_wishlisted = await self.fetch_dates_when_items_were_last_wishlisted_by_user(
+                    [wish.get("id") for wish in user["wishes"]]
+                )
+
                 # Loop through the user's wishes and format the data
                 for wish in user["wishes"]:
                     title = wish.get("title", "Unknown Title")
@@ -104,7 +146,7 @@ class SensCritiqueClient:
 
                     release_date = self.parse_french_date(release_date_text)
             
-                    date_wishlisted = await self.fetch_date_when_item_was_last_wishlisted_by_user(id)
+                    date_wishlisted = dates_wishlisted.get(id)
         
                     universe = wish.get("universe", "Unknown Universe")
                     picture = wish["medias"].get("picture", "No picture available")
@@ -126,11 +168,11 @@ class SensCritiqueClient:
 
                     user_wishes.append(media)
                 
-                # Return the list of media
-                return user_wishes
+            # Return the list of media
+            return user_wishes
         else:
             print("Error fetching user wishes: User not found.")
-            return []  
+            return None
 
     async def fetch_media_id(self, title, year, universe):
         media = await self.fetch_media(title, year, universe)
@@ -143,14 +185,24 @@ class SensCritiqueClient:
         
         if isinstance(universe, str):
             universe = self.get_sc_media_type_id_from_plex_text_type(universe)
-        
+
+        # Items matched during a previous run are served from the on-disk cache
+        cached_media = self.media_cache.get(MediaCache.SENSCRITIQUE, title, year, universe)
+        if cached_media:
+            return cached_media
+
+        media = None
         if universe == 1 or universe == 4:
-            return await self.fetch_media_tvShow_or_movie(title, year, universe)
-        if universe == 32:
-            return await self.fetch_episode(title, year)
-            
-        if universe == 5:
-            return await self.fetch_season(title, year)
+            media = await self.fetch_media_tvShow_or_movie(title, year, universe)
+        elif universe == 32:
+            media = await self.fetch_episode(title, year)
+        elif universe == 5:
+            media = await self.fetch_season(title, year)
+
+        if media:
+            self.media_cache.set(MediaCache.SENSCRITIQUE, title, year, universe, media)
+
+        return media
             
     
     async def fetch_media_tvShow_or_movie(self, title, year, universe):
@@ -229,79 +281,47 @@ class SensCritiqueClient:
         return None
 
     async def fetch_episode(self, title, year):
-        try:
-            # Step 1: Extract episode info
-            episode_info = self.get_episode_info_from_title(title, year)
-            if not episode_info:
-                raise ValueError("Could not parse episode information from the title.")
-
-            tv_show_name = episode_info["tv_show_name"]
-            season_number = episode_info["season_number"]
-            episode_number = episode_info["episode_number"]
+        """
+        Fetches a specific episode from SensCritique based on its structured title and year.
 
-            print(f"Searching for TV show: {tv_show_name}, Season: {season_number}, Episode: {episode_number}")
+        Only "not found" answers return None: request errors are raised, so callers can tell them apart.
+        """
+        # Step 1: Extract episode info
+        episode_info = self.get_episode_info_from_title(title, year)
+        if not episode_info:
+            print(f"Could not parse episode information from the title '{title}'.")
+            return None
 
-            # Step 2: Fetch the TV show (type 4 indicates TV show in your system)
-            tv_show = await self.fetch_media_tvShow_or_movie(tv_show_name, year, 4)
-            if not tv_show:
-                raise ValueError(f"TV show '{tv_show_name}' not found.")
+        tv_show_name = episode_info["tv_show_name"]
+        season_number = episode_info["season_number"]
+        episode_number = episode_info["episode_number"]
 
-            tv_show_id = tv_show["id"]  # Extract TV show ID
-            print(f"Found TV show '{tv_show_name}' with ID: {tv_show_id}")
+        print(f"Searching for TV show: {tv_show_name}, Season: {season_number}, Episode: {episode_number}")
 
-            # Step 3: GraphQL query for seasons and episodes
-            query = """
-            query FetchTvShowWithEpisodes($id: Int!) {
-            product(id: $id) {
-                id
-                title
-                seasons {
-                id
-                seasonNumber
-                episodes {
-                    id
-                    episodeNumber
-                    title
-                }
-                }
-            }
-            }
-            """
+        # Step 2: Fetch the TV show (type 4 indicates TV show in your system), once per show
+        tv_show = await self.fetch_tv_show(tv_show_name, year)
+        if not tv_show:
+            print(f"TV show '{tv_show_name}' not found.")
+            return None
 
-            # Step 4: Set the query variables
-            variables = {
-                "id": tv_show_id
+        tv_show_id = tv_show["id"]  # Extract TV show ID
+        print(f"Found TV show '{tv_show_name}' with ID: {tv_show_id}")
+
+        # Step 3: Find the correct episode in the show tree
+        show_tree = await self.fetch_show_tree(tv_show_id)
+        episode = show_tree["episodes"].get((season_number, episode_number))
+        if episode:
+            print(f"Found Episode: {episode['title']} (ID: {episode['id']})")
+            return {
+                "id": episode["id"],
+                "title": episode["title"],
+                "season": season_number,
+                "episode": episode_number,
+                "year_of_production":  tv_show["year_of_production"]
             }
 
-            # Step 5: Send the query request
-            response = await self.client.request(query, variables)
-
-            # Step 6: Process the response
-            if not response or response.get("errors"):
-                raise ValueError(f"Error fetching TV show details: {response.get('errors')}")
-
-            seasons = response.get("data", {}).get("product", {}).get("seasons", [])
-
-            # Step 7: Find the correct episode
-            for season in seasons:
-                if season["seasonNumber"] == season_number:
-                    for episode in season["episodes"]:
-                        if episode["episodeNumber"] == episode_number:
-                            print(f"Found Episode: {episode['title']} (ID: {episode['id']})")
-                            return {
-                                "id": episode["id"],
-                                "title": episode["title"],
-                                "season": season_number,
-                                "episode": episode_number,
-                                "year_of_production":  tv_show["year_of_production"]
-                            }
-
-            print("Episode not found.")
-            return None
-
-        except Exception as e:
-            print(f"Error in fetch_episode: {e}")
-            return None
+        print("Episode not found.")
+        return None
 
     async def fetch_season(self, title, year):
         """
@@ -312,73 +332,116 @@ class SensCritiqueClient:
             year (str): Year of the TV show.
 
         Returns:
-            dict: Information about the matched season, including its ID.
+            dict: Information about the matched season, including its ID, or None if it was not found.
+
+        Raises:
+            Exception: The request errors, so that a failed search is not taken for a missing season.
         """
-        try:
-            # Step 1: Extract TV show name and season title/number
-            tv_show_name, season_number, season_title = self._extract_season_info(title)
-            print(f"Extracted TV Show Name: '{tv_show_name}', Season Number: '{season_number}', Season Title: '{season_title}'")
+        # Step 1: Extract TV show name and season title/number
+        tv_show_name, season_number, season_title = self._extract_season_info(title)
+        if not tv_show_name:
+            return None
+        print(f"Extracted TV Show Name: '{tv_show_name}', Season Number: '{season_number}', Season Title: '{season_title}'")
 
-            # Step 2: Fetch the TV show
-            tv_show = await self.fetch_media_tvShow_or_movie(tv_show_name, year, 4)
-            if not tv_show:
-                raise ValueError(f"TV show '{tv_show_name}' not found.")
+        # Step 2: Fetch the TV show, once per show
+        tv_show = await self.fetch_tv_show(tv_show_name, year)
+        if not tv_show:
+            print(f"TV show '{tv_show_name}' not found.")
+            return None
 
-            tv_show_id = tv_show["id"]  # Extract TV show ID
-            print(f"Found TV show '{tv_show_name}' with ID: {tv_show_id}")
+        tv_show_id = tv_show["id"]  # Extract TV show ID
+        print(f"Found TV show '{tv_show_name}' with ID: {tv_show_id}")
+
+        # Step 3: Match the season by number or title in the show tree
+        show_tree = await self.fetch_show_tree(tv_show_id)
+        season = None
+        if season_number:
+            season = show_tree["seasons"].get(season_number)
+        elif season_title:
+            season = show_tree["seasons_by_title"].get(season_title)
+
+        if season:
+            print(f"Found Season: {season['title']} (ID: {season['id']})")
+            return {
+                "id": season["id"],
+                "title": season["title"],
+                "season": season.get("seasonNumber"),
+                "year_of_production": tv_show["year_of_production"]
+            }
 
-            # Step 3: GraphQL query for seasons
-            query = """
-            query FetchTvShowSeasons($id: Int!) {
-                product(id: $id) {
-                    id
-                    title
-                    seasons {
-                        id
-                        seasonNumber
-                        title
-                    }
-                }
+        print("Season not found.")
+        return None
+
+    async def fetch_tv_show(self, tv_show_name, year):
+        """Fetch a TV show by name and year, searching each show only once per run."""
+        key = (normalize_title(tv_show_name), year)
+        return await self._get_memoized(self.tv_show_searches, key, lambda: self.fetch_media(tv_show_name, year, 4), "sc_tv_show_searches")
+
+    async def fetch_show_tree(self, tv_show_id):
+        """
+        Fetch the seasons and episodes of a TV show, downloading each show tree only once per run.
+
+        Returns:
+            dict: "seasons" (season number -> season), "seasons_by_title" (title -> season)
+                  and "episodes" ((season number, episode number) -> episode).
+        """
+        return await self._get_memoized(self.show_trees, tv_show_id, lambda: self._download_show_tree(tv_show_id), "sc_show_trees")
+
+    async def _download_show_tree(self, tv_show_id):
+        query = """
+        query FetchTvShowWithEpisodes($id: Int!) {
+        product(id: $id) {
+            id
+            title
+            seasons {
+            id
+            seasonNumber
+            title
+            episodes {
+                id
+                episodeNumber
+                title
             }
-            """
+            }
+        }
+        }
+        """
 
-            # Step 4: Set query variables
-            variables = {"id": tv_show_id}
+        response = await self.client.request(query, {"id": tv_show_id})
 
-            # Step 5: Send the query request
-            response = await self.client.request(query, variables)
+        if not response or response.get("errors"):
+            raise ValueError(f"Error fetching TV show details: {response.get('errors')}")
 
-            # Step 6: Process the response
-            if not response or response.get("errors"):
-                raise ValueError(f"Error fetching TV show seasons: {response.get('errors')}")
+        seasons = (response.get("data", {}).get("product") or {}).get("seasons") or []
 
-            seasons = response.get("data", {}).get("product", {}).get("seasons", [])
+        show_tree = {"seasons": {}, "seasons_by_title": {}, "episodes": {}}
+        for season in seasons:
+            show_tree["seasons"][season["seasonNumber"]] = season
+            if season.get("title"):
+                show_tree["seasons_by_title"][season["title"]] = season
+            for episode in season.get("episodes") or []:
+                show_tree["episodes"][(season["seasonNumber"], episode["episodeNumber"])] = episode
 
-            # Step 7: Match the season by number or title
-            for season in seasons:
-                if season_number and season.get("seasonNumber") == season_number:
-                    print(f"Found Season: {season['title']} (ID: {season['id']})")
-                    return {
-                        "id": season["id"],
-                        "title": season["title"],
-                        "season": season_number,
-                        "year_of_production": tv_show["year_of_production"]
-                    }
-                elif season_title and season.get("title") == season_title:
-                    print(f"Found Season by Title: {season['title']} (ID: {season['id']})")
-                    return {
-                        "id": season["id"],
-                        "title": season["title"],
-                        "season": season.get("seasonNumber"),
-                        "year_of_production": tv_show["year_of_production"]
-                    }
+        return show_tree
 
-            print("Season not found.")
-            return None
+    def start_run(self):
+        """Forget the per-run memoization, so a long-running process sees the shows added or updated since the last run."""
+        self.tv_show_searches = {}
+        self.show_trees = {}
 
-        except Exception as e:
-            print(f"Error in fetch_season: {e}")
-            return None
+    async def _get_memoized(self, memo, key, fetch, cache_name):
+        """Await the task memoized under `key`, starting it with `fetch()` if needed. Failures are not memoized."""
+        if key not in memo:
+            get_metrics().record_cache(cache_name, misses=1)
+            memo[key] = asyncio.ensure_future(fetch())
+        else:
+            get_metrics().record_cache(cache_name, hits=1)
+
+        try:
+            return await memo[key]
+        except Exception:
+            memo.pop(key, None)
+            raise
 
     # Helper function to extract season info
     def _extract_season_info(self, title):
@@ -459,21 +522,27 @@ class SensCritiqueClient:
         
         
 
-    async def add_media_to_wishlist(self, media_id):
-            """Add a media item to the SensCritique wishlist."""
+    async def add_media_to_wishlist(self, media_id, raise_errors=False):
+            """Add a media item to the SensCritique wishlist. Returns True on success (raises on failure with `raise_errors`)."""
             mutation = """
                 mutation AddToWishlist($productId: Int!) {
                     productWish(productId: $productId)
                 }
             """
             try:
-                await self.client.raw_request(mutation, {"productId": media_id})
+                response = await self.client.request(mutation, {"productId": media_id})
+                if response.get("errors"):
+                    raise SensCritiqueWriteRejected(response["errors"])
                 print(f"Successfully added media {media_id} to the wishlist.")
+                return True
             except Exception as e:
+                if raise_errors:
+                    raise
                 print(f"Error adding media {media_id} to wishlist: {e}")
+                return False
 
-    async def remove_media_from_wishlist(self, media_id):
-        """Remove a media item from the SensCritique wishlist."""
+    async def remove_media_from_wishlist(self, media_id, raise_errors=False):
+        """Remove a media item from the SensCritique wishlist. Returns True on success (raises on failure with `raise_errors`)."""
         mutation = """
             mutation RemoveFromWishlist($productId: Int!) {
                 productUnwish(productId: $productId)
@@ -481,13 +550,56 @@ class SensCritiqueClient:
         """
         try:
             # Send the request with the mutation to remove the media from the wishlist
-            await self.client.raw_request(mutation, {"productId": media_id})
+            response = await self.client.request(mutation, {"productId": media_id})
+            if response.get("errors"):
+                raise SensCritiqueWriteRejected(response["errors"])
             print(f"Successfully removed media {media_id} from the wishlist.")
+            return True
         except Exception as e:
+            if raise_errors:
+                raise
             print(f"Error removing media {media_id} from wishlist: {e}")
+            return False
+
+    async def mark_media_as_done(self, media_id, raise_errors=False):
+        """Mark a media item as done (seen) on SensCritique. Returns True on success (raises on failure with `raise_errors`)."""
+        mutation = """
+            mutation ProductDone($productId: Int!) {
+                productDone(productId: $productId) {
+                    id
+                    currentUserInfos {
+                        dateDone
+                        isDone
+                    }
+                }
+            }
+        """
+        try:
+            response = await self.client.request(mutation, {"productId": media_id})
+            if response.get("errors"):
+                raise SensCritiqueWriteRejected(response["errors"])
+            print(f"Successfully marked media {media_id} as done.")
+            return True
+        except Exception as e:
+            if raise_errors:
+                raise
+            print(f"Error marking media {media_id} as done: {e}")
+            return False
 
     async def fetch_from_user_collections(self, id):
-            """Fetch a media from the user collections by its ID."""
+            """Fetch a media from the user collections by its ID (read from the collection snapshot)."""
+            await self.collection.load()
+
+            # Find the product with the matching ID
+            product = self.collection.get(id)
+            if product:
+                return product  # Return the product's data
+
+            print("No media found with the specified ID.")
+            return None
+
+    async def fetch_user_collection_page(self, limit, offset=0):
+            """Fetch a page of the user's collection products, as stored in the collection snapshot."""
             
             query = """
             query UserDiary($isDiary:Boolean, $limit:Int, $offset:Int, $universe:String, $username:String!, $yearDateDone:Int) {
@@ -517,8 +629,8 @@ class SensCritiqueClient:
             # Set the variables for the query
             variables = {
                 "isDiary": False,
-                "limit": 5000,
-                "offset": 0,
+                "limit": limit,
+                "offset": offset,
                 "universe": None,
                 "username": SC_USERNAME,  # Replace with the correct username if needed
                 "yearDateDone": None
@@ -528,15 +640,10 @@ class SensCritiqueClient:
             response = await self.client.request(query, variables)
             
             # Check the response data
-            if "data" in response and "user" in response["data"]:
-                # Find the product with the matching ID
-                products = response["data"]["user"]["collection"]["products"]
-                for product in products:
-                    if product["id"] == id:
-                        return product  # Return the product's data
+            if "data" in response and response["data"].get("user"):
+                return response["data"]["user"]["collection"]["products"]
 
-            print("No media found with the specified ID.")
-            return None
+            return []
 
     async def fetch_date_when_item_was_last_wishlisted_by_user(self, id):
             """Fetch the date when the item was last wishlisted."""
@@ -557,20 +664,118 @@ class SensCritiqueClient:
                 response = await self.client.request(query, variables)
                 
                 if response and 'data' in response and 'feed' in response['data']:
-                    feeds = response['data']['feed'][0]['feeds']
-                    for feed in feeds:
-                        if feed['isWishList']:
-                            # If the item is wishlisted, return the creation date
-                            date_creation = feed['dateCreation']
-                            return datetime.strptime(date_creation, "%Y-%m-%dT%H:%M:%S.%fZ")  # Parse the date
+                    return self._get_last_wishlisted_date(response['data']['feed'])
                 
                 return None  # Return None if no matching wishlisted item is found
             except Exception as e:
                 print(f"Error fetching date: {e}")
                 return None
 
-    async def get_user_rated_media(self, limit=10000, offset=0):
-        """Fetch all rated shows, seasons, and episodes from the user's collection."""
+    async def fetch_dates_when_items_were_last_wishlisted_by_user(self, ids, chunk_size=100):
+        """
+        Fetch the dates when many items were last wishlisted, in one request per `chunk_size` items.
+
+        Each chunk is a single GraphQL document with one aliased `feed` field per product id.
+
+        Args:
+            ids (list): SensCritique product ids.
+            chunk_size (int): Number of products per request.
+
+        Returns:
+            dict: product id -> wishlist date (None when unknown).
+        """
+        ids = list(dict.fromkeys(id for id in ids if isinstance(id, int)))
+        chunks = [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)]
+
+        async def fetch_chunk(chunk):
+            # Product ids are integers, so they can be inlined safely in the aliases
+            fields = " ".join(
+                f"p{id}: feed(limit: $limit, offset: 0, productId: {id}, userId: $userId, excludeArchive: false) {{ feeds {{ dateCreation isWishList product {{ id }} }} }}"
+                for id in chunk
+            )
+            query = f"query FeedWishDates($limit: Int, $userId: Int) {{ {fields} }}"
+
+            try:
+                response = await self.client.request(query, {"limit": 10, "userId": int(self.userId)})
+                data = (response or {}).get("data") or {}
+                return {id: self._get_last_wishlisted_date(data.get(f"p{id}")) for id in chunk}
+            except Exception as e:
+                print(f"Error fetching wishlist dates: {e}")
+                return {id: None for id in chunk}
+
+        dates = {}
+        for chunk_dates in await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks)):
+            dates.update(chunk_dates)
+        return dates
+
+    def _get_last_wishlisted_date(self, feed):
+        """Return the creation date of the first wishlist activity of a `feed` field, or None."""
+        if not feed:
+            return None
+
+        for activity in feed[0]['feeds']:
+            if activity['isWishList']:
+                # If the item is wishlisted, return the creation date
+                return datetime.strptime(activity['dateCreation'], "%Y-%m-%dT%H:%M:%S.%fZ")  # Parse the date
+
+        return None
+
+    async def get_user_rated_media(self, limit=None, offset=0, page_size=SC_COLLECTION_PAGE_SIZE):
+        """
+        Fetch all rated shows, seasons, and episodes from the user's collection.
+
+        Collects `iter_user_rated_media` into a list, see it for the arguments.
+
+        Returns:
+            list: The rated items.
+        """
+        return [media async for media in self.iter_user_rated_media(limit, offset, page_size)]
+
+    async def iter_user_rated_media(self, limit=None, offset=0, page_size=SC_COLLECTION_PAGE_SIZE):
+        """
+        Stream the rated shows, seasons, and episodes of the user's collection, one page of products at a time.
+
+        The next page is requested as soon as the current one arrives, so it downloads while the current page
+        is consumed. Only one page is held in memory.
+
+        The collection is always read entirely: SensCritique exposes no rating date ("ratedDate" is the
+        dateDone the user picks as the watch date), so there is no reliable point where a scan could stop.
+
+        Args:
+            limit (int): Maximum number of products to read, None to read the whole collection.
+            offset (int): Offset of the first product.
+            page_size (int): Number of products per request.
+
+        Yields:
+            dict: A rated item.
+        """
+        end = offset + limit if limit else None
+
+        def fetch_page(page_offset):
+            page_limit = min(page_size, end - page_offset) if end else page_size
+            return asyncio.ensure_future(self.fetch_user_collection_products(page_limit, page_offset)), page_limit
+
+        next_page = fetch_page(offset)
+        try:
+            while next_page:
+                page, page_limit = next_page
+                products = await page
+                next_page = None
+
+                # Prefetch the following page while this one is processed
+                offset += len(products)
+                if len(products) == page_limit and (end is None or offset < end):
+                    next_page = fetch_page(offset)
+
+                for product in products:
+                    for media in self._get_rated_media_from_product(product):
+                        yield media
+        finally:
+            if next_page and not next_page[0].done():
+                next_page[0].cancel()
+
+    async def fetch_user_collection_products(self, limit, offset=0):
+        """Fetch a page of the user's collection, with the ratings of every product, season and episode."""
         
         # Define the updated query to fetch all rated media (movies, TV shows, seasons, and episodes)
         query = "query UserCollection($limit: Int, $offset: Int, $username: String!) { user(username: $username) { collection(limit: $limit, offset: $offset) { products { id originalTitle title universe category yearOfProduction currentUserInfos { rating dateDone } seasons { id universe originalTitle title seasonNumber currentUserInfos { rating dateDone } episodes { id episodeNumber universe originalTitle title currentUserInfos { rating dateDone } } } } } } }"
@@ -585,64 +790,65 @@ class SensCritiqueClient:
         # Send the request using the GraphQL client
         response = await self.client.request(query, variables)
 
-        # Initialize a list to store the rated media
-        rated_media = []
+        if "data" in response and response["data"].get("user"):
+            return response["data"]["user"]["collection"]["products"]
 
-        # Check the response and process the products
-        if "data" in response and "user" in response["data"]:
-            products = response["data"]["user"]["collection"]["products"]
+        return []
 
-            # Iterate over the products and gather rated media
-            for product in products:
-                
-                # If it's not a movie or a tv show, skip
-                if product["universe"] not in [4, 1]:
-                    continue
-                
-                # Check if the product has a rating
-                if product["currentUserInfos"] and product["currentUserInfos"]["rating"] is not None:
+    def _get_rated_media_from_product(self, product):
+        """Flatten a collection product into its rated movie/show, seasons and episodes."""
+        rated_media = []
+
+        # If it's not a movie or a tv show, skip
+        if product["universe"] not in [4, 1]:
+            return rated_media
+
+        product_date_done = product["currentUserInfos"]["dateDone"] if product["currentUserInfos"] else None
+
+        # Check if the product has a rating
+        if product["currentUserInfos"] and product["currentUserInfos"]["rating"] is not None:
+            rated_media.append({
+                "id": product["id"],
+                "title": product["originalTitle"] if product["originalTitle"] else product["title"],
+                "rating": product["currentUserInfos"]["rating"],
+                "type": self.get_plex_media_type_from_sc_id(product["universe"]),  # "movie", "tvshow", etc.
+                "category": product["category"],
+                "year": product["yearOfProduction"],
+                "ratedDate": product_date_done
+            })
+
+        # If it's a TV show, check its seasons and episodes for ratings
+        if "seasons" in product and product["seasons"]:
+            for season in product["seasons"]:
+                season_title = season["originalTitle"] if season["originalTitle"] else season["title"]
+                if season["currentUserInfos"] and season["currentUserInfos"]["rating"] is not None:
                     rated_media.append({
-                        "id": product["id"],
-                        "title": product["originalTitle"] if product["originalTitle"] else product["title"],
-                        "rating": product["currentUserInfos"]["rating"],
-                        "type": self.get_plex_media_type_from_sc_id(product["universe"]),  # "movie", "tvshow", etc.
+                        "id": season["id"],
+                        "title": season_title,
+                        "rating": season["currentUserInfos"]["rating"],
+                        "seasonNumber": season["seasonNumber"],
+                        "type": "season",
                         "category": product["category"],
                         "year": product["yearOfProduction"],
-                        "ratedDate": product["currentUserInfos"]["dateDone"]
+                        "ratedDate": season["currentUserInfos"]["dateDone"] or product_date_done
                     })
-
-                # If it's a TV show, check its seasons and episodes for ratings
-                if "seasons" in product and product["seasons"]:
-                    for season in product["seasons"]:
-                        season_title = season["originalTitle"] if season["originalTitle"] else season["title"]
-                        if season["currentUserInfos"] and season["currentUserInfos"]["rating"] is not None:
+                
+                if "episodes" in season and season["episodes"]:
+                    # Check episodes in this season
+                    for episode in season["episodes"]:
+                        if episode["currentUserInfos"] and episode["currentUserInfos"]["rating"] is not None:
+                            
+                            episode_title = episode["originalTitle"] if episode["originalTitle"] else episode["title"]
                             rated_media.append({
-                                "id": season["id"],
-                                "title": season_title,
-                                "rating": season["currentUserInfos"]["rating"],
-                                "seasonNumber": season["seasonNumber"],
-                                "type": "season",
+                                "id": episode["id"],
+                                "title": f"{season_title} - S{str(season['seasonNumber']).zfill(2)}E{str(episode['episodeNumber']).zfill(2)} - {episode_title}",
+                                "rating": episode["currentUserInfos"]["rating"],
+                                "type": "episode",
                                 "category": product["category"],
                                 "year": product["yearOfProduction"],
-                                "ratedDate": product["currentUserInfos"]["dateDone"]
+                                "ratedDate": episode["currentUserInfos"]["dateDone"] or product_date_done
                             })
-                        
-                        if "episodes" in season and season["episodes"]:
-                            # Check episodes in this season
-                            for episode in season["episodes"]:
-                                if episode["currentUserInfos"] and episode["currentUserInfos"]["rating"] is not None:
-                                    
-                                    episode_title = episode["originalTitle"] if episode["originalTitle"] else episode["title"],
-                                    rated_media.append({
-                                        "id": episode["id"],
-                                        "title": f"{season_title} - S{str(season['seasonNumber']).zfill(2)}E{str(episode['episodeNumber']).zfill(2)} - {episode_title}",
-                                        "rating": episode["currentUserInfos"]["rating"],
-                                        "type": "episode",
-                                        "category": product["category"],
-                                        "year": product["yearOfProduction"],
-                                        "ratedDate": product["currentUserInfos"]["dateDone"]
-                                    })
-        
+
         return rated_media
 
 
@@ -707,6 +913,8 @@ class SensCritiqueClient:
 
             # Send the request using your Apollo client
             response = await self.client.request(query, variables)
+            if response.get("errors"):
+                raise SensCritiqueWriteRejected(response["errors"])
             
             # Process the response to return useful information
             if "data" in response and "productRate" in response["data"]:
@@ -733,7 +941,7 @@ class SensCritiqueClient:
             else:
                 raise Exception("Failed to rate the media. Response data is missing or malformed.")
 
-    async def search_and_rate_media(self, title, year, content_type, rating, reviewText=None, reviewHasSpoilers=None):
+    async def search_and_rate_media(self, title, year, content_type, rating, reviewText=None, reviewHasSpoilers=None, mutation_queue=None):
         """
         Search for media locally and globally, then rate it.
 
@@ -742,6 +950,7 @@ class SensCritiqueClient:
             year (int): The year of the media.
             content_type (str): The type of content ('movie' or 'show').
             rating (int): The rating value (1 to 10).
+            mutation_queue (MutationQueue): If given, the rating is queued (and retried) instead of sent right away.
 
         Returns:
             None
@@ -754,7 +963,10 @@ class SensCritiqueClient:
 
         if media:
             print(f"Rating media matched in SensCritique: {media['title']} ({media['year_of_production']}) [{content_type}]")
-            await self.rate_media_with_id(media['id'], rating)
+            if mutation_queue is not None:
+                mutation_queue.rate_on_sc(media['id'], rating)
+            else:
+                await self.rate_media_with_id(media['id'], rating)
                         
             # if reviewText:
                 # self.publish_sc_text_review(media['id'], reviewText, reviewHasSpoilers)
@@ -777,7 +989,7 @@ class SensCritiqueClient:
         """
 
         flaresolverr_url = "http://localhost:8191/v1"
-        target_url = "https://apollo.senscritique.com/"
+        target_url = self.client.url
 
         # Format spoiler content
         if reviewHasSpoilers:
@@ -825,11 +1037,19 @@ class SensCritiqueClient:
             "maxTimeout": 60000
         }
 
+        # FlareSolverr is local, the request it makes is the one to throttle
+        rate_limiter = get_rate_limiter()
+        target_host = urlparse(target_url).hostname
+        rate_limiter.acquire(target_host)
+
         response = requests.post(flaresolverr_url, json=flaresolverr_payload)
 
         if response.status_code == 200:
             try:
-                raw_response = response.json().get("solution", {}).get("response")
+                solution = response.json().get("solution", {})
+                rate_limiter.on_response(target_host, solution.get("status", 200), solution.get("headers"))
+
+                raw_response = solution.get("response")
                 if raw_response:
                     sc_response = json.loads(raw_response)
                     review = sc_response.get("data", {}).get("reviewCreateOrEdit")
@@ -1,7 +1,13 @@
+import asyncio
 import requests
+import httpx
+from urllib.parse import urlparse
+from utils.rate_limiter import RateLimitedAdapter, get_rate_limiter, RATE_LIMIT_MAX_RETRIES
+from utils.metrics import get_metrics, get_operation_name
+from utils.dates import parse_iso_datetime
+from datetime import datetime, timezone
+import json
 from typing import Optional
-from gql import Client
-from gql.transport.requests import RequestsHTTPTransport
 import os
 from dotenv import load_dotenv
 import time
@@ -11,29 +17,111 @@ load_dotenv()
 SC_EMAIL = os.getenv("SC_EMAIL")
 SC_PASSWORD = os.getenv("SC_PASSWORD")
 
-class SensCritiqueGqlClient(Client):
-    def __init__(self, url: str, email: str, password: str):
+# SensCritique GraphQL endpoint (overridable to point the client at a local stand-in, see benchmarks/)
+SC_API_URL = os.getenv("SC_API_URL", "https://apollo.senscritique.com/")
+
+# Signed-in session reused between runs until SC_SESSION_REFRESH_MARGIN seconds before it expires
+SC_SESSION_PATH = os.getenv("SC_SESSION_PATH", "sc_session.json")
+SC_SESSION_REFRESH_MARGIN = int(os.getenv("SC_SESSION_REFRESH_MARGIN", "3600"))
+
+# HTTP transport tuning
+SC_HTTP_POOL_SIZE = int(os.getenv("SC_HTTP_POOL_SIZE", "10"))
+SC_HTTP_TIMEOUT = float(os.getenv("SC_HTTP_TIMEOUT", "30"))
+SC_HTTP_CONNECT_TIMEOUT = float(os.getenv("SC_HTTP_CONNECT_TIMEOUT", "10"))
+
+# Requests issued in the same event-loop tick are sent together (set SC_GQL_BATCHING=false to disable)
+SC_GQL_BATCHING = os.getenv("SC_GQL_BATCHING", "true").lower() == "true"
+SC_GQL_MAX_BATCH_SIZE = int(os.getenv("SC_GQL_MAX_BATCH_SIZE", "20"))
+
+
+class GraphQLRequestFailed(Exception):
+    """Raised when the GraphQL endpoint answers with an HTTP error."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+    @property
+    def permanent(self):
+        """Client errors other than authentication, timeout and throttling will fail again if retried."""
+        return self.status_code is not None and 400 <= self.status_code < 500 and self.status_code not in (401, 408, 429)
+
+class GraphQLBatchRejected(Exception):
+    """Raised when the GraphQL server rejects a batch of operations (its operations can still be sent one by one)."""
+
+class GraphQLBatchingNotSupported(GraphQLBatchRejected):
+    """Raised when the GraphQL server does not accept an array of operations at all."""
+
+class SensCritiqueGqlClient:
+    def __init__(self, url: str, email: str, password: str, pool_size: int = SC_HTTP_POOL_SIZE,
+                 timeout: float = SC_HTTP_TIMEOUT, connect_timeout: float = SC_HTTP_CONNECT_TIMEOUT, http2: bool = True,
+                 batching: bool = SC_GQL_BATCHING, max_batch_size: int = SC_GQL_MAX_BATCH_SIZE,
+                 session_path: str = SC_SESSION_PATH, session_refresh_margin: int = SC_SESSION_REFRESH_MARGIN):
+        self.url = url
         self.email = email
         self.password = password
         self.cookie_ref = None
+        self.session_path = session_path
+        self.session_refresh_margin = session_refresh_margin
+        self.auth_lock = None
 
-        # Sign in immediately to obtain the cookieRef
-        self.cookie_ref = self.sign_in_with_email_and_password()
+        # Non-blocking transport settings, the pooled client itself is created on first request
+        self.pool_size = pool_size
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.http2 = http2
+        self.http_client = None
+        self.http_client_loop = None
 
-        # Prepare headers for authenticated Apollo access
-        headers = {
-            "Authorization": self.cookie_ref,
-            "User-Agent": "Mozilla/5.0",
-            "Content-Type": "application/json"
-        }
+        # Requests waiting to be sent in the next batch
+        self.batching = batching
+        self.max_batch_size = max_batch_size
+        self.pending_requests = []
+        self.flush_scheduled = False
+        # Batches being sent (the event loop only keeps weak references to its tasks)
+        self.batch_tasks = set()
+
+        # Reuse the session saved by a previous run, sign in only if there is none or it is about to expire
+        self.cookie_ref = self.load_session() or self.sign_in_with_email_and_password()
 
-        transport = RequestsHTTPTransport(url=url, headers=headers)
-        super().__init__(transport=transport)
         self.client = self  # Required for async raw_request
 
     @classmethod
-    def build(cls, email: str, password: str) -> Optional['SensCritiqueGqlClient']:
-        return cls("https://apollo.senscritique.com/", email, password)
+    def build(cls, email: str, password: str, **kwargs) -> Optional['SensCritiqueGqlClient']:
+        return cls(SC_API_URL, email, password, **kwargs)
+
+    def get_http_client(self) -> httpx.AsyncClient:
+        """
+        Returns the pooled asynchronous HTTP client, creating it on first use.
+
+        Connections are kept alive between GraphQL calls and negotiated as HTTP/2 when the server supports it.
+        Pooled connections belong to the event loop that opened them: a client still open when another loop asks
+        for one is closed on its own loop if that loop is still running.
+
+        Raises:
+            RuntimeError: If the previous client is still open and its loop stopped (call `aclose()` before it ends).
+        """
+        loop = asyncio.get_running_loop()
+
+        if self.http_client is not None and not self.http_client.is_closed and self.http_client_loop is not loop:
+            if not self.http_client_loop.is_running():
+                raise RuntimeError("The SensCritique HTTP client was not closed before its event loop stopped, "
+                                   "await aclose() before leaving the loop.")
+            asyncio.run_coroutine_threadsafe(self.http_client.aclose(), self.http_client_loop)
+
+        if self.http_client is None or self.http_client.is_closed or self.http_client_loop is not loop:
+            limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            self.http_client = httpx.AsyncClient(http2=self.http2, limits=limits, timeout=self.timeout)
+            self.http_client_loop = loop
+            self.auth_lock = asyncio.Lock()
+
+        return self.http_client
+
+    async def aclose(self):
+        """Closes the pooled HTTP connections."""
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+            self.http_client_loop = None
 
     def sign_in_with_email_and_password(self) -> str:
         """
@@ -63,49 +151,252 @@ class SensCritiqueGqlClient(Client):
             "Content-Type": "application/json"
         }
 
-        response = requests.post(
-            "https://apollo.senscritique.com/",
+        session = requests.Session()
+        session.mount("https://", RateLimitedAdapter())
+        session.mount("http://", RateLimitedAdapter())
+
+        response = session.post(
+            self.url,
             json={"query": mutation, "variables": variables},
-            headers=headers
+            headers=headers,
+            timeout=self.timeout.read
         )
 
         if response.status_code == 200:
             data = response.json()
-            cookie_ref = data["data"]["signInWithEmailAndPassword"]["userCookie"]["cookieRef"]
+            user_cookie = data["data"]["signInWithEmailAndPassword"]["userCookie"]
+            cookie_ref = user_cookie["cookieRef"]
             print(f"Signed user {self.email} successfully with SensCritique API!")
-            
+
+            self.save_session(cookie_ref, user_cookie.get("dateExpiration"))
             return cookie_ref
         else:
             raise Exception(f"Failed to sign in: {response.status_code} - {response.text}")
 
-    async def request(self, document: str, variables: dict = None):
-        return await self.raw_request(document, variables)
+    def load_session(self) -> Optional[str]:
+        """
+        Returns the cookieRef saved by a previous run, or None if there is none, it belongs to another
+        account, or it expires in less than `session_refresh_margin` seconds.
+        """
+        if not self.session_path or not os.path.exists(self.session_path):
+            return None
 
-    async def raw_request(self, query, variables=None):
+        try:
+            with open(self.session_path, "r") as f:
+                session = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable SensCritique session {self.session_path}: {e}")
+            return None
+
+        expiration = parse_iso_datetime(session.get("dateExpiration"))
+        if session.get("email") != self.email or not session.get("cookieRef") or expiration is None:
+            return None
+
+        if (expiration - datetime.now(timezone.utc)).total_seconds() < self.session_refresh_margin:
+            print("Saved SensCritique session is about to expire, signing in again.")
+            return None
+
+        print(f"Reusing the SensCritique session of {self.email} (valid until {session['dateExpiration']}).")
+        return session["cookieRef"]
+
+    def save_session(self, cookie_ref, date_expiration):
+        """Saves the cookieRef and its expiration date in a file only readable by the current user."""
+        if not self.session_path or not date_expiration:
+            return
+
+        temporary_path = f"{self.session_path}.tmp"
+        try:
+            descriptor = os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(descriptor, "w") as f:
+                json.dump({"email": self.email, "cookieRef": cookie_ref, "dateExpiration": date_expiration}, f)
+            os.replace(temporary_path, self.session_path)
+        except OSError as e:
+            print(f"Could not save the SensCritique session to {self.session_path}: {e}")
+
+    async def _reauthenticate(self, rejected_cookie_ref):
+        """Signs in again, once for all the requests that were rejected with the same cookieRef."""
+        async with self.auth_lock:
+            if self.cookie_ref == rejected_cookie_ref:
+                print("SensCritique session rejected, signing in again...")
+                self.cookie_ref = await asyncio.to_thread(self.sign_in_with_email_and_password)
+
+    async def request(self, document: str, variables: dict = None):
         """
-        Executes a raw GraphQL request with Apollo cookieRef.
+        Executes a GraphQL request, coalesced with the other requests issued in the same event-loop tick.
+
+        Coalesced requests are sent as one HTTP POST holding an array of operations (Apollo query batching).
+        Each caller still gets back its own response (or exception). A rejected batch is sent again one
+        request per POST; only a server refusing batches altogether turns batching off for good.
+
+        The latency of each operation (batching wait included) is recorded in the metrics.
         """
+        with get_metrics().measure("senscritique-graphql", get_operation_name("POST", self.url, document)):
+            return await self._request(document, variables)
+
+    async def _request(self, document, variables):
+        if not self.batching:
+            return await self.raw_request(document, variables)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending_requests.append((document, variables, future))
+
+        # Flush once every request ready in this tick has been queued
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            loop.call_soon(self._flush_pending_requests)
+
+        return await future
+
+    def _flush_pending_requests(self):
+        self.flush_scheduled = False
+        pending_requests, self.pending_requests = self.pending_requests, []
+
+        for i in range(0, len(pending_requests), self.max_batch_size):
+            task = asyncio.ensure_future(self._send_batch(pending_requests[i:i + self.max_batch_size]))
+            self.batch_tasks.add(task)
+            task.add_done_callback(self.batch_tasks.discard)
+
+    async def _send_batch(self, batch):
+        if len(batch) == 1 or not self.batching:
+            await asyncio.gather(*(self._send_single(document, variables, future) for document, variables, future in batch))
+            return
+
+        try:
+            responses = await self.raw_batch_request([(document, variables) for document, variables, _ in batch])
+        except GraphQLBatchRejected as e:
+            if isinstance(e, GraphQLBatchingNotSupported):
+                print(f"SensCritique API does not support batched requests, sending requests one by one from now on: {e}")
+                self.batching = False
+            else:
+                print(f"SensCritique API rejected a batched request, sending its requests one by one: {e}")
+            await asyncio.gather(*(self._send_single(document, variables, future) for document, variables, future in batch))
+            return
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, _, future), response in zip(batch, responses):
+            if not future.done():
+                future.set_result(response)
+
+    async def _send_single(self, document, variables, future):
+        try:
+            response = await self.raw_request(document, variables)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(response)
+
+    def _get_headers(self):
         if not self.cookie_ref:
             raise ValueError("Not authenticated. No cookieRef available.")
 
-        headers = {
+        return {
             "Authorization": self.cookie_ref,
             "User-Agent": "Mozilla/5.0",
             "Content-Type": "application/json"
         }
 
+    async def _post(self, body):
+        """
+        POST a body to the API through the shared rate limiter, retrying when the server throttles.
+
+        A request rejected because the session expired is replayed once after signing in again.
+        """
+        rate_limiter = get_rate_limiter()
+        metrics = get_metrics()
+        host = urlparse(self.url).hostname
+        operation = "batch" if isinstance(body, list) else get_operation_name("POST", self.url, body["query"])
+
+        reauthenticated = False
+        attempt = 0
+        while True:
+            await rate_limiter.acquire_async(host)
+
+            started_at = time.perf_counter()
+            cookie_ref = self.cookie_ref
+            try:
+                response = await self.get_http_client().post(self.url, json=body, headers=self._get_headers())
+            except Exception:
+                metrics.observe(host, operation, time.perf_counter() - started_at, error=True)
+                raise
+
+            metrics.observe(host, operation, time.perf_counter() - started_at, error=response.status_code >= 400,
+                            bytes_sent=len(response.request.content), bytes_received=len(response.content))
+
+            # Expired or revoked session: sign in again and replay the request once
+            if not reauthenticated and self._is_unauthenticated(response):
+                reauthenticated = True
+                metrics.record_retry(host, operation)
+                await self._reauthenticate(cookie_ref)
+                continue
+
+            delay = rate_limiter.on_response(host, response.status_code, response.headers)
+            if delay is None or attempt == RATE_LIMIT_MAX_RETRIES:
+                return response
+
+            attempt += 1
+            metrics.record_retry(host, operation)
+
+            print(f"Throttled by {host} ({response.status_code}), retrying in {delay:.1f}s "
+                  f"at {rate_limiter.current_rate(host):.2f} requests/s...")
+
+    def _is_unauthenticated(self, response):
+        """True for a 401, or a GraphQL answer whose errors say the session is not valid anymore."""
+        if response.status_code == 401:
+            return True
+        return response.status_code == 200 and b"UNAUTHENTICATED" in response.content
+
+    async def raw_request(self, query, variables=None):
+        """
+        Executes a raw GraphQL request with Apollo cookieRef.
+        """
         body = {
             "query": query,
             "variables": variables
         }
 
-        response = requests.post(
-            "https://apollo.senscritique.com/",
-            json=body,
-            headers=headers
-        )
+        response = await self._post(body)
 
         if response.status_code == 200:
             return response.json()
         else:
-            raise Exception(f"GraphQL request failed: {response.status_code} - {response.text}")
+            raise GraphQLRequestFailed(f"GraphQL request failed: {response.status_code} - {response.text}", response.status_code)
+
+    async def raw_batch_request(self, operations):
+        """
+        Executes several GraphQL operations in a single HTTP POST.
+
+        Args:
+            operations (list): (query, variables) tuples.
+
+        Returns:
+            list: One response per operation, in the same order.
+
+        Raises:
+            GraphQLBatchingNotSupported: If the server does not answer with one response per operation, or says
+                it does not accept batches.
+            GraphQLBatchRejected: If the server rejects this batch (400) for another reason, e.g. one invalid operation.
+        """
+        body = [{"query": query, "variables": variables} for query, variables in operations]
+
+        response = await self._post(body)
+
+        if response.status_code == 200:
+            responses = response.json()
+            if isinstance(responses, list) and len(responses) == len(operations):
+                return responses
+            raise GraphQLBatchingNotSupported(f"{response.status_code} - {response.text[:200]}")
+
+        if response.status_code == 400:
+            # e.g. Apollo's "Operation batching disabled." or "POST body must be an object"
+            if "batch" in response.text.lower() or "must be an object" in response.text.lower():
+                raise GraphQLBatchingNotSupported(f"{response.status_code} - {response.text[:200]}")
+            raise GraphQLBatchRejected(f"{response.status_code} - {response.text[:200]}")
+
+        raise GraphQLRequestFailed(f"GraphQL batch request failed: {response.status_code} - {response.text}", response.status_code)
@@ -1,4 +1,3 @@
-import firebase_admin
 import os
 from dotenv import load_dotenv
 
@@ -20,9 +19,17 @@ class SensCritiqueApp:
         "storageBucket": 'fir-sc-ea332.appspot.com',
     }
 
-    # Firebase app initialization (using the default app, no need for a JSON file)
-    firebaseApp = firebase_admin.initialize_app()
+    # Firebase app, initialized on first use (firebase_admin is slow to import and needs credentials)
+    firebaseApp = None
 
     def __init__(self):
         """Initialize the SensCritiqueApp."""
         pass  # No need for additional logic here since everything is static
+
+    @classmethod
+    def get_firebase_app(cls):
+        """Returns the Firebase app (using the default app, no need for a JSON file)."""
+        if cls.firebaseApp is None:
+            import firebase_admin
+            cls.firebaseApp = firebase_admin.initialize_app()
+        return cls.firebaseApp
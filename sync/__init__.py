@@ -0,0 +1,8 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Maximum number of items resolved (or written) at the same time during bulk operations
+SYNC_CONCURRENCY = int(os.getenv("SYNC_CONCURRENCY", "8"))
@@ -0,0 +1,124 @@
+import os
+import time
+import random
+import signal
+import asyncio
+from dotenv import load_dotenv
+from utils.metrics import get_metrics
+
+# Load environment variables
+load_dotenv()
+
+# Seconds between two runs of each sync, and share of random jitter applied to these intervals
+SYNC_WATCHLISTS_INTERVAL = float(os.getenv("SYNC_WATCHLISTS_INTERVAL", "900"))
+SYNC_RATINGS_INTERVAL = float(os.getenv("SYNC_RATINGS_INTERVAL", "600"))
+SYNC_WATCH_HISTORY_INTERVAL = float(os.getenv("SYNC_WATCH_HISTORY_INTERVAL", "3600"))
+SYNC_INTERVAL_JITTER = float(os.getenv("SYNC_INTERVAL_JITTER", "0.1"))
+# Seconds between two full reconciliations (runs ignoring the incremental watermarks)
+SYNC_FULL_RECONCILIATION_INTERVAL = float(os.getenv("SYNC_FULL_RECONCILIATION_INTERVAL", str(24 * 3600)))
+
+
+class SyncJob:
+    """
+    A sync run periodically by the daemon.
+
+    `run` is an async function called with `full=True` for a full reconciliation (every
+    `full_interval` seconds) and `full=False` for the incremental runs in between.
+    """
+
+    def __init__(self, name, run, interval, jitter=SYNC_INTERVAL_JITTER, full_interval=SYNC_FULL_RECONCILIATION_INTERVAL):
+        self.name = name
+        self.run = run
+        self.interval = interval
+        self.jitter = jitter
+        self.full_interval = full_interval
+        self.task = None
+        self.runs = 0
+        self.skipped = 0
+        self.failures = 0
+
+    def next_delay(self):
+        """Seconds until the next tick: the interval, give or take `jitter` of it so that jobs drift apart."""
+        return max(0.0, self.interval * (1 + random.uniform(-self.jitter, self.jitter)))
+
+
+class SyncDaemon:
+    """
+    Keeps the clients, their connection pools and caches alive, and runs each job at its own interval.
+
+    A job whose previous run is still going skips its tick. Runs of different jobs never overlap (they share
+    the mutation queue and the sync state), a job that is due waits for `run_lock` to be released. The date of
+    each job's last full reconciliation is kept in the sync state, so restarting the daemon does not trigger one.
+    """
+
+    def __init__(self, jobs, sync_state, run_lock=None):
+        self.jobs = jobs
+        self.sync_state = sync_state
+        self.run_lock = run_lock or asyncio.Lock()
+        self.stopping = asyncio.Event()
+
+    def stop(self):
+        """Stops scheduling new runs. Runs in progress are allowed to finish."""
+        if not self.stopping.is_set():
+            print("Stopping the sync daemon after the current runs...")
+            self.stopping.set()
+
+    async def run_forever(self):
+        """Runs every job immediately, then at its interval, until `stop()` is called."""
+        print("Sync daemon started: " + ", ".join(f"{job.name} every {job.interval:.0f}s" for job in self.jobs))
+        schedulers = [asyncio.ensure_future(self._schedule(job)) for job in self.jobs]
+        try:
+            await self.stopping.wait()
+        finally:
+            for scheduler in schedulers:
+                scheduler.cancel()
+
+            running = [job.task for job in self.jobs if job.task and not job.task.done()]
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+            print("Sync daemon stopped.")
+
+    async def _schedule(self, job):
+        while not self.stopping.is_set():
+            if job.task and not job.task.done():
+                job.skipped += 1
+                print(f"Skipping this {job.name} tick: the previous run has not finished yet.")
+            else:
+                job.task = asyncio.ensure_future(self._execute(job))
+
+            try:
+                await asyncio.wait_for(self.stopping.wait(), timeout=job.next_delay())
+            except asyncio.TimeoutError:
+                pass
+
+    async def _execute(self, job):
+        async with self.run_lock:
+            if self.stopping.is_set():
+                return
+
+            watermark_name = f"full_reconciliation:{job.name}"
+            last_full = float(self.sync_state.get_watermark(watermark_name) or 0)
+            full = time.time() - last_full >= job.full_interval
+
+            print(f"Running {job.name} ({'full reconciliation' if full else 'incremental'})...")
+            try:
+                with get_metrics().phase(job.name):
+                    await job.run(full=full)
+            except Exception as e:
+                job.failures += 1
+                print(f"{job.name} failed, it will run again at the next tick: {e!r}")
+                return
+
+            job.runs += 1
+            if full:
+                self.sync_state.set_watermark(watermark_name, time.time())
+
+
+def stop_on_signals(stop):
+    """Calls `stop()` on SIGINT and SIGTERM, so that a long-running process finishes its current work first."""
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop)
+        except (NotImplementedError, RuntimeError):
+            pass  # Not supported on this platform, Ctrl+C still interrupts the process
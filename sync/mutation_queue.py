@@ -0,0 +1,184 @@
+import os
+import random
+import asyncio
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from utils.metrics import get_metrics
+from sync import SYNC_CONCURRENCY
+
+# Load environment variables
+load_dotenv()
+
+MUTATION_MAX_ATTEMPTS = int(os.getenv("MUTATION_MAX_ATTEMPTS", "4"))
+MUTATION_RETRY_BASE_DELAY = float(os.getenv("MUTATION_RETRY_BASE_DELAY", "1"))
+# Runs in which a write may fail before it is parked (no longer retried)
+MUTATION_MAX_RUNS = int(os.getenv("MUTATION_MAX_RUNS", "5"))
+
+
+class MutationFailed(Exception):
+    """Raised when a client reports that a write did not go through."""
+
+
+def is_permanent_error(error):
+    """Whether retrying a write cannot help, e.g. the product does not exist (errors say so with `permanent`)."""
+    return bool(getattr(error, "permanent", False))
+
+
+class MutationQueue:
+    """
+    Outbound queue of the writes made to Plex and SensCritique (wishlist changes, ratings and done marks).
+
+    Writes are queued during a sync phase and sent by `flush()`. Identical pending writes collapse:
+    a product rated twice keeps the last rating, a product wished then unwished is only unwished.
+    Failing writes are retried with exponential backoff; those still failing are stored as dead letters
+    in the sync state, and `retry_dead_letters()` queues them again on the next run. A write failing in
+    `max_runs` runs, or with a permanent error (see `is_permanent_error`), is parked instead.
+
+    Wishlist writes confirm the sync state entries waiting for them: "pending" ones become "synced",
+    "removing" ones are deleted. Ratings and done marks (with the date of the view they were sent for) are recorded too.
+
+    Each client may be given as a function returning it, so that it is only created when a write needs it.
+    """
+
+    SC_WISH = "sc_wish"
+    SC_RATE = "sc_rate"
+    SC_DONE = "sc_done"
+    PLEX_RATE = "plex_rate"
+
+    def __init__(self, sc_client, plex_client, sync_state, max_attempts=MUTATION_MAX_ATTEMPTS,
+                 base_delay=MUTATION_RETRY_BASE_DELAY, concurrency=SYNC_CONCURRENCY, max_runs=MUTATION_MAX_RUNS):
+        self.sc_client = sc_client
+        self.plex_client = plex_client
+        self.sync_state = sync_state
+        self.max_attempts = max_attempts
+        self.max_runs = max_runs
+        self.base_delay = base_delay
+        self.concurrency = concurrency
+        self.pending = {}  # (kind, target) -> payload
+
+    def __len__(self):
+        return len(self.pending)
+
+    def get_sc_client(self):
+        return self.sc_client() if callable(self.sc_client) else self.sc_client
+
+    def get_plex_client(self):
+        return self.plex_client() if callable(self.plex_client) else self.plex_client
+
+    def enqueue(self, kind, target, payload):
+        """Queues a write. A pending write with the same kind and target is replaced by this one."""
+        self.pending[(kind, target)] = payload
+
+    def wish_on_sc(self, media_id):
+        self.enqueue(self.SC_WISH, media_id, {"media_id": media_id, "wished": True})
+
+    def unwish_on_sc(self, media_id):
+        self.enqueue(self.SC_WISH, media_id, {"media_id": media_id, "wished": False})
+
+    def rate_on_sc(self, media_id, rating):
+        self.enqueue(self.SC_RATE, media_id, {"media_id": media_id, "rating": rating})
+
+    def mark_done_on_sc(self, media_id, viewed_at=None):
+        self.enqueue(self.SC_DONE, media_id, {"media_id": media_id, "viewedAt": viewed_at})
+
+    def rate_on_plex(self, rating_key, rating):
+        self.enqueue(self.PLEX_RATE, rating_key, {"ratingKey": rating_key, "rating": rating})
+
+    def retry_dead_letters(self):
+        """Queues the writes that failed during previous runs. Returns how many were queued."""
+        dead_letters = self.sync_state.dead_letters()
+        for dead_letter in dead_letters:
+            payload = dead_letter["payload"]
+            target = payload.get("media_id", payload.get("ratingKey"))
+            # Writes queued since then are more recent and win
+            self.pending.setdefault((dead_letter["kind"], target), payload)
+
+        if dead_letters:
+            print(f"Retrying {len(dead_letters)} writes that failed during previous runs.")
+        return len(dead_letters)
+
+    async def flush(self):
+        """
+        Sends every pending write, at most `concurrency` at a time.
+
+        Returns:
+            tuple: (number of writes that succeeded, number of writes moved to the dead letters)
+        """
+        pending, self.pending = self.pending, {}
+        if not pending:
+            return 0, 0
+
+        print(f"Sending {len(pending)} queued writes...")
+        semaphore = asyncio.Semaphore(max(1, self.concurrency))
+
+        async def send(kind, target, payload):
+            async with semaphore:
+                return await self._send_with_retries(kind, target, payload)
+
+        results = await asyncio.gather(*(send(kind, target, payload) for (kind, target), payload in pending.items()))
+
+        succeeded = sum(1 for result in results if result)
+        failed = len(results) - succeeded
+        if failed:
+            print(f"{failed} writes failed, those not parked will be retried on the next run.")
+        return succeeded, failed
+
+    async def _send_with_retries(self, kind, target, payload):
+        metrics = get_metrics()
+        error = None
+        attempts = 0
+        for attempt in range(1, self.max_attempts + 1):
+            attempts = attempt
+            try:
+                with metrics.measure("mutations", kind):
+                    await self._send(kind, payload)
+                self.sync_state.remove_dead_letter(kind, target)
+                self._confirm(kind, target, payload)
+                return True
+            except Exception as e:
+                error = e
+                if is_permanent_error(e):
+                    break
+                if attempt < self.max_attempts:
+                    metrics.record_retry("mutations", kind)
+                    delay = self.base_delay * 2 ** (attempt - 1) * random.uniform(0.8, 1.2)
+                    print(f"Write {kind} [{target}] failed ({e}), retrying in {delay:.1f}s ({attempt}/{self.max_attempts})...")
+                    await asyncio.sleep(delay)
+
+        permanent = is_permanent_error(error)
+        runs = self.sync_state.add_dead_letter(kind, target, payload, attempts, error, parked=permanent)
+        if permanent:
+            print(f"Write {kind} [{target}] was rejected ({error}), it will not be retried.")
+        elif runs >= self.max_runs:
+            self.sync_state.park_dead_letter(kind, target)
+            print(f"Write {kind} [{target}] failed in {runs} runs, it will not be retried anymore.")
+        return False
+
+    def _confirm(self, kind, target, payload):
+        if kind == self.SC_WISH:
+            if payload["wished"]:
+                self.sync_state.confirm(target, "pending", "synced")
+            else:
+                self.sync_state.confirm(target, "removing")
+        elif kind == self.SC_RATE:
+            self.sync_state.set_sc_rating(target, payload["rating"])
+        elif kind == self.SC_DONE:
+            self.sync_state.set_done_mark(target, payload.get("viewedAt") or datetime.now(timezone.utc).isoformat())
+
+    async def _send(self, kind, payload):
+        if kind == self.SC_WISH:
+            if payload["wished"]:
+                succeeded = await self.get_sc_client().add_media_to_wishlist(payload["media_id"], raise_errors=True)
+            else:
+                succeeded = await self.get_sc_client().remove_media_from_wishlist(payload["media_id"], raise_errors=True)
+        elif kind == self.SC_RATE:
+            succeeded = bool(await self.get_sc_client().rate_media_with_id(payload["media_id"], payload["rating"]))
+        elif kind == self.SC_DONE:
+            succeeded = await self.get_sc_client().mark_media_as_done(payload["media_id"], raise_errors=True)
+        elif kind == self.PLEX_RATE:
+            succeeded = await asyncio.to_thread(self.get_plex_client().rate_media, payload["ratingKey"], payload["rating"])
+        else:
+            raise ValueError(f"Unknown write kind: {kind}")
+
+        if not succeeded:
+            raise MutationFailed(f"{kind} was not applied")
@@ -0,0 +1,198 @@
+import json
+from utils.dates import parse_iso_datetime
+from utils.media_cache import normalize_title, normalize_universe
+
+
+def media_key(title, year, universe):
+    """Hashable key identifying the same media on both services: (normalized title, year, universe id)."""
+    return normalize_title(title), year, normalize_universe(universe)
+
+
+def rating_key(item):
+    """Key used to compare rated items of both services: (lowercased title, year)."""
+    return item["title"].lower(), item["year"]
+
+
+class SyncPlan:
+    """
+    Ordered list of the actions a sync will perform, computed before anything is written.
+
+    Each action is a dict with an "action" name and the details needed to execute it. A plan can be
+    serialized (printed as JSON for --dry-run) and executed later as a separate stage.
+    """
+
+    # Watchlist actions
+    ADD_TO_SC = "add_to_sc"
+    ADD_TO_PLEX = "add_to_plex"
+    LINK = "link"
+    REMOVE_FROM_SC = "remove_from_sc"
+    REMOVE_FROM_PLEX = "remove_from_plex"
+
+    # Rating actions
+    RATE_ON_SC = "rate_on_sc"
+    RATE_ON_PLEX = "rate_on_plex"
+
+    # Watch history actions
+    MARK_DONE_ON_SC = "mark_done_on_sc"
+
+    def __init__(self, name):
+        self.name = name
+        self.actions = []
+
+    def __len__(self):
+        return len(self.actions)
+
+    def __iter__(self):
+        return iter(self.actions)
+
+    def add(self, action, **details):
+        self.actions.append({"action": action, **details})
+
+    def by_action(self, action):
+        return [planned for planned in self.actions if planned["action"] == action]
+
+    def summary(self):
+        """Returns the number of planned actions per action name."""
+        counts = {}
+        for planned in self.actions:
+            counts[planned["action"]] = counts.get(planned["action"], 0) + 1
+        return counts
+
+    def to_dict(self):
+        return {"plan": self.name, "summary": self.summary(), "actions": self.actions}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=4, ensure_ascii=False, default=str)
+
+
+def plan_watchlists(plex_watchlist, sc_wishlist, synced_entries):
+    """
+    Compute the actions that bring the Plex watchlist and the SensCritique wishlist in sync.
+
+    Both sides and the sync entries are indexed once in hash maps, so planning is linear in their sizes.
+
+    Args:
+        plex_watchlist (list): Plex watchlist items (title, year, type, guid).
+        sc_wishlist (list): SensCritique wishes, as returned by fetch_user_wishes.
+        synced_entries (list): Sync state entries with status "synced".
+
+    Returns:
+        SyncPlan: add_to_sc / add_to_plex / link for new items, remove_from_sc / remove_from_plex for removed ones.
+    """
+    plan = SyncPlan("watchlists")
+
+    plex_by_key = {media_key(p.title, p.year, p.type): p for p in plex_watchlist}
+    plex_guids = {p.guid for p in plex_watchlist}
+
+    sc_by_key = {}
+    for s in sc_wishlist:
+        year = s["release_date"].year if s.get("release_date") else s.get("year")
+        sc_by_key.setdefault(media_key(s["title"], year, s["universe"]), s)
+        if s.get("original_title"):
+            sc_by_key.setdefault(media_key(s["original_title"], year, s["universe"]), s)
+    sc_ids = {s["id"] for s in sc_wishlist}
+
+    synced_plex_ids = {entry["plex_id"] for entry in synced_entries}
+    synced_sc_ids = {entry["sc_id"] for entry in synced_entries}
+
+    # Step 1: Items new on one side are added to the other one (or just recorded if already on both)
+    for key, plex_media in plex_by_key.items():
+        if plex_media.guid in synced_plex_ids:
+            continue
+
+        sc_media = sc_by_key.get(key)
+        if sc_media and sc_media["id"] not in synced_sc_ids:
+            plan.add(SyncPlan.LINK, title=plex_media.title, year=plex_media.year, type=plex_media.type,
+                     plex_id=plex_media.guid, sc_id=sc_media["id"])
+        elif not sc_media:
+            plan.add(SyncPlan.ADD_TO_SC, title=plex_media.title, year=plex_media.year, type=plex_media.type,
+                     plex_id=plex_media.guid)
+
+    for sc_media in sc_wishlist:
+        if sc_media["id"] in synced_sc_ids:
+            continue
+
+        year = sc_media["release_date"].year if sc_media.get("release_date") else sc_media.get("year")
+        if media_key(sc_media["title"], year, sc_media["universe"]) not in plex_by_key and (
+                not sc_media.get("original_title")
+                or media_key(sc_media["original_title"], year, sc_media["universe"]) not in plex_by_key):
+            plan.add(SyncPlan.ADD_TO_PLEX, title=sc_media["title"], year=year, type=sc_media["universe"],
+                     sc_id=sc_media["id"])
+
+    # Step 2: Synced items missing from one side are removed from the other one
+    for entry in synced_entries:
+        key = media_key(entry["title"], entry["year"], entry["type"])
+
+        if entry["plex_id"] not in plex_guids and key not in plex_by_key:
+            plan.add(SyncPlan.REMOVE_FROM_SC, title=entry["title"], year=entry["year"], type=entry["type"],
+                     sc_id=entry["sc_id"], entry_id=entry["id"])
+        elif entry["sc_id"] not in sc_ids and key not in sc_by_key:
+            plan.add(SyncPlan.REMOVE_FROM_PLEX, title=entry["title"], year=entry["year"], type=entry["type"],
+                     plex_id=entry["plex_id"], entry_id=entry["id"])
+
+    return plan
+
+
+def plan_ratings(plex_rated_items, sc_rated_index, sc_rated_items=None):
+    """
+    Compute the rating updates between Plex and SensCritique.
+
+    Args:
+        plex_rated_items (list): Rated items from PlexClient.get_user_rated_content.
+        sc_rated_index (dict): rating_key(item) -> rating of the SensCritique rated items.
+        sc_rated_items (list): SensCritique rated items to push to Plex, None to only sync Plex to SensCritique.
+
+    Returns:
+        SyncPlan: rate_on_sc and rate_on_plex actions.
+    """
+    plan = SyncPlan("ratings")
+
+    for item in plex_rated_items:
+        key = rating_key(item)
+        if sc_rated_index.get(key) != item["rating"]:
+            plan.add(SyncPlan.RATE_ON_SC, title=item["title"], year=item.get("tvShowYear") or item.get("year"),
+                     type=item["type"].lower(), rating=item["rating"], reviewText=item.get("reviewText"),
+                     reviewHasSpoilers=item.get("reviewHasSpoilers"), ratedDate=item.get("ratedDate"))
+
+    if sc_rated_items is not None:
+        plex_rated_index = {rating_key(item): item["rating"] for item in plex_rated_items}
+        for item in sc_rated_items:
+            if plex_rated_index.get(rating_key(item)) != item["rating"]:
+                plan.add(SyncPlan.RATE_ON_PLEX, title=item["title"], year=item["year"], type=item["type"],
+                         rating=item["rating"], reviewText=item.get("reviewText"),
+                         reviewHasSpoilers=item.get("reviewHasSpoilers"))
+
+    return plan
+
+
+def plan_watch_history(watched_items, sc_done_dates):
+    """
+    Compute the done marks missing on SensCritique.
+
+    Args:
+        watched_items (list): Watched items from sync.watch_history.get_watched_items, with their "sc_id".
+        sc_done_dates (dict): SensCritique product id (str) -> date it was marked done (None if not done).
+
+    Returns:
+        SyncPlan: mark_done_on_sc actions, one per product watched on Plex but not done on SensCritique,
+                  or watched again since it was marked done.
+    """
+    plan = SyncPlan("watch_history")
+
+    planned_ids = set()
+    for item in watched_items:
+        sc_id = item.get("sc_id")
+        if sc_id is None or sc_id in planned_ids:
+            continue
+
+        # Compared by day: SensCritique done dates are often a day without a time
+        done_at = parse_iso_datetime(sc_done_dates.get(str(sc_id)))
+        viewed_at = parse_iso_datetime(item["viewedAt"])
+        if done_at and (viewed_at is None or viewed_at.date() <= done_at.date()):
+            continue
+
+        planned_ids.add(sc_id)
+        plan.add(SyncPlan.MARK_DONE_ON_SC, title=item["title"], year=item["year"], type=item["type"],
+                 sc_id=sc_id, viewedAt=item["viewedAt"])
+
+    return plan
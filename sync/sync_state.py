@@ -0,0 +1,249 @@
+import os
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+SYNC_STATE_PATH = os.getenv("SYNC_STATE_PATH", "sync_state.db")
+
+# Legacy sync file, migrated into the database on first use
+SYNC_DATA_JSON_PATH = "sync_data.json"
+
+
+class SyncStateStore:
+    """
+    Persistent record of the items synced between Plex and SensCritique.
+
+    Entries live in SQLite, indexed on plex_id and sc_id. Writes made inside `transaction()` are
+    committed together at the end of the block (one commit per sync phase), writes made outside of it
+    are committed immediately. A crash never leaves a half-written state behind.
+    """
+
+    def __init__(self, path=SYNC_STATE_PATH, json_path=SYNC_DATA_JSON_PATH):
+        self.path = path
+        self.lock = threading.RLock()
+        self.transaction_depth = 0
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=FULL")
+
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS sync_entries (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    plex_id TEXT,
+                    sc_id INTEGER,
+                    title TEXT,
+                    year INTEGER,
+                    type TEXT,
+                    status TEXT
+                )
+            """)
+            self.connection.execute("CREATE INDEX IF NOT EXISTS sync_entries_plex_id ON sync_entries (plex_id)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS sync_entries_sc_id ON sync_entries (sc_id)")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS dead_letters (
+                    kind TEXT NOT NULL,
+                    target TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    attempts INTEGER NOT NULL,
+                    last_error TEXT,
+                    failed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    runs INTEGER NOT NULL DEFAULT 1,
+                    parked INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (kind, target)
+                )
+            """)
+            # Databases created before the dead letters counted their runs
+            columns = {row["name"] for row in self.connection.execute("PRAGMA table_info(dead_letters)")}
+            if "runs" not in columns:
+                self.connection.execute("ALTER TABLE dead_letters ADD COLUMN runs INTEGER NOT NULL DEFAULT 1")
+            if "parked" not in columns:
+                self.connection.execute("ALTER TABLE dead_letters ADD COLUMN parked INTEGER NOT NULL DEFAULT 0")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS done_marks (
+                    sc_id TEXT PRIMARY KEY,
+                    done_at TEXT NOT NULL
+                )
+            """)
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS sc_ratings (
+                    sc_id TEXT PRIMARY KEY,
+                    rating INTEGER NOT NULL
+                )
+            """)
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS watermarks (
+                    name TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                )
+            """)
+
+        if json_path:
+            self.migrate_from_json(json_path)
+
+    @contextmanager
+    def transaction(self):
+        """Groups every write of the block into a single atomic commit (rolled back on error)."""
+        with self.lock:
+            self.transaction_depth += 1
+            try:
+                yield self
+            except Exception:
+                self.transaction_depth -= 1
+                if self.transaction_depth == 0:
+                    self.connection.rollback()
+                raise
+            else:
+                self.transaction_depth -= 1
+                if self.transaction_depth == 0:
+                    self.connection.commit()
+
+    def _write(self, sql, parameters=()):
+        with self.lock:
+            cursor = self.connection.execute(sql, parameters)
+            if self.transaction_depth == 0:
+                self.connection.commit()
+            return cursor
+
+    def find(self, plex_id=None, sc_id=None):
+        """
+        Finds the sync entry of an item by its Plex id or its SensCritique id.
+
+        Returns:
+            dict: The matching entry, or None if the item was never synced.
+        """
+        with self.lock:
+            row = None
+            if plex_id is not None:
+                row = self.connection.execute("SELECT * FROM sync_entries WHERE plex_id = ?", (plex_id,)).fetchone()
+            if row is None and sc_id is not None:
+                row = self.connection.execute("SELECT * FROM sync_entries WHERE sc_id = ?", (sc_id,)).fetchone()
+            return dict(row) if row else None
+
+    def entries(self, status=None):
+        """Returns every sync entry, optionally filtered by status."""
+        with self.lock:
+            if status:
+                rows = self.connection.execute("SELECT * FROM sync_entries WHERE status = ? ORDER BY id", (status,))
+            else:
+                rows = self.connection.execute("SELECT * FROM sync_entries ORDER BY id")
+            return [dict(row) for row in rows]
+
+    def add(self, plex_id, sc_id, title, year, media_type, status):
+        """Records a synced item and returns its entry id."""
+        cursor = self._write(
+            "INSERT INTO sync_entries (plex_id, sc_id, title, year, type, status) VALUES (?, ?, ?, ?, ?, ?)",
+            (plex_id, sc_id, title, year, media_type, status)
+        )
+        return cursor.lastrowid
+
+    def set_status(self, entry_id, status):
+        self._write("UPDATE sync_entries SET status = ? WHERE id = ?", (status, entry_id))
+
+    def remove(self, entry_id):
+        self._write("DELETE FROM sync_entries WHERE id = ?", (entry_id,))
+
+    def confirm(self, sc_id, status, new_status=None):
+        """
+        Moves the entries of a SensCritique item from `status` to `new_status` once the write they wait for
+        went through, or removes them if `new_status` is None.
+        """
+        if new_status is None:
+            self._write("DELETE FROM sync_entries WHERE sc_id = ? AND status = ?", (sc_id, status))
+        else:
+            self._write("UPDATE sync_entries SET status = ? WHERE sc_id = ? AND status = ?", (new_status, sc_id, status))
+
+    def get_watermark(self, name):
+        """Returns the high-water mark (an ISO date) saved under `name`, or None."""
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM watermarks WHERE name = ?", (name,)).fetchone()
+            return row["value"] if row else None
+
+    def set_watermark(self, name, value):
+        """Saves the high-water mark `name`, typically once a sync finished successfully."""
+        self._write("INSERT OR REPLACE INTO watermarks (name, value) VALUES (?, ?)", (name, str(value)))
+
+    def done_marks(self):
+        """Returns SensCritique product id (str) -> date (ISO) of the view of the done marks sent by the sync."""
+        with self.lock:
+            return {row["sc_id"]: row["done_at"] for row in self.connection.execute("SELECT * FROM done_marks")}
+
+    def set_done_mark(self, sc_id, done_at):
+        """Records that a SensCritique product was marked done for the view of `done_at`."""
+        self._write("INSERT OR REPLACE INTO done_marks (sc_id, done_at) VALUES (?, ?)", (str(sc_id), str(done_at)))
+
+    def get_sc_rating(self, sc_id):
+        """Returns the last rating the sync sent to SensCritique for this product, or None."""
+        with self.lock:
+            row = self.connection.execute("SELECT rating FROM sc_ratings WHERE sc_id = ?", (str(sc_id),)).fetchone()
+            return row["rating"] if row else None
+
+    def set_sc_rating(self, sc_id, rating):
+        """Records a rating that went through on SensCritique."""
+        self._write("INSERT OR REPLACE INTO sc_ratings (sc_id, rating) VALUES (?, ?)", (str(sc_id), rating))
+
+    def dead_letters(self, parked=False):
+        """Returns the mutations that failed every retry (or, with `parked`, those given up on), oldest first."""
+        with self.lock:
+            rows = self.connection.execute("SELECT * FROM dead_letters WHERE parked = ? ORDER BY failed_at, rowid", (int(parked),))
+            return [dict(row, payload=json.loads(row["payload"])) for row in rows]
+
+    def add_dead_letter(self, kind, target, payload, attempts, last_error, parked=False):
+        """
+        Records a mutation that failed every retry, so that the next run retries it (unless it is `parked`).
+
+        Returns:
+            int: The number of runs in which the mutation failed, this one included.
+        """
+        self._write(
+            """
+            INSERT INTO dead_letters (kind, target, payload, attempts, last_error, parked) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (kind, target) DO UPDATE SET payload = excluded.payload, attempts = excluded.attempts,
+                last_error = excluded.last_error, failed_at = CURRENT_TIMESTAMP, runs = runs + 1, parked = excluded.parked
+            """,
+            (kind, str(target), json.dumps(payload), attempts, str(last_error), int(parked))
+        )
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT runs FROM dead_letters WHERE kind = ? AND target = ?", (kind, str(target))
+            ).fetchone()
+            return row["runs"]
+
+    def park_dead_letter(self, kind, target):
+        """Stops retrying a dead letter; it stays recorded (see `dead_letters(parked=True)`)."""
+        self._write("UPDATE dead_letters SET parked = 1 WHERE kind = ? AND target = ?", (kind, str(target)))
+
+    def remove_dead_letter(self, kind, target):
+        self._write("DELETE FROM dead_letters WHERE kind = ? AND target = ?", (kind, str(target)))
+
+    def migrate_from_json(self, json_path):
+        """
+        Imports the legacy sync_data.json file once, then renames it to '<name>.migrated'.
+
+        Nothing is imported when the database already holds entries.
+        """
+        if not os.path.exists(json_path):
+            return
+
+        with self.lock:
+            if self.connection.execute("SELECT COUNT(*) FROM sync_entries").fetchone()[0]:
+                print(f"Sync database already populated, skipping migration of {json_path}.")
+                return
+
+            with open(json_path, "r") as f:
+                sync_data = json.load(f)
+
+            with self.transaction():
+                for entry in sync_data:
+                    self.add(entry.get("plex_id"), entry.get("sc_id"), entry.get("title"), entry.get("year"),
+                             entry.get("type"), entry.get("status"))
+
+        os.replace(json_path, f"{json_path}.migrated")
+        print(f"Migrated {len(sync_data)} sync entries from {json_path} to {self.path}.")
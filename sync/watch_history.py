@@ -0,0 +1,102 @@
+import asyncio
+from datetime import datetime, timezone
+from sync import SYNC_CONCURRENCY
+
+
+def _get_key(view, prefix=""):
+    """Returns the ratingKey of a view (or of its parent/grandparent), from '<prefix>RatingKey' or '<prefix>Key'."""
+    rating_key = view.get(f"{prefix}RatingKey" if prefix else "ratingKey")
+    if rating_key is None and view.get(f"{prefix}Key" if prefix else "key"):
+        rating_key = view[f"{prefix}Key" if prefix else "key"].rstrip("/").rsplit("/", 1)[-1]
+    return str(rating_key) if rating_key is not None else None
+
+
+def _get_year(metadata):
+    if metadata.get("year"):
+        return int(metadata["year"])
+    if metadata.get("originallyAvailableAt"):
+        return int(str(metadata["originallyAvailableAt"])[:4])
+    return None
+
+
+def get_watched_items(plex_client, views):
+    """
+    Turns views of the local Plex server into watched items, one per movie or episode.
+
+    Views must come newest first (the history order): the first view of an item is its last one.
+    The years SensCritique needs (the movie year, the show year of an episode) are not in the history,
+    they are fetched for every distinct movie and show at once, in batches.
+
+    Args:
+        plex_client (PlexClient): The Plex client.
+        views (iterable): History entries (or webhook metadata) with "ratingKey", "type", "title"...
+
+    Returns:
+        list: Watched items: "ratingKey", "title" (episodes formatted as 'Show - S01E02 - Title'),
+              "type", "year" and "viewedAt" (ISO date), newest first.
+    """
+    last_views = {}
+    for view in views:
+        rating_key = _get_key(view)
+        if view.get("type") in ("movie", "episode") and rating_key not in last_views:
+            last_views[rating_key] = view
+
+    years_to_fetch = [
+        _get_key(view, "grandparent") if view["type"] == "episode" else rating_key
+        for rating_key, view in last_views.items()
+    ]
+    metadata = plex_client.fetch_server_metadata(years_to_fetch)
+
+    watched_items = []
+    for rating_key, view in last_views.items():
+        viewed_at = view.get("viewedAt") or view.get("lastViewedAt")
+
+        if view["type"] == "episode":
+            show = metadata.get(_get_key(view, "grandparent"))
+            year = _get_year(show) if show else None
+            season, episode = int(view.get("parentIndex") or 0), int(view.get("index") or 0)
+            title = f"{view.get('grandparentTitle')} - S{str(season).zfill(2)}E{str(episode).zfill(2)} - {view.get('title')}"
+        else:
+            movie = metadata.get(rating_key)
+            year = _get_year(movie or view)
+            title = (movie or view).get("title")
+
+        # Shows deleted from the library have no year left to search them with
+        if not year:
+            print(f"Skipping '{title}': its year is unknown.")
+            continue
+
+        watched_items.append({
+            "ratingKey": rating_key,
+            "title": title,
+            "type": view["type"],
+            "year": year,
+            "viewedAt": datetime.fromtimestamp(int(viewed_at), timezone.utc).isoformat() if viewed_at else None
+        })
+
+    return watched_items
+
+
+async def resolve_sc_ids(sc_client, watched_items, concurrency=SYNC_CONCURRENCY):
+    """
+    Sets the "sc_id" of each watched item (None when SensCritique has no match).
+
+    Items are resolved through `SensCritiqueClient.fetch_media`, so those matched during a previous run are
+    read from the media cache, and at most `concurrency` searches run at the same time. Items whose search
+    failed (rather than found nothing) also get the error in "sc_error".
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def resolve(item):
+        async with semaphore:
+            media = await sc_client.fetch_media(item["title"], item["year"], item["type"])
+            item["sc_id"] = media["id"] if media else None
+
+    outcomes = await asyncio.gather(*(resolve(item) for item in watched_items), return_exceptions=True)
+    for item, outcome in zip(watched_items, outcomes):
+        if isinstance(outcome, Exception):
+            print(f"Error resolving '{item['title']}' ({item['year']}) on SensCritique: {outcome}")
+            item["sc_id"] = None
+            item["sc_error"] = str(outcome)
+
+    return watched_items
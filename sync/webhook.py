@@ -0,0 +1,254 @@
+import os
+import json
+import time
+import asyncio
+import ipaddress
+import threading
+from email.parser import BytesParser
+from email import policy
+from urllib.parse import urlparse, parse_qs
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+PLEX_USERNAME = os.getenv("PLEX_USERNAME")
+
+# Address of the endpoint receiving the Plex webhooks (add http://<host>:<port>/plex to the Plex webhooks)
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8765"))
+# If set, the webhook URL must end with ?token=<WEBHOOK_TOKEN> (required to listen on other than a loopback address)
+WEBHOOK_TOKEN = os.getenv("WEBHOOK_TOKEN")
+# Seconds without new event before a burst is synced, and maximum seconds an event waits during a long burst
+WEBHOOK_DEBOUNCE = float(os.getenv("WEBHOOK_DEBOUNCE", "5"))
+WEBHOOK_MAX_DELAY = float(os.getenv("WEBHOOK_MAX_DELAY", "60"))
+
+
+# Path of the webhook endpoint, other paths are answered with a 404
+WEBHOOK_PATH = "/plex"
+
+# Names of the watchlist events sent by Plex
+WATCHLIST_ADD_EVENTS = ("library.watchlist.add", "media.watchlist", "watchlist.add")
+WATCHLIST_REMOVE_EVENTS = ("library.watchlist.remove", "media.unwatchlist", "watchlist.remove")
+
+
+class WebhookEvent:
+    """Kinds of the Plex webhook events that trigger a sync."""
+
+    RATE = "rate"
+    SCROBBLE = "scrobble"
+    WATCHLIST_ADD = "watchlist_add"
+    WATCHLIST_REMOVE = "watchlist_remove"
+
+
+def get_event_kind(event_name):
+    """
+    Maps a Plex webhook event name to the kind of sync it triggers.
+
+    Plex does not document names for the watchlist events, only those of WATCHLIST_ADD_EVENTS and
+    WATCHLIST_REMOVE_EVENTS are accepted. Any other event is ignored.
+
+    Returns:
+        str: One of the WebhookEvent kinds, or None if the event is not synced.
+    """
+    event_name = (event_name or "").lower()
+    if event_name == "media.rate":
+        return WebhookEvent.RATE
+    if event_name == "media.scrobble":
+        return WebhookEvent.SCROBBLE
+    if event_name in WATCHLIST_ADD_EVENTS:
+        return WebhookEvent.WATCHLIST_ADD
+    if event_name in WATCHLIST_REMOVE_EVENTS:
+        return WebhookEvent.WATCHLIST_REMOVE
+    return None
+
+
+def parse_plex_payload(content_type, body):
+    """
+    Extracts the JSON payload of a Plex webhook request.
+
+    Plex posts multipart/form-data with the JSON in the "payload" field (and sometimes a "thumb" image).
+    A plain JSON body is accepted too, which makes it easy to replay a recorded payload with curl.
+
+    Raises:
+        ValueError: If the request holds no readable payload.
+    """
+    content_type = content_type or ""
+    if content_type.startswith("multipart/"):
+        message = BytesParser(policy=policy.HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body)
+        if not message.is_multipart():
+            raise ValueError("Malformed multipart body")
+
+        for part in message.iter_parts():
+            if part.get_param("name", header="content-disposition") == "payload":
+                payload = json.loads(part.get_payload(decode=True))
+                break
+        else:
+            raise ValueError("No payload field in the multipart body")
+    else:
+        payload = json.loads(body)
+
+    if not isinstance(payload, dict):
+        raise ValueError("The payload is not a JSON object")
+    return payload
+
+
+def is_loopback_host(host):
+    """Whether `host` ('127.0.0.1', '::1', 'localhost'...) only accepts connections from this machine."""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class PlexWebhookReceiver:
+    """
+    Local HTTP endpoint turning Plex webhooks into targeted syncs.
+
+    Events of other accounts and of unsynced kinds are dropped. The others are coalesced by item and kind
+    (an item rated three times in a row is only synced with its last rating) and handed to `handler` as one
+    batch once no event arrived for `debounce` seconds, or once the oldest one waited `max_delay` seconds.
+    `handler` is an async function taking the list of events, each a dict with "kind", "event" and "metadata".
+    """
+
+    def __init__(self, handler, account=PLEX_USERNAME, debounce=WEBHOOK_DEBOUNCE, max_delay=WEBHOOK_MAX_DELAY,
+                 token=WEBHOOK_TOKEN, run_lock=None):
+        self.handler = handler
+        self.account = account
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.token = token
+        self.run_lock = run_lock or asyncio.Lock()
+        self.loop = None
+        self.server = None
+        self.stopping = None
+
+        self.pending = {}  # (item, kind) -> event
+        self.first_event_at = None
+        self.last_event_at = None
+        self.flushing = None
+
+    def submit(self, payload):
+        """
+        Queues the event of a webhook payload.
+
+        Returns:
+            bool: Whether the event will be synced.
+        """
+        kind = get_event_kind(payload.get("event"))
+        metadata = payload.get("Metadata") or {}
+        account = (payload.get("Account") or {}).get("title")
+        if kind is None or not metadata:
+            return False
+        if self.account and account and account.lower() != self.account.lower():
+            return False
+
+        # Consecutive watchlist additions and removals of an item share a key, so the last one wins
+        item = metadata.get("guid") or metadata.get("ratingKey")
+        group = "watchlist" if kind in (WebhookEvent.WATCHLIST_ADD, WebhookEvent.WATCHLIST_REMOVE) else kind
+        self.pending[(item, group)] = {"kind": kind, "event": payload.get("event"), "metadata": metadata}
+
+        now = time.monotonic()
+        self.last_event_at = now
+        if self.first_event_at is None:
+            self.first_event_at = now
+        if self.flushing is None or self.flushing.done():
+            self.flushing = asyncio.ensure_future(self._flush_when_quiet())
+        return True
+
+    async def _flush_when_quiet(self):
+        stopping = self.stopping or asyncio.Event()
+        while self.pending:
+            deadline = min(self.last_event_at + self.debounce, self.first_event_at + self.max_delay)
+            delay = deadline - time.monotonic()
+            if delay > 0 and not stopping.is_set():
+                try:
+                    await asyncio.wait_for(stopping.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.flush()
+
+    async def flush(self):
+        """Syncs the pending events now."""
+        events = list(self.pending.values())
+        self.pending = {}
+        self.first_event_at = None
+        if not events:
+            return
+
+        print(f"Syncing {len(events)} Plex webhook event(s)...")
+        async with self.run_lock:
+            try:
+                await self.handler(events)
+            except Exception as e:
+                print(f"Error syncing Plex webhook events: {e!r}")
+
+    def start_server(self, host=WEBHOOK_HOST, port=WEBHOOK_PORT):
+        """
+        Serves the webhook endpoint from a background thread. Must be called from the event loop.
+
+        Raises:
+            ValueError: If `host` is not a loopback address and no token is configured.
+        """
+        if self.server:
+            return self.server
+        if not self.token and not is_loopback_host(host):
+            raise ValueError(f"Refusing to listen to Plex webhooks on {host} without a token, set WEBHOOK_TOKEN.")
+
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        receiver = self
+        self.loop = asyncio.get_running_loop()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if urlparse(self.path).path.rstrip("/") != WEBHOOK_PATH:
+                    self.send_error(404)
+                    return
+                if receiver.token and parse_qs(urlparse(self.path).query).get("token", [None])[0] != receiver.token:
+                    self.send_error(403)
+                    return
+
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                try:
+                    payload = parse_plex_payload(self.headers.get("Content-Type"), body)
+                except ValueError as e:
+                    self.send_error(400, str(e))
+                    return
+
+                # Answer right away, Plex does not wait for the sync
+                receiver.loop.call_soon_threadsafe(receiver.submit, payload)
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, int(port)), Handler)
+        threading.Thread(target=self.server.serve_forever, name="plex-webhook-server", daemon=True).start()
+        print(f"Listening to Plex webhooks on http://{host}:{self.server.server_address[1]}{WEBHOOK_PATH}")
+        return self.server
+
+    def stop(self):
+        """Stops receiving webhooks. Pending events are synced before `run_forever()` returns."""
+        if self.stopping and not self.stopping.is_set():
+            self.stopping.set()
+
+    async def run_forever(self, host=WEBHOOK_HOST, port=WEBHOOK_PORT):
+        """Receives webhooks until `stop()` is called, then syncs what is pending."""
+        self.stopping = asyncio.Event()
+        self.start_server(host, port)
+        try:
+            await self.stopping.wait()
+        finally:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+            # The events waiting for the end of a burst are synced right away
+            if self.flushing:
+                await self.flushing
+            print("Plex webhook receiver stopped.")
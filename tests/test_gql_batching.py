@@ -0,0 +1,118 @@
+import os
+import json
+import asyncio
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+import httpx
+from utils.rate_limiter import RateLimiter
+from senscritique.senscritique_gql_client import GraphQLRequestFailed, SensCritiqueGqlClient
+
+URL = "https://apollo.example.test/"
+
+
+class FakeApollo:
+    """Fake transport of the GraphQL endpoint: answers each operation with its variables, records every POST body."""
+
+    def __init__(self):
+        self.bodies = []
+        self.batch_answer = None  # (status code, text) answered to the batches instead of their responses
+
+    def handle(self, request):
+        body = json.loads(request.content)
+        self.bodies.append(body)
+        if isinstance(body, list):
+            if self.batch_answer:
+                return httpx.Response(self.batch_answer[0], text=self.batch_answer[1])
+            return httpx.Response(200, json=[{"data": operation["variables"]} for operation in body])
+        return httpx.Response(200, json={"data": body["variables"]})
+
+
+class GraphQLBatchingTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        # A saved session, so that no sign-in is attempted
+        session_path = os.path.join(directory.name, "sc_session.json")
+        with open(session_path, "w") as f:
+            expiration = (datetime.now(timezone.utc) + timedelta(days=30)).isoformat()
+            json.dump({"email": "user@example.test", "cookieRef": "cookie", "dateExpiration": expiration}, f)
+
+        patcher = mock.patch("senscritique.senscritique_gql_client.get_rate_limiter",
+                             return_value=RateLimiter(initial_rate=1000, max_rate=1000))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.apollo = FakeApollo()
+        self.client = SensCritiqueGqlClient(URL, "user@example.test", "password", max_batch_size=3, session_path=session_path)
+        self.client.http_client = httpx.AsyncClient(transport=httpx.MockTransport(self.apollo.handle))
+        self.client.http_client_loop = asyncio.get_running_loop()
+        self.client.auth_lock = asyncio.Lock()
+        self.addAsyncCleanup(self.client.aclose)
+
+    async def request_all(self, count):
+        return await asyncio.gather(*(self.client.request("query Q { q }", {"i": i}) for i in range(count)),
+                                    return_exceptions=True)
+
+    async def test_requests_of_a_tick_are_batched(self):
+        responses = await self.request_all(3)
+
+        self.assertEqual(responses, [{"data": {"i": i}} for i in range(3)])
+        self.assertEqual(len(self.apollo.bodies), 1)
+        self.assertEqual([operation["variables"] for operation in self.apollo.bodies[0]], [{"i": 0}, {"i": 1}, {"i": 2}])
+        self.assertEqual(self.client.batch_tasks, set())
+
+    async def test_batches_are_split_by_max_batch_size(self):
+        responses = await self.request_all(5)
+
+        self.assertEqual(responses, [{"data": {"i": i}} for i in range(5)])
+        self.assertEqual([len(body) if isinstance(body, list) else 1 for body in self.apollo.bodies], [3, 2])
+
+    async def test_single_requests_are_sent_as_objects(self):
+        self.assertEqual(await self.client.request("query Q { q }", {"i": 0}), {"data": {"i": 0}})
+        self.assertEqual(self.apollo.bodies, [{"query": "query Q { q }", "variables": {"i": 0}}])
+
+    async def test_a_rejected_batch_falls_back_for_that_batch_only(self):
+        self.apollo.batch_answer = (400, '{"errors": [{"message": "Variable \\"$i\\" got invalid value"}]}')
+        responses = await self.request_all(2)
+
+        self.assertEqual(responses, [{"data": {"i": 0}}, {"data": {"i": 1}}])
+        self.assertEqual([isinstance(body, list) for body in self.apollo.bodies], [True, False, False])
+        self.assertTrue(self.client.batching)
+
+        self.apollo.batch_answer = None
+        await self.request_all(2)
+        self.assertIsInstance(self.apollo.bodies[-1], list)
+
+    async def test_servers_refusing_batches_turn_batching_off(self):
+        self.apollo.batch_answer = (400, "Operation batching disabled.")
+        responses = await self.request_all(2)
+
+        self.assertEqual(responses, [{"data": {"i": 0}}, {"data": {"i": 1}}])
+        self.assertFalse(self.client.batching)
+
+        await self.request_all(2)
+        self.assertEqual([isinstance(body, list) for body in self.apollo.bodies], [True, False, False, False, False])
+
+    async def test_servers_answering_a_single_response_turn_batching_off(self):
+        self.apollo.batch_answer = (200, '{"data": null}')
+        responses = await self.request_all(2)
+
+        self.assertEqual(responses, [{"data": {"i": 0}}, {"data": {"i": 1}}])
+        self.assertFalse(self.client.batching)
+
+    async def test_failed_batches_fail_each_request(self):
+        self.apollo.batch_answer = (500, "Internal error")
+        responses = await self.request_all(2)
+
+        for response in responses:
+            self.assertIsInstance(response, GraphQLRequestFailed)
+            self.assertEqual(response.status_code, 500)
+        self.assertTrue(self.client.batching)
+        self.assertEqual(len(self.apollo.bodies), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import os
+import tempfile
+import unittest
+from utils.media_cache import MediaCache, make_media_key, normalize_title
+
+
+class NormalizeTitleTest(unittest.TestCase):
+    def test_latin_titles_lose_accents_case_and_punctuation(self):
+        self.assertEqual(normalize_title("Amélie"), "amelie")
+        self.assertEqual(normalize_title("Spider-Man: No Way Home"), "spider man no way home")
+
+    def test_cjk_and_cyrillic_titles_keep_their_letters(self):
+        self.assertEqual(normalize_title("千と千尋の神隠し"), "千と千尋の神隠し")
+        self.assertEqual(normalize_title("Брат"), "брат")
+        self.assertEqual(normalize_title("БРАТ 2"), "брат 2")
+        self.assertNotEqual(normalize_title("バス"), normalize_title("パス"))
+
+    def test_non_empty_titles_never_normalize_to_empty(self):
+        for title in ("千と千尋の神隠し", "Брат", "!!!", "..."):
+            self.assertNotEqual(normalize_title(title), "")
+
+    def test_non_latin_titles_get_distinct_cache_keys(self):
+        self.assertNotEqual(make_media_key("千と千尋の神隠し", 2001, "movie"), make_media_key("Брат", 2001, "movie"))
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = MediaCache(os.path.join(directory, "media_cache.db"))
+            cache.set(MediaCache.SENSCRITIQUE, "千と千尋の神隠し", 2001, "movie", {"id": 1})
+            self.assertIsNone(cache.get(MediaCache.SENSCRITIQUE, "Брат", 2001, "movie"))
+            self.assertEqual(cache.get(MediaCache.SENSCRITIQUE, "千と千尋の神隠し", 2001, "movie"), {"id": 1})
+            cache.connection.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import asyncio
+import unittest
+from unittest import mock
+from sync.mutation_queue import MutationQueue
+from sync.sync_state import SyncStateStore
+
+
+class RejectedWrite(Exception):
+    permanent = True
+
+
+class FakeSensCritiqueClient:
+    """Records the writes it receives; `failures` maps a media id to the errors raised by its next writes."""
+
+    def __init__(self, failures=None):
+        self.failures = failures or {}
+        self.calls = []
+
+    def _write(self, call, media_id):
+        self.calls.append(call)
+        errors = self.failures.get(media_id)
+        if errors:
+            raise errors.pop(0)
+        return True
+
+    async def add_media_to_wishlist(self, media_id, raise_errors=False):
+        return self._write(("wish", media_id), media_id)
+
+    async def remove_media_from_wishlist(self, media_id, raise_errors=False):
+        return self._write(("unwish", media_id), media_id)
+
+    async def rate_media_with_id(self, media_id, rating):
+        return self._write(("rate", media_id, rating), media_id)
+
+    async def mark_media_as_done(self, media_id, raise_errors=False):
+        return self._write(("done", media_id), media_id)
+
+
+class MutationQueueTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.sync_state = SyncStateStore(path=":memory:", json_path=None)
+        self.sc_client = FakeSensCritiqueClient()
+        self.sleep = mock.AsyncMock()
+        patcher = mock.patch.object(asyncio, "sleep", self.sleep)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.sync_state.connection.close)
+
+    def make_queue(self, **kwargs):
+        kwargs.setdefault("max_attempts", 3)
+        kwargs.setdefault("base_delay", 1)
+        kwargs.setdefault("concurrency", 1)
+        return MutationQueue(self.sc_client, None, self.sync_state, **kwargs)
+
+    async def test_identical_writes_collapse_to_the_last_one(self):
+        queue = self.make_queue()
+        queue.rate_on_sc(1, 6)
+        queue.rate_on_sc(1, 8)
+        queue.wish_on_sc(2)
+        queue.unwish_on_sc(2)
+
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(await queue.flush(), (2, 0))
+        self.assertEqual(self.sc_client.calls, [("rate", 1, 8), ("unwish", 2)])
+
+    async def test_transient_failures_are_retried_with_exponential_backoff(self):
+        self.sc_client.failures[1] = [RuntimeError("500"), RuntimeError("500")]
+        queue = self.make_queue(max_attempts=4)
+        queue.rate_on_sc(1, 7)
+
+        with mock.patch("sync.mutation_queue.random.uniform", return_value=1.0):
+            self.assertEqual(await queue.flush(), (1, 0))
+
+        self.assertEqual(len(self.sc_client.calls), 3)
+        self.assertEqual([call.args[0] for call in self.sleep.await_args_list], [1, 2])
+        self.assertEqual(self.sync_state.dead_letters(), [])
+
+    async def test_writes_failing_every_attempt_become_dead_letters(self):
+        self.sc_client.failures[1] = [RuntimeError("500")] * 3
+        queue = self.make_queue()
+        queue.rate_on_sc(1, 7)
+
+        self.assertEqual(await queue.flush(), (0, 1))
+
+        dead_letters = self.sync_state.dead_letters()
+        self.assertEqual(len(dead_letters), 1)
+        self.assertEqual(dead_letters[0]["payload"], {"media_id": 1, "rating": 7})
+        self.assertEqual((dead_letters[0]["attempts"], dead_letters[0]["runs"]), (3, 1))
+
+    async def test_dead_letters_are_parked_after_max_runs(self):
+        queue = self.make_queue(max_attempts=1, max_runs=2)
+        self.sc_client.failures[1] = [RuntimeError("500")] * 2
+
+        queue.rate_on_sc(1, 7)
+        await queue.flush()
+        self.assertEqual(queue.retry_dead_letters(), 1)
+        await queue.flush()
+
+        self.assertEqual(self.sync_state.dead_letters(), [])
+        self.assertEqual(self.sync_state.dead_letters(parked=True)[0]["runs"], 2)
+        self.assertEqual(queue.retry_dead_letters(), 0)
+
+    async def test_permanent_errors_are_parked_without_retrying(self):
+        self.sc_client.failures[1] = [RejectedWrite("Product not found")]
+        queue = self.make_queue()
+        queue.mark_done_on_sc(1)
+
+        self.assertEqual(await queue.flush(), (0, 1))
+
+        self.assertEqual(len(self.sc_client.calls), 1)
+        self.sleep.assert_not_awaited()
+        self.assertEqual(self.sync_state.dead_letters(), [])
+        self.assertEqual(len(self.sync_state.dead_letters(parked=True)), 1)
+
+    async def test_dead_letters_are_retried_oldest_first_and_newer_writes_win(self):
+        for media_id in (3, 1, 2):
+            self.sync_state.add_dead_letter(MutationQueue.SC_RATE, media_id, {"media_id": media_id, "rating": 5}, 3, "500")
+
+        queue = self.make_queue()
+        queue.rate_on_sc(1, 9)
+        self.assertEqual(queue.retry_dead_letters(), 3)
+        await queue.flush()
+
+        self.assertEqual(self.sc_client.calls, [("rate", 1, 9), ("rate", 3, 5), ("rate", 2, 5)])
+        self.assertEqual(self.sync_state.dead_letters(), [])
+
+    async def test_successful_writes_confirm_the_sync_state(self):
+        self.sync_state.add("plex://movie/1", 1, "Movie", 2000, "movie", "pending")
+        self.sync_state.add("plex://movie/2", 2, "Movie", 2001, "movie", "removing")
+        queue = self.make_queue()
+        queue.wish_on_sc(1)
+        queue.unwish_on_sc(2)
+        queue.mark_done_on_sc(3, "2025-01-01T00:00:00+00:00")
+        queue.rate_on_sc(4, 7)
+
+        await queue.flush()
+
+        self.assertEqual(self.sync_state.find(sc_id=1)["status"], "synced")
+        self.assertIsNone(self.sync_state.find(sc_id=2))
+        self.assertEqual(self.sync_state.done_marks(), {"3": "2025-01-01T00:00:00+00:00"})
+        self.assertEqual(self.sync_state.get_sc_rating(4), 7)
+
+    async def test_failed_wishes_stay_pending(self):
+        self.sync_state.add("plex://movie/1", 1, "Movie", 2000, "movie", "pending")
+        self.sc_client.failures[1] = [RuntimeError("500")] * 3
+        queue = self.make_queue()
+        queue.wish_on_sc(1)
+
+        await queue.flush()
+
+        self.assertEqual(self.sync_state.find(sc_id=1)["status"], "pending")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import unittest
+from email.utils import format_datetime
+from datetime import datetime, timezone
+from unittest import mock
+import requests
+from requests.adapters import HTTPAdapter
+from utils.rate_limiter import RateLimitedAdapter, RateLimiter, TokenBucket, parse_retry_after
+
+
+class FakeClock:
+    """Stands in for the `time` module of utils.rate_limiter: time only moves on `sleep()` or `advance()`."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class ClockTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch("utils.rate_limiter.time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TokenBucketTest(ClockTestCase):
+    def test_bursts_up_to_capacity_then_spaces_requests(self):
+        bucket = TokenBucket(rate=2)
+
+        self.assertEqual([bucket.reserve() for _ in range(4)], [0.0, 0.0, 0.5, 1.0])
+
+    def test_tokens_refill_over_time(self):
+        bucket = TokenBucket(rate=2)
+        bucket.reserve()
+        bucket.reserve()
+
+        self.clock.advance(0.5)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 0.5)
+
+    def test_blocked_buckets_wait_until_unblocked(self):
+        bucket = TokenBucket(rate=10)
+        bucket.blocked_until = self.clock.now + 3
+
+        self.assertEqual(bucket.reserve(), 3)
+
+
+class RateLimiterTest(ClockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rate_limiter = RateLimiter(initial_rate=4, max_rate=4.1, min_rate=1)
+
+    def test_successes_raise_the_rate_up_to_the_maximum(self):
+        self.assertIsNone(self.rate_limiter.on_response("host", 200))
+        self.assertAlmostEqual(self.rate_limiter.current_rate("host"), 4.05)
+
+        self.rate_limiter.on_response("host", 204)
+        self.rate_limiter.on_response("host", 200)
+        self.assertAlmostEqual(self.rate_limiter.current_rate("host"), 4.1)
+
+    def test_errors_leave_the_rate_unchanged(self):
+        for status_code in (401, 404, 500):
+            self.assertIsNone(self.rate_limiter.on_response("host", status_code))
+        self.assertEqual(self.rate_limiter.current_rate("host"), 4)
+
+    def test_throttling_halves_the_rate_down_to_the_minimum(self):
+        self.assertEqual(self.rate_limiter.on_response("host", 429), 2)
+        self.assertEqual(self.rate_limiter.current_rate("host"), 2)
+        self.assertEqual(self.rate_limiter.on_response("host", 503), 4)
+        self.assertEqual(self.rate_limiter.on_response("host", 429), 8)
+        self.assertEqual(self.rate_limiter.current_rate("host"), 1)
+        self.assertEqual(self.rate_limiter.current_rate("other-host"), 4)
+
+    def test_retry_after_pauses_the_host(self):
+        self.assertEqual(self.rate_limiter.on_response("host", 429, {"Retry-After": "7"}), 7)
+
+        self.rate_limiter.acquire("host")
+        self.assertEqual(self.clock.sleeps, [7])
+
+    def test_acquire_only_waits_once_the_burst_is_spent(self):
+        for _ in range(6):
+            self.rate_limiter.acquire("host")
+
+        self.assertEqual(self.clock.sleeps, [0.25, 0.25])
+
+
+class ParseRetryAfterTest(ClockTestCase):
+    def test_seconds_and_dates(self):
+        self.assertEqual(parse_retry_after("12"), 12)
+        self.assertEqual(parse_retry_after("-3"), 0)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+
+        self.clock.now = datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp()
+        self.assertEqual(parse_retry_after(format_datetime(datetime(2025, 1, 1, 0, 0, 30, tzinfo=timezone.utc), usegmt=True)), 30)
+
+
+class RateLimitedAdapterTest(ClockTestCase):
+    def make_response(self, status_code, headers=None):
+        response = requests.Response()
+        response.status_code = status_code
+        response.headers.update(headers or {})
+        response._content = b""
+        return response
+
+    def send(self, adapter, responses):
+        request = requests.Request("GET", "https://plex.example.test/library").prepare()
+        with mock.patch.object(HTTPAdapter, "send", side_effect=responses) as send:
+            return adapter.send(request), send.call_count
+
+    def test_throttled_requests_are_retried_after_retry_after(self):
+        rate_limiter = RateLimiter(initial_rate=10)
+        adapter = RateLimitedAdapter(rate_limiter, max_throttle_retries=2)
+
+        response, calls = self.send(adapter, [self.make_response(429, {"Retry-After": "5"}), self.make_response(200)])
+
+        self.assertEqual((response.status_code, calls), (200, 2))
+        self.assertEqual(self.clock.sleeps, [5])
+        self.assertEqual(rate_limiter.current_rate("plex.example.test"), 5.05)
+
+    def test_retries_are_bounded(self):
+        adapter = RateLimitedAdapter(RateLimiter(initial_rate=10), max_throttle_retries=1)
+
+        response, calls = self.send(adapter, [self.make_response(503), self.make_response(503)])
+
+        self.assertEqual((response.status_code, calls), (503, 2))
+
+    def test_unthrottled_adapters_leave_the_rate_limiter_alone(self):
+        rate_limiter = RateLimiter(initial_rate=10)
+        adapter = RateLimitedAdapter(rate_limiter, throttle=False)
+
+        response, calls = self.send(adapter, [self.make_response(429)])
+
+        self.assertEqual((response.status_code, calls), (429, 1))
+        self.assertEqual(rate_limiter.rates(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
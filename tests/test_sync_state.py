@@ -0,0 +1,62 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from sync.sync_state import SyncStateStore
+
+
+class SyncStateStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.sync_state = SyncStateStore(path=":memory:", json_path=None)
+        self.addCleanup(self.sync_state.connection.close)
+
+    def test_dead_letters_count_their_runs(self):
+        self.assertEqual(self.sync_state.add_dead_letter("sc_rate", 1, {"media_id": 1, "rating": 5}, 3, "500"), 1)
+        self.assertEqual(self.sync_state.add_dead_letter("sc_rate", 1, {"media_id": 1, "rating": 6}, 2, "503"), 2)
+
+        dead_letter, = self.sync_state.dead_letters()
+        self.assertEqual((dead_letter["payload"]["rating"], dead_letter["attempts"], dead_letter["last_error"]), (6, 2, "503"))
+
+    def test_parked_dead_letters_are_kept_apart(self):
+        self.sync_state.add_dead_letter("sc_rate", 1, {"media_id": 1}, 3, "500")
+        self.sync_state.add_dead_letter("sc_done", 2, {"media_id": 2}, 1, "not found", parked=True)
+        self.sync_state.park_dead_letter("sc_rate", 1)
+
+        self.assertEqual(self.sync_state.dead_letters(), [])
+        self.assertEqual([dead_letter["target"] for dead_letter in self.sync_state.dead_letters(parked=True)], ["1", "2"])
+
+        self.sync_state.remove_dead_letter("sc_rate", 1)
+        self.assertEqual(len(self.sync_state.dead_letters(parked=True)), 1)
+
+    def test_confirm_only_moves_entries_in_the_expected_status(self):
+        pending = self.sync_state.add("plex://movie/1", 1, "Movie", 2000, "movie", "pending")
+        self.sync_state.add("plex://movie/2", 2, "Movie", 2001, "movie", "synced")
+
+        self.sync_state.confirm(1, "pending", "synced")
+        self.sync_state.confirm(2, "removing")
+
+        self.assertEqual(self.sync_state.find(sc_id=1), {"id": pending, "plex_id": "plex://movie/1", "sc_id": 1, "title": "Movie",
+                                                         "year": 2000, "type": "movie", "status": "synced"})
+        self.assertEqual(self.sync_state.find(sc_id=2)["status"], "synced")
+
+    def test_dead_letters_of_older_databases_are_migrated(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sync_state.db")
+            with sqlite3.connect(path) as connection:
+                connection.execute("""
+                    CREATE TABLE dead_letters (kind TEXT NOT NULL, target TEXT NOT NULL, payload TEXT NOT NULL,
+                        attempts INTEGER NOT NULL, last_error TEXT, failed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (kind, target))
+                """)
+                connection.execute("INSERT INTO dead_letters (kind, target, payload, attempts) VALUES ('sc_rate', '1', '{}', 3)")
+            connection.close()
+
+            sync_state = SyncStateStore(path=path, json_path=None)
+            try:
+                self.assertEqual(sync_state.add_dead_letter("sc_rate", 1, {}, 3, "500"), 2)
+            finally:
+                sync_state.connection.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
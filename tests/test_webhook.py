@@ -0,0 +1,127 @@
+import json
+import asyncio
+import unittest
+import urllib.error
+import urllib.request
+from sync.webhook import PlexWebhookReceiver, WebhookEvent, get_event_kind, parse_plex_payload
+
+RATE_PAYLOAD = {
+    "event": "media.rate",
+    "rating": 8.0,
+    "Account": {"title": "plexuser"},
+    "Metadata": {"guid": "plex://movie/5d776b59ad5437001f79c6f8", "ratingKey": "42", "type": "movie", "title": "The Matrix"}
+}
+
+
+def make_multipart(payload, boundary="plexboundary"):
+    """Body of a webhook as Plex posts it: the JSON in a "payload" field, followed by a thumbnail."""
+    return (
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="payload"\r\n'
+        "Content-Type: application/json\r\n\r\n"
+        f"{json.dumps(payload)}\r\n"
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="thumb"; filename="thumb.jpg"\r\n'
+        "Content-Type: image/jpeg\r\n\r\n"
+        "\xff\xd8\xff\r\n"
+        f"--{boundary}--\r\n"
+    ).encode("latin-1"), f"multipart/form-data; boundary={boundary}"
+
+
+class ParsePlexPayloadTest(unittest.TestCase):
+    def test_multipart_payload(self):
+        body, content_type = make_multipart(RATE_PAYLOAD)
+        self.assertEqual(parse_plex_payload(content_type, body), RATE_PAYLOAD)
+
+    def test_json_payload(self):
+        self.assertEqual(parse_plex_payload("application/json", json.dumps(RATE_PAYLOAD).encode()), RATE_PAYLOAD)
+
+    def test_unreadable_payloads(self):
+        body, content_type = make_multipart(RATE_PAYLOAD)
+        with self.assertRaises(ValueError):
+            parse_plex_payload(content_type, body.replace(b'name="payload"', b'name="other"'))
+        with self.assertRaises(ValueError):
+            parse_plex_payload("application/json", b"[1, 2]")
+        with self.assertRaises(ValueError):
+            parse_plex_payload("application/json", b"not json")
+
+
+class GetEventKindTest(unittest.TestCase):
+    def test_synced_events(self):
+        self.assertEqual(get_event_kind("media.rate"), WebhookEvent.RATE)
+        self.assertEqual(get_event_kind("media.scrobble"), WebhookEvent.SCROBBLE)
+        self.assertEqual(get_event_kind("library.watchlist.add"), WebhookEvent.WATCHLIST_ADD)
+        self.assertEqual(get_event_kind("library.watchlist.remove"), WebhookEvent.WATCHLIST_REMOVE)
+
+    def test_other_events_are_dropped(self):
+        for event_name in ("media.play", "library.new", "watchlist.cleared", "admin.watchlist.export", "", None):
+            self.assertIsNone(get_event_kind(event_name))
+
+
+class PlexWebhookReceiverTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.batches = []
+
+        async def handler(events):
+            self.batches.append(events)
+
+        self.receiver = PlexWebhookReceiver(handler, account="plexuser", debounce=0.05, max_delay=1, token=None)
+
+    def event(self, event_name, guid="plex://movie/1", **details):
+        return {"event": event_name, "Account": {"title": "plexuser"}, "Metadata": {"guid": guid, **details}}
+
+    async def test_events_of_an_item_are_coalesced(self):
+        self.assertTrue(self.receiver.submit(self.event("media.rate", userRating=6)))
+        self.assertTrue(self.receiver.submit(self.event("media.rate", userRating=8)))
+        self.assertTrue(self.receiver.submit(self.event("library.watchlist.add")))
+        self.assertTrue(self.receiver.submit(self.event("library.watchlist.remove")))
+        self.assertTrue(self.receiver.submit(self.event("media.rate", guid="plex://movie/2", userRating=4)))
+
+        await self.receiver.flushing
+
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual(
+            [(event["kind"], event["metadata"]["guid"], event["metadata"].get("userRating")) for event in self.batches[0]],
+            [(WebhookEvent.RATE, "plex://movie/1", 8), (WebhookEvent.WATCHLIST_REMOVE, "plex://movie/1", None),
+             (WebhookEvent.RATE, "plex://movie/2", 4)]
+        )
+
+    async def test_unsynced_events_are_dropped(self):
+        self.assertFalse(self.receiver.submit(self.event("media.play")))
+        self.assertFalse(self.receiver.submit({**self.event("media.rate"), "Account": {"title": "someone else"}}))
+        self.assertFalse(self.receiver.submit({"event": "media.rate", "Account": {"title": "plexuser"}}))
+        self.assertEqual(self.receiver.pending, {})
+        self.assertIsNone(self.receiver.flushing)
+
+    async def test_endpoint(self):
+        self.receiver.token = "secret"
+        server = self.receiver.start_server("127.0.0.1", 0)
+        self.addAsyncCleanup(asyncio.to_thread, server.shutdown)
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+
+        def post(path):
+            request = urllib.request.Request(url + path, data=json.dumps(RATE_PAYLOAD).encode(),
+                                             headers={"Content-Type": "application/json"})
+            try:
+                with urllib.request.urlopen(request) as response:
+                    return response.status
+            except urllib.error.HTTPError as e:
+                return e.code
+
+        self.assertEqual(await asyncio.to_thread(post, "/other?token=secret"), 404)
+        self.assertEqual(await asyncio.to_thread(post, "/plex?token=wrong"), 403)
+        self.assertEqual(await asyncio.to_thread(post, "/plex?token=secret"), 200)
+
+        while self.receiver.flushing is None:
+            await asyncio.sleep(0.01)
+        await self.receiver.flushing
+        self.assertEqual([event["metadata"]["ratingKey"] for batch in self.batches for event in batch], ["42"])
+        server.server_close()
+
+    async def test_public_hosts_require_a_token(self):
+        with self.assertRaises(ValueError):
+            self.receiver.start_server("0.0.0.0", 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
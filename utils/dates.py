@@ -0,0 +1,30 @@
+from datetime import datetime, timezone
+
+
+def parse_iso_datetime(value):
+    """
+    Parse an ISO 8601 date returned by Plex or SensCritique ('2024-12-15T20:37:46.000Z', '2024-12-15'...).
+
+    Returns:
+        datetime: A timezone-aware (UTC when unspecified) datetime, or None if the value can't be parsed.
+    """
+    if not value:
+        return None
+
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def is_older_than(value, since):
+    """True when `value` is a parseable date strictly older than `since` (unparseable dates are never older)."""
+    parsed = parse_iso_datetime(value)
+    return parsed is not None and since is not None and parsed < parse_iso_datetime(since)
@@ -0,0 +1,219 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+import unicodedata
+from dotenv import load_dotenv
+from utils.metrics import get_metrics
+
+# Load environment variables
+load_dotenv()
+
+MEDIA_CACHE_PATH = os.getenv("MEDIA_CACHE_PATH", "media_cache.db")
+MEDIA_CACHE_TTL = int(os.getenv("MEDIA_CACHE_TTL", str(30 * 24 * 3600)))  # 30 days
+
+# SensCritique universe ids, which are also used to normalize Plex text types
+UNIVERSE_IDS = {
+    "movie": 1,
+    "show": 4,
+    "tvshow": 4,
+    "season": 5,
+    "episode": 32
+}
+
+
+def normalize_title(title):
+    """
+    Casefold a title, strip its accents and punctuation so 'Amélie' and 'amelie' share the same key.
+
+    Letters and digits of every script are kept ('千と千尋の神隠し', 'Брат'), and a title made only of
+    punctuation keeps its casefolded self, so a non-empty title never normalizes to "".
+    """
+    if not title:
+        return ""
+
+    title = unicodedata.normalize("NFKD", str(title))
+    # Kana voicing marks are letters of their own, not accents: 'バス' and 'パス' are different words
+    title = "".join(c for c in title if not unicodedata.combining(c) or c in "\u3099\u309a")
+    title = unicodedata.normalize("NFC", title)
+    normalized = re.sub(r"[\W_]+", " ", title.casefold()).strip()
+    return normalized or title.casefold().strip()
+
+
+def normalize_universe(universe):
+    """Return the SensCritique universe id for either a Plex text type ('movie', 'show'...) or a SensCritique id."""
+    if isinstance(universe, str):
+        return UNIVERSE_IDS.get(universe.lower(), universe.lower())
+    return universe
+
+
+def make_media_key(title, year, universe):
+    """Build the cache key of a media: (normalized title, year, universe)."""
+    return f"{normalize_title(title)}|{year or ''}|{normalize_universe(universe) or ''}"
+
+
+class MediaCache:
+    """
+    On-disk cache of media resolutions, shared by the Plex and SensCritique clients.
+
+    Each entry is keyed by (normalized title, year, universe) and stores, per service, what the
+    search returned (the SensCritique product or the Plex ratingKey/guid). Entries older than
+    `ttl` seconds are evicted and searched again.
+    """
+
+    SENSCRITIQUE = "senscritique"
+    PLEX = "plex"
+
+    def __init__(self, path=MEDIA_CACHE_PATH, ttl=MEDIA_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        # Clients may resolve media from worker threads
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS media_cache (
+                    key TEXT NOT NULL,
+                    service TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (key, service)
+                )
+            """)
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS localized_titles (
+                    metadata_id TEXT NOT NULL,
+                    language TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (metadata_id, language)
+                )
+            """)
+
+    def get(self, service, title, year, universe):
+        """
+        Returns the cached resolution of a media for a service.
+
+        Args:
+            service (str): MediaCache.SENSCRITIQUE or MediaCache.PLEX.
+            title (str): The title of the media.
+            year (int): The year of the media.
+            universe (str|int): Plex text type or SensCritique universe id.
+
+        Returns:
+            dict: The cached value, or None on a miss or an expired entry.
+        """
+        key = make_media_key(title, year, universe)
+
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value, updated_at FROM media_cache WHERE key = ? AND service = ?", (key, service)
+            ).fetchone()
+
+            if row and time.time() - row[1] > self.ttl:
+                with self.connection:
+                    self.connection.execute("DELETE FROM media_cache WHERE key = ? AND service = ?", (key, service))
+                row = None
+
+            if row:
+                self.hits += 1
+                get_metrics().record_cache(f"media_cache:{service}", hits=1)
+                return json.loads(row[0])
+
+            self.misses += 1
+            get_metrics().record_cache(f"media_cache:{service}", misses=1)
+            return None
+
+    def set(self, service, title, year, universe, value):
+        """Stores the resolution of a media for a service."""
+        key = make_media_key(title, year, universe)
+
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO media_cache (key, service, value, updated_at) VALUES (?, ?, ?, ?)",
+                (key, service, json.dumps(value, default=str), time.time())
+            )
+
+    def invalidate(self, title, year, universe, service=None):
+        """Removes one entry, for a single service or for all of them."""
+        key = make_media_key(title, year, universe)
+
+        with self.lock, self.connection:
+            if service:
+                self.connection.execute("DELETE FROM media_cache WHERE key = ? AND service = ?", (key, service))
+            else:
+                self.connection.execute("DELETE FROM media_cache WHERE key = ?", (key,))
+
+    def get_localized_titles(self, metadata_ids, language):
+        """
+        Returns the cached localized titles of Plex metadata items.
+
+        Args:
+            metadata_ids (list): Plex Discover metadata ids.
+            language (str): Language of the titles, e.g. 'fr'.
+
+        Returns:
+            dict: metadata id -> title, for the ids found in the cache only.
+        """
+        titles = {}
+        expiration = time.time() - self.ttl
+
+        with self.lock:
+            for metadata_id in metadata_ids:
+                row = self.connection.execute(
+                    "SELECT title FROM localized_titles WHERE metadata_id = ? AND language = ? AND updated_at >= ?",
+                    (str(metadata_id), language, expiration)
+                ).fetchone()
+
+                if row:
+                    self.hits += 1
+                    titles[metadata_id] = row[0]
+                else:
+                    self.misses += 1
+
+        get_metrics().record_cache(f"localized_titles:{language}", hits=len(titles), misses=len(metadata_ids) - len(titles))
+        return titles
+
+    def set_localized_titles(self, titles, language):
+        """Stores localized titles (metadata id -> title) in a single commit."""
+        now = time.time()
+
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO localized_titles (metadata_id, language, title, updated_at) VALUES (?, ?, ?, ?)",
+                [(str(metadata_id), language, title, now) for metadata_id, title in titles.items() if title]
+            )
+
+    def evict_expired(self):
+        """Removes every expired entry and returns how many were removed."""
+        with self.lock, self.connection:
+            expiration = time.time() - self.ttl
+            cursor = self.connection.execute("DELETE FROM media_cache WHERE updated_at < ?", (expiration,))
+            removed = cursor.rowcount
+            cursor = self.connection.execute("DELETE FROM localized_titles WHERE updated_at < ?", (expiration,))
+            return removed + cursor.rowcount
+
+    def stats(self):
+        """Returns the hit/miss counters of this process."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+
+_media_cache = None
+
+
+def get_media_cache():
+    """Returns the media cache shared by every client of the process."""
+    global _media_cache
+    if _media_cache is None:
+        _media_cache = MediaCache()
+    return _media_cache
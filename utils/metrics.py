@@ -0,0 +1,319 @@
+import os
+import re
+import json
+import time
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Directory receiving the JSON and Prometheus report of each sync phase (empty to disable the files)
+METRICS_DIR = os.getenv("METRICS_DIR", "metrics")
+# Port of the /metrics endpoint exposing the metrics continuously (unset to disable it)
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class OperationStats:
+    """Latency histogram and counters of one (service, operation) pair."""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # The last one counts what is above every bound
+
+    def observe(self, seconds, error, bytes_sent, bytes_received):
+        self.count += 1
+        self.errors += 1 if error else 0
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def copy(self):
+        stats = OperationStats()
+        stats.__dict__.update(self.__dict__, buckets=list(self.buckets))
+        return stats
+
+    def minus(self, other):
+        """Stats accumulated since `other` was copied from this object."""
+        stats = self.copy()
+        for name in ("count", "errors", "retries", "total_seconds", "bytes_sent", "bytes_received"):
+            setattr(stats, name, getattr(self, name) - getattr(other, name))
+        stats.buckets = [a - b for a, b in zip(self.buckets, other.buckets)]
+        return stats
+
+    def quantile(self, q):
+        """Estimates a latency quantile as the upper bound of the bucket holding it."""
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max_seconds
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "retries": self.retries,
+            "total_seconds": round(self.total_seconds, 4),
+            "mean_seconds": round(self.total_seconds / self.count, 4) if self.count else None,
+            "p50_seconds": self.quantile(0.5),
+            "p95_seconds": self.quantile(0.95),
+            "p99_seconds": self.quantile(0.99),
+            "max_seconds": round(self.max_seconds, 4),
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received
+        }
+
+
+class Metrics:
+    """
+    Process-wide registry of what the clients spend their time on.
+
+    Every outbound HTTP request and every GraphQL operation is recorded per (service, operation):
+    latency histogram, errors, retries and bytes. Caches record their hits and misses. `phase(name)` reports
+    what happened during a block (a sync phase) as JSON and Prometheus text, while the totals keep growing
+    for the optional /metrics endpoint (`start_server`).
+    """
+
+    def __init__(self, report_dir=METRICS_DIR):
+        self.report_dir = report_dir
+        self.lock = threading.Lock()
+        self.operations = {}  # (service, operation) -> OperationStats
+        self.cache_hits = {}  # cache -> [hits, misses]
+        self.server = None
+
+    def _get_stats(self, service, operation):
+        key = (service, operation)
+        if key not in self.operations:
+            self.operations[key] = OperationStats()
+        return self.operations[key]
+
+    def observe(self, service, operation, seconds, error=False, bytes_sent=0, bytes_received=0):
+        """Records one call of `operation` on `service` that took `seconds`."""
+        with self.lock:
+            self._get_stats(service, operation).observe(seconds, error, bytes_sent or 0, bytes_received or 0)
+
+    @contextmanager
+    def measure(self, service, operation):
+        """Records the duration of the block as one call of `operation` (as an error if it raises)."""
+        started_at = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(service, operation, time.perf_counter() - started_at, error)
+
+    def record_retry(self, service, operation):
+        with self.lock:
+            self._get_stats(service, operation).retries += 1
+
+    def record_cache(self, cache, hits=0, misses=0):
+        """Records lookups of `cache` answered locally (hits) or that had to go to the network (misses)."""
+        with self.lock:
+            counts = self.cache_hits.setdefault(cache, [0, 0])
+            counts[0] += hits
+            counts[1] += misses
+
+    def snapshot(self):
+        with self.lock:
+            return (
+                {key: stats.copy() for key, stats in self.operations.items()},
+                {cache: list(counts) for cache, counts in self.cache_hits.items()}
+            )
+
+    def _collect(self, since=None):
+        """Current stats, minus those of the `since` snapshot if given."""
+        operations, cache_hits = self.snapshot()
+        if since:
+            previous_operations, previous_cache_hits = since
+            operations = {
+                key: stats.minus(previous_operations[key]) if key in previous_operations else stats
+                for key, stats in operations.items()
+            }
+            cache_hits = {
+                cache: [a - b for a, b in zip(counts, previous_cache_hits.get(cache, [0, 0]))]
+                for cache, counts in cache_hits.items()
+            }
+        return operations, cache_hits
+
+    def report(self, since=None):
+        """
+        Builds the report of everything recorded, or of what was recorded after the `since` snapshot.
+
+        Returns:
+            dict: "operations" (per service, per operation stats) and "caches" (hits, misses, hit rate).
+        """
+        operations, cache_hits = self._collect(since)
+
+        report = {"operations": {}, "caches": {}}
+        for (service, operation), stats in sorted(operations.items()):
+            if stats.count or stats.retries:
+                report["operations"].setdefault(service, {})[operation] = stats.to_dict()
+        for cache, (hits, misses) in sorted(cache_hits.items()):
+            if hits or misses:
+                report["caches"][cache] = {"hits": hits, "misses": misses, "hit_rate": round(hits / (hits + misses), 3)}
+        return report
+
+    def to_prometheus(self, since=None):
+        """Renders the metrics (or those recorded after the `since` snapshot) in the Prometheus text format."""
+        operations, cache_hits = self._collect(since)
+
+        lines = [
+            "# HELP plexsync_request_duration_seconds Latency of the outbound calls per service and operation.",
+            "# TYPE plexsync_request_duration_seconds histogram"
+        ]
+        for (service, operation), stats in sorted(operations.items()):
+            labels = f'service="{_escape(service)}",operation="{_escape(operation)}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                cumulative += count
+                lines.append(f'plexsync_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'plexsync_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.count}')
+            lines.append(f"plexsync_request_duration_seconds_sum{{{labels}}} {stats.total_seconds:.6f}")
+            lines.append(f"plexsync_request_duration_seconds_count{{{labels}}} {stats.count}")
+
+        for name, attribute, description in (
+            ("plexsync_request_errors_total", "errors", "Outbound calls that failed."),
+            ("plexsync_request_retries_total", "retries", "Outbound calls retried after a throttling or a failure."),
+            ("plexsync_request_bytes_sent_total", "bytes_sent", "Bytes sent in the outbound calls."),
+            ("plexsync_request_bytes_received_total", "bytes_received", "Bytes received from the outbound calls.")
+        ):
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} counter")
+            for (service, operation), stats in sorted(operations.items()):
+                lines.append(f'{name}{{service="{_escape(service)}",operation="{_escape(operation)}"}} {getattr(stats, attribute)}')
+
+        lines.append("# HELP plexsync_cache_lookups_total Cache lookups, by result.")
+        lines.append("# TYPE plexsync_cache_lookups_total counter")
+        for cache, (hits, misses) in sorted(cache_hits.items()):
+            lines.append(f'plexsync_cache_lookups_total{{cache="{_escape(cache)}",result="hit"}} {hits}')
+            lines.append(f'plexsync_cache_lookups_total{{cache="{_escape(cache)}",result="miss"}} {misses}')
+
+        return "\n".join(lines) + "\n"
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Reports what was recorded during the block: a one-line summary is printed, and the full report is
+        written to '<report_dir>/<name>.json' and '<report_dir>/<name>.prom'.
+        """
+        since = self.snapshot()
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            report = self.report(since)
+            report["phase"] = name
+            report["wall_seconds"] = round(time.perf_counter() - started_at, 3)
+            self._print_summary(report)
+
+            if self.report_dir:
+                os.makedirs(self.report_dir, exist_ok=True)
+                with open(os.path.join(self.report_dir, f"{name}.json"), "w") as f:
+                    json.dump(report, f, indent=4)
+                with open(os.path.join(self.report_dir, f"{name}.prom"), "w") as f:
+                    f.write(self.to_prometheus(since))
+
+    def _print_summary(self, report):
+        requests = [stats for operations in report["operations"].values() for stats in operations.values()]
+        print(f"Phase '{report['phase']}' took {report['wall_seconds']}s: "
+              f"{sum(stats['count'] for stats in requests)} calls, {sum(stats['errors'] for stats in requests)} errors, "
+              f"{sum(stats['retries'] for stats in requests)} retries.")
+
+        slowest = sorted(
+            ((stats["total_seconds"], service, operation, stats) for service, operations in report["operations"].items()
+             for operation, stats in operations.items()),
+            key=lambda entry: entry[0], reverse=True
+        )
+        for total_seconds, service, operation, stats in slowest[:5]:
+            print(f"- {service} {operation}: {stats['count']} calls, {total_seconds}s total, p95 <= {stats['p95_seconds']}s")
+
+    def start_server(self, port, host="127.0.0.1"):
+        """Serves the metrics on http://<host>:<port>/metrics (Prometheus) and /metrics.json until the process exits."""
+        if self.server:
+            return self.server
+
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = metrics.to_prometheus(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, content_type = json.dumps(metrics.report()), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+
+                body = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, int(port)), Handler)
+        threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True).start()
+        print(f"Metrics available on http://{host}:{self.server.server_address[1]}/metrics")
+        return self.server
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def get_operation_name(method, url, body=None):
+    """
+    Names an HTTP call for the metrics: the GraphQL operation name when the body has one,
+    otherwise the method and the path with its ids replaced by '{id}'.
+    """
+    if body:
+        if isinstance(body, bytes):
+            body = body.decode("utf-8", "replace")
+        match = re.search(r'"operationName":\s*"(\w+)"', body) or re.search(r"\b(?:query|mutation)\s+(\w+)", body)
+        if match:
+            return match.group(1)
+
+    path = re.sub(r"/[0-9a-f]{6,}(,[0-9a-f]+)*|/\d+", "/{id}", urlparse(url).path)
+    return f"{method} {path or '/'}"
+
+
+_metrics = None
+
+
+def get_metrics():
+    """Returns the metrics registry shared by every client of the process."""
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+    return _metrics
@@ -0,0 +1,200 @@
+import os
+import time
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from utils.metrics import get_metrics, get_operation_name
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Requests per second allowed per host: starting rate and the bounds the adaptive rate moves within
+RATE_LIMIT_INITIAL = float(os.getenv("RATE_LIMIT_INITIAL", "5"))
+RATE_LIMIT_MAX = float(os.getenv("RATE_LIMIT_MAX", "20"))
+RATE_LIMIT_MIN = float(os.getenv("RATE_LIMIT_MIN", "0.2"))
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "3"))
+
+# Status codes meaning "slow down"
+THROTTLING_STATUS_CODES = (429, 503)
+
+
+class TokenBucket:
+    """Token bucket of one host. Tokens refill at `rate` per second, up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.throttled_count = 0
+
+    def reserve(self):
+        """Takes a token and returns how many seconds the caller has to wait before using it."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+        # Tokens may go negative: each waiting caller reserves its own slot in the future
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+
+class RateLimiter:
+    """
+    Per-host rate limiter shared by every outbound HTTP call of the process.
+
+    Each host gets a token bucket. The rate grows slowly while the host answers with a 2xx (additive increase)
+    and is halved on each 429/503 (multiplicative decrease); a Retry-After header pauses the host for
+    the requested time.
+    """
+
+    def __init__(self, initial_rate=RATE_LIMIT_INITIAL, max_rate=RATE_LIMIT_MAX, min_rate=RATE_LIMIT_MIN):
+        self.initial_rate = initial_rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def _get_bucket(self, host):
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.initial_rate)
+        return self.buckets[host]
+
+    def reserve(self, host):
+        """Takes a token for `host` and returns the number of seconds to wait before sending."""
+        with self.lock:
+            return self._get_bucket(host).reserve()
+
+    def acquire(self, host):
+        """Blocks the current thread until a request to `host` is allowed."""
+        wait = self.reserve(host)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, host):
+        """Waits, without blocking the event loop, until a request to `host` is allowed."""
+        wait = self.reserve(host)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_response(self, host, status_code, headers=None):
+        """
+        Adapts the rate of `host` to a response.
+
+        Returns:
+            float: Seconds to wait before retrying if the host throttled the request, None otherwise.
+        """
+        with self.lock:
+            bucket = self._get_bucket(host)
+
+            if status_code not in THROTTLING_STATUS_CODES:
+                # Errors (401, 500...) say nothing about the load the host accepts, only successes raise the rate
+                if 200 <= status_code < 300:
+                    bucket.rate = min(self.max_rate, bucket.rate + 0.05)
+                    bucket.capacity = max(1.0, bucket.rate)
+                return None
+
+            bucket.throttled_count += 1
+            bucket.rate = max(self.min_rate, bucket.rate / 2)
+            bucket.capacity = max(1.0, bucket.rate)
+            bucket.tokens = min(bucket.tokens, 0.0)
+
+            delay = parse_retry_after((headers or {}).get("Retry-After"))
+            if delay is None:
+                delay = min(60.0, 2 ** bucket.throttled_count)
+
+            bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + delay)
+            return delay
+
+    def current_rate(self, host):
+        """Returns the requests per second currently allowed for `host`."""
+        with self.lock:
+            return self._get_bucket(host).rate
+
+    def rates(self):
+        """Returns the current rate of every host seen so far."""
+        with self.lock:
+            return {host: bucket.rate for host, bucket in self.buckets.items()}
+
+
+def parse_retry_after(value):
+    """Parses a Retry-After header (seconds or HTTP date) into seconds, or None."""
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    requests adapter sending every request through the rate limiter.
+
+    Throttled requests (429/503) are retried up to `max_throttle_retries` times, after the Retry-After delay.
+    With `throttle=False`, requests are only measured (for hosts that need no limit, like a LAN server).
+    """
+
+    def __init__(self, rate_limiter=None, max_throttle_retries=RATE_LIMIT_MAX_RETRIES, throttle=True, **kwargs):
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.max_throttle_retries = max_throttle_retries
+        self.throttle = throttle
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        host = urlparse(request.url).hostname
+        metrics = get_metrics()
+        operation = get_operation_name(request.method, request.url, request.body)
+
+        for attempt in range(self.max_throttle_retries + 1):
+            if self.throttle:
+                self.rate_limiter.acquire(host)
+
+            started_at = time.perf_counter()
+            try:
+                response = super().send(request, **kwargs)
+            except Exception:
+                metrics.observe(host, operation, time.perf_counter() - started_at, error=True)
+                raise
+
+            # Streamed bodies are not read here, their size is only known from the headers
+            bytes_received = response.headers.get("Content-Length") if kwargs.get("stream") else len(response.content)
+            metrics.observe(host, operation, time.perf_counter() - started_at, error=response.status_code >= 400,
+                            bytes_sent=len(request.body or b""), bytes_received=int(bytes_received or 0))
+
+            if not self.throttle:
+                return response
+
+            delay = self.rate_limiter.on_response(host, response.status_code, response.headers)
+            if delay is None or attempt == self.max_throttle_retries:
+                return response
+
+            metrics.record_retry(host, operation)
+
+            print(f"Throttled by {host} ({response.status_code}), retrying in {delay:.1f}s "
+                  f"at {self.rate_limiter.current_rate(host):.2f} requests/s...")
+            response.close()
+
+        return response
+
+
+_rate_limiter = None
+
+
+def get_rate_limiter():
+    """Returns the rate limiter shared by every client of the process."""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter()
+    return _rate_limiter